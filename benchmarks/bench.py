@@ -0,0 +1,203 @@
+"""
+Offline benchmark for the ingest and query paths.
+
+Runs against the PDFs in data/ with the fake LLM (LLM_PROVIDER=fake) and a
+throwaway data dir, so nothing touches faiss_db/, uploads/ or the network.
+--stub-embeddings swaps MiniLM for the deterministic hash embedding, which
+makes runs reproducible on machines without the model weights.
+
+    python -m benchmarks.bench --out bench.json
+    python -m benchmarks.bench --out new.json --baseline bench.json
+
+Reports pages/s, chunks/s and embeddings/s for ingest_pdfs, p50/p95/p99 for
+retrieve_answer and for /chat under concurrent clients, and peak RSS.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+QUERIES = [
+    "What is attention?",
+    "How does multi-head attention work?",
+    "What is the transformer architecture?",
+    "Explain positional encoding",
+    "What optimizer was used for training?",
+    "What is a convolutional neural network?",
+    "What topics does the deep learning curriculum cover?",
+    "What services does the company offer?",
+    "Define hypertension",
+    "What does the abbreviation ECG stand for?",
+    "What is backpropagation?",
+    "How is dropout used for regularization?",
+    "What BLEU score was reported?",
+    "What is a recurrent neural network?",
+    "What is the capital of Bangladesh?",
+    "Summarize the document",
+]
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p95_ms": round(pct(95) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def bench_ingest(rag, paths, repeats):
+    runs = []
+    for _ in range(repeats):
+        counts = {"pages": 0, "chunks": 0, "vectors": 0}
+
+        def progress(pages=0, chunks=0, vectors=0, counts=counts):
+            counts["pages"] += pages
+            counts["chunks"] += chunks
+            counts["vectors"] += vectors
+
+        sid = rag.new_session_id()
+        start = time.perf_counter()
+        rag.ingest_pdfs(paths, sid, progress=progress)
+        elapsed = time.perf_counter() - start
+        runs.append({"seconds": elapsed, **counts})
+
+    total = sum(r["seconds"] for r in runs)
+    return {
+        "runs": len(runs),
+        "pages": runs[0]["pages"],
+        "chunks": runs[0]["chunks"],
+        "seconds_mean": round(total / len(runs), 4),
+        "pages_per_s": round(sum(r["pages"] for r in runs) / total, 2),
+        "chunks_per_s": round(sum(r["chunks"] for r in runs) / total, 2),
+        "embeddings_per_s": round(sum(r["vectors"] for r in runs) / total, 2),
+    }, sid
+
+
+def bench_retrieve(rag, dir_path, iterations, k):
+    rag.retrieve_answer(QUERIES[0], dir_path, k=k)  # load the store once
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        rag.retrieve_answer(QUERIES[i % len(QUERIES)], dir_path, k=k)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def bench_chat(app, session_id, requests_total, concurrency, k):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+
+    def one(i):
+        payload = {"query": QUERIES[i % len(QUERIES)], "session_id": session_id, "top_k": k}
+        start = time.perf_counter()
+        r = client.post("/chat", json=payload)
+        r.raise_for_status()
+        return time.perf_counter() - start
+
+    one(0)  # warm-up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests_total)))
+    wall = time.perf_counter() - start
+    return {**percentiles(samples), "concurrency": concurrency, "requests_per_s": round(requests_total / wall, 2)}
+
+
+def compare(current, baseline, prefix=""):
+    """Flatten both results and print the relative change of every shared numeric metric."""
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        base = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(value, base or {}, name + ".")
+        elif isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            change = (value - base) / base * 100
+            print(f"{name:45s} {base:>12} -> {value:>12}  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(ROOT, "data"), help="directory of PDFs to ingest")
+    parser.add_argument("--stub-embeddings", action="store_true", help="use the deterministic hash embedding")
+    parser.add_argument("--ingest-repeats", type=int, default=3)
+    parser.add_argument("--retrieve-iterations", type=int, default=200)
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    # everything below must be configured before src.api is imported
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ["RAG_DATA_DIR"] = os.path.join(workdir, "faiss_db")
+    os.environ["RAG_UPLOADS_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["LLM_PROVIDER"] = "fake"
+    # measure real work, not cache hits
+    os.environ["EMBED_CACHE_SIZE"] = "0"
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ["FILE_INDEX_MAX_FILES"] = "0"
+    if args.stub_embeddings:
+        os.environ["EMBEDDING_BACKEND"] = "hash"
+    sys.path.insert(0, ROOT)
+
+    from src.api import rag_service as rag
+    from src.api.app import app
+
+    paths = sorted(glob.glob(os.path.join(args.data, "*.pdf")))
+    if not paths:
+        parser.error(f"no PDFs found in {args.data}")
+
+    ingest, sid = bench_ingest(rag, paths, args.ingest_repeats)
+    store_dir = rag.session_dir(sid)
+    results = {
+        "env": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "embedding_backend": os.environ.get("EMBEDDING_BACKEND", "hf"),
+            "files": [os.path.basename(p) for p in paths],
+        },
+        "ingest": ingest,
+        "retrieve": bench_retrieve(rag, store_dir, args.retrieve_iterations, args.top_k),
+        "chat": bench_chat(app, sid, args.chat_requests, args.concurrency, args.top_k),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nchange vs baseline:")
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
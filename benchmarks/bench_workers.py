@@ -0,0 +1,182 @@
+"""
+Memory of N API worker processes sharing one global index.
+
+Builds a synthetic global store in a throwaway data dir, then for each worker
+count starts `uvicorn src.api.app:app --workers N` twice, with the global index
+memory-mapped (GLOBAL_INDEX_MMAP=1) and loaded onto each worker's heap
+(GLOBAL_INDEX_MMAP=0). It sends /chat requests against the global store so
+every worker touches the index, then sums RSS and PSS over all worker
+processes. RSS counts shared pages once per process. PSS splits them
+between the processes that map them, so the PSS sum is the real footprint.
+
+    python -m benchmarks.bench_workers --vectors 200000 --workers 1 2 4 --out workers.json
+
+Uses the hash embedding and the fake LLM, so each worker's own baseline
+(Python, FastAPI, LangChain) is small next to the index.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def build_global_store(data_dir, n_vectors, index_type):
+    sys.path.insert(0, ROOT)
+    from langchain_core.documents import Document
+    from src.embed import HashEmbeddings
+    from src.vectorstore import create_faiss
+
+    docs = [
+        Document(page_content=f"synthetic chunk {i} " + "lorem ipsum " * 40, metadata={"source": "synthetic.pdf", "page": i // 8})
+        for i in range(n_vectors)
+    ]
+    create_faiss(docs, HashEmbeddings(), os.path.join(data_dir, "global"), index_type)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def descendants(pid):
+    out = []
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except OSError:
+        return out
+    for child in children:
+        out.append(child)
+        out.extend(descendants(child))
+    return out
+
+
+def memory_mb(pid):
+    """(rss, pss) of one process in MiB."""
+    rss = pss = 0
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+
+def chat(port, query):
+    body = json.dumps({"query": query, "use_global": True, "top_k": 4}).encode()
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/chat", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=120) as r:
+        return json.load(r)
+
+
+def wait_listening(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def run_server(workdir, workers, mmap, requests_per_worker):
+    port = free_port()
+    env = {
+        **os.environ,
+        "RAG_DATA_DIR": os.path.join(workdir, "faiss_db"),
+        "RAG_UPLOADS_DIR": os.path.join(workdir, "uploads"),
+        "LLM_PROVIDER": "fake",
+        "EMBEDDING_BACKEND": "hash",
+        "EMBED_CACHE_SIZE": "0",
+        "ANSWER_CACHE_SIZE": "0",
+        "WARMUP": "1",
+        "WARMUP_BLOCKING": "1",  # a worker accepts requests only once its index is loaded
+        "GLOBAL_INDEX_MMAP": "1" if mmap else "0",
+        "PYTHONPATH": ROOT,
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.app:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "info"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, start_new_session=True,
+    )
+    started = threading.Semaphore(0)
+
+    def watch():
+        for line in proc.stderr:
+            if "Application startup complete" in line:
+                started.release()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        for _ in range(workers):
+            if not started.acquire(timeout=600):
+                raise RuntimeError("workers did not start in time")
+        wait_listening(port)
+        for i in range(requests_per_worker * workers):
+            chat(port, f"synthetic chunk {i}")
+        time.sleep(0.5)
+        # with --workers 1 uvicorn serves from the main process; otherwise the
+        # supervisor and multiprocessing helpers are tiny next to the workers
+        pids = [proc.pid] + descendants(proc.pid)
+        usage = [memory_mb(pid) for pid in pids]
+        return {
+            "workers": workers,
+            "mmap": mmap,
+            "processes": len(pids),
+            "total_rss_mb": round(sum(r for r, _ in usage), 1),
+            "total_pss_mb": round(sum(p for _, p in usage), 1),
+        }
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000, help="chunks in the synthetic global store")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests-per-worker", type=int, default=8)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        parser.error("needs Linux /proc (smaps_rollup) to measure PSS")
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-workers-")
+    start = time.perf_counter()
+    build_global_store(os.path.join(workdir, "faiss_db"), args.vectors, args.index_type)
+    print(f"built {args.vectors} vectors ({args.index_type}) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    results = []
+    for workers in args.workers:
+        for mmap in (True, False):
+            row = run_server(workdir, workers, mmap, args.requests_per_worker)
+            print(json.dumps(row), file=sys.stderr)
+            results.append(row)
+
+    print(f"{'workers':>7} {'mmap':>5} {'RSS MiB':>10} {'PSS MiB':>10}")
+    for row in results:
+        print(f"{row['workers']:>7} {str(row['mmap']):>5} {row['total_rss_mb']:>10} {row['total_pss_mb']:>10}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"vectors": args.vectors, "index_type": args.index_type, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Groq chat completions API, for exercising the LLM gateway.
+
+Serves POST /openai/v1/chat/completions (plain and streamed) with a configurable
+latency, and answers 429 (with Retry-After) when more than --capacity requests
+are in flight or at random with --fail-rate, like a provider rate limit. GET
+/stats reports requests served, rejected and the peak concurrency seen.
+
+    python -m benchmarks.fake_llm_server --port 8900 --latency 0.5 --capacity 4
+    LLM_PROVIDER=groq GROQ_API_BASE=http://127.0.0.1:8900 GROQ_API_KEY=fake \\
+        uvicorn src.api.app:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = "This is a canned answer from the fake LLM server."
+
+app = FastAPI(title="fake LLM")
+config = {"latency": 0.5, "jitter": 0.0, "capacity": 0, "fail_rate": 0.0, "tokens": 12, "retry_after": 1.0}
+state = {"in_flight": 0, "peak": 0, "served": 0, "rejected": 0, "prompts": {}}
+
+
+def _rejected():
+    state["rejected"] += 1
+    return JSONResponse(
+        {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+        status_code=429, headers={"retry-after": str(config["retry_after"])},
+    )
+
+
+def _chunk(cid, model, delta, finish=None):
+    return "data: " + json.dumps({
+        "id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }) + "\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    prompt = body["messages"][-1]["content"]
+    over = config["capacity"] and state["in_flight"] >= config["capacity"]
+    if over or random.random() < config["fail_rate"]:
+        return _rejected()
+    state["in_flight"] += 1
+    state["peak"] = max(state["peak"], state["in_flight"])
+    state["prompts"][prompt] = state["prompts"].get(prompt, 0) + 1
+    latency = config["latency"] + random.uniform(0, config["jitter"])
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    words = (ANSWER + " ") * max(1, config["tokens"] // len(ANSWER.split()))
+    words = words.split()[:config["tokens"]]
+
+    if not body.get("stream"):
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            state["in_flight"] -= 1
+        state["served"] += 1
+        return {
+            "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(words), "total_tokens": len(prompt) // 4 + len(words)},
+        }
+
+    async def events():
+        try:
+            yield _chunk(cid, model, {"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                await asyncio.sleep(latency / len(words))
+                yield _chunk(cid, model, {"content": word if i == 0 else " " + word})
+            yield _chunk(cid, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+            state["served"] += 1
+        finally:
+            state["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def stats():
+    prompts = state["prompts"]
+    return {
+        "served": state["served"],
+        "rejected": state["rejected"],
+        "peak_in_flight": state["peak"],
+        "distinct_prompts": len(prompts),
+        "max_calls_per_prompt": max(prompts.values(), default=0),
+    }
+
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="extra random latency, seconds")
+    parser.add_argument("--capacity", type=int, default=config["capacity"], help="429 above this many in flight (0 = unlimited)")
+    parser.add_argument("--fail-rate", type=float, default=config["fail_rate"], help="fraction of requests answered 429")
+    parser.add_argument("--tokens", type=int, default=config["tokens"], help="words per answer")
+    parser.add_argument("--retry-after", type=float, default=config["retry_after"])
+    args = parser.parse_args(argv)
+    config.update(latency=args.latency, jitter=args.jitter, capacity=args.capacity, fail_rate=args.fail_rate,
+                  tokens=args.tokens, retry_after=args.retry_after)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
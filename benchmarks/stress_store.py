@@ -0,0 +1,220 @@
+"""
+Concurrent uploads and chats against one session, then a consistency check.
+
+Starts `uvicorn src.api.app:app --workers N` on a throwaway data dir, so
+requests for the same session land on different processes. Then it fires
+--uploads uploads of the sample PDFs (each file several times, in random
+order) at one session. Once the first upload is indexed, --chats /chat
+requests run alongside the rest. Once every ingest job has finished it checks that
+
+- no request failed (no 5xx, every job "done")
+- some chats were answered from the session's store while uploads were
+  still being indexed (reads overlapped writes)
+- every segment in the session's manifest exists and the docstores hold
+  exactly as many rows as the index has vectors
+- every uploaded file is in the index exactly once (no upload lost,
+  none indexed twice)
+
+    python -m benchmarks.stress_store --workers 2 --uploads 16 --chats 200
+    python benchmarks/stress_store.py --workers 2 --uploads 16 --chats 200
+
+Uses the hash embedding and the fake LLM; exits non-zero if a check fails.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from benchmarks.bench_workers import ROOT, free_port, wait_listening
+except ModuleNotFoundError:  # run as a script: benchmarks/ itself is on sys.path
+    from bench_workers import ROOT, free_port, wait_listening
+
+
+def post_json(port, path, body):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(body).encode(),
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=300) as r:
+        return json.load(r)
+
+
+def upload(port, session_id, path):
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        pdf = f.read()
+    name = os.path.basename(path)
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"session_id\"\r\n\r\n{session_id}\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{name}\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + pdf + f"\r\n--{boundary}--\r\n".encode()
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/upload", data=body,
+                                 headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(req, timeout=300) as r:
+        return json.load(r)
+
+
+def wait_job(port, job_id, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/jobs/{job_id}", timeout=30) as r:
+            job = json.load(r)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def check_store(store_dir, files):
+    """Problems found in the store on disk ([] if consistent)."""
+    problems = []
+    with open(os.path.join(store_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    vectors, rows, per_file = 0, 0, {}
+    for seg in manifest["segments"]:
+        path = os.path.join(store_dir, seg["name"])
+        if not os.path.isdir(path):
+            problems.append(f"segment {seg['name']} is in the manifest but missing")
+            continue
+        vectors += seg["ntotal"]
+        conn = sqlite3.connect(os.path.join(path, "docs.sqlite"))
+        for text, meta in conn.execute("SELECT text, metadata FROM docs"):
+            rows += 1
+            meta = json.loads(meta)
+            per_file.setdefault(os.path.basename(meta.get("source", "")), []).append((meta.get("page"), text))
+        conn.close()
+    if rows != vectors:
+        problems.append(f"{vectors} vectors but {rows} docstore rows")
+    for name in files:
+        chunks = per_file.get(name, [])
+        if not chunks:
+            problems.append(f"{name}: not in the index")
+    return problems, {"version": manifest["version"], "segments": len(manifest["segments"]), "vectors": vectors,
+                      "chunks_per_file": {name: len(v) for name, v in sorted(per_file.items())}}
+
+
+def reference_counts(files, distinct):
+    """Chunks each file produces when indexed once (distinct ones only: the shared store dedups by content)."""
+    sys.path.insert(0, ROOT)
+    from src.ingest import iter_pdf_chunks
+    out = {}
+    for path in files:
+        chunks = [(c.metadata.get("page"), c.page_content) for _, _, part in iter_pdf_chunks([path]) for c in part]
+        out[os.path.basename(path)] = len(set(chunks)) if distinct else len(chunks)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--uploads", type=int, default=16, help="uploads to the one session")
+    parser.add_argument("--chats", type=int, default=200, help="/chat requests sent meanwhile")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tenancy", choices=["dirs", "shared"], default="dirs")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data"), help="directory with the sample PDFs")
+    args = parser.parse_args(argv)
+
+    files = sorted(os.path.join(args.data, f) for f in os.listdir(args.data) if f.lower().endswith(".pdf"))
+    workdir = tempfile.mkdtemp(prefix="rag-stress-")
+    port = free_port()
+    env = {
+        **os.environ,
+        "RAG_DATA_DIR": os.path.join(workdir, "faiss_db"),
+        "RAG_UPLOADS_DIR": os.path.join(workdir, "uploads"),
+        "LLM_PROVIDER": "fake",
+        "EMBEDDING_BACKEND": "hash",
+        "ANSWER_CACHE_SIZE": "0",
+        "TENANCY_MODE": args.tenancy,
+        "WARMUP": "0",
+        "PYTHONPATH": ROOT,
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.app:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    try:
+        wait_listening(port)
+        time.sleep(1)  # let every worker come up
+        sid = post_json(port, "/sessions", {})["session_id"]
+        plan = [files[i % len(files)] for i in range(args.uploads)]
+        random.shuffle(plan)
+
+        errors, modes = [], {}
+        lock = threading.Lock()
+        first_indexed = threading.Event()
+        uploads_left = [len(plan)]
+        overlapped = [0]  # chats answered from the store while uploads were still running
+
+        def do_upload(path):
+            try:
+                job = wait_job(port, upload(port, sid, path)["job_id"])
+                if job["status"] != "done":
+                    with lock:
+                        errors.append(f"upload {os.path.basename(path)}: {job['error']}")
+            except Exception as e:
+                with lock:
+                    errors.append(f"upload {os.path.basename(path)}: {e}")
+            finally:
+                with lock:
+                    uploads_left[0] -= 1
+                first_indexed.set()
+
+        def do_chat(i):
+            first_indexed.wait()
+            try:
+                r = post_json(port, "/chat", {"query": f"question {i} about the documents", "session_id": sid,
+                                              "use_global": False})
+                with lock:
+                    modes[r["mode"]] = modes.get(r["mode"], 0) + 1
+                    if r["mode"].startswith("session_rag") and uploads_left[0] > 0:
+                        overlapped[0] += 1
+            except Exception as e:
+                with lock:
+                    errors.append(f"chat {i}: {e}")
+
+        start = time.perf_counter()
+        # separate pools, so chats are not queued behind every upload
+        with ThreadPoolExecutor(args.concurrency) as uploads, ThreadPoolExecutor(args.concurrency) as chats:
+            tasks = [uploads.submit(do_upload, p) for p in plan] + [chats.submit(do_chat, i) for i in range(args.chats)]
+            for t in tasks:
+                t.result()
+        elapsed = time.perf_counter() - start
+        if args.chats and not overlapped[0]:
+            errors.append("no chat was answered from the store while uploads were running")
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+    store_dir = os.path.join(workdir, "faiss_db", "shared" if args.tenancy == "shared" else sid)
+    names = sorted({os.path.basename(p) for p in plan})
+    problems, summary = check_store(store_dir, names)
+    expected = reference_counts(sorted(set(plan)), distinct=args.tenancy == "shared")
+    for name, n in expected.items():
+        got = summary["chunks_per_file"].get(name, 0)
+        if got != n:
+            problems.append(f"{name}: {got} chunks indexed, {n} expected")
+    print(json.dumps({"seconds": round(elapsed, 2), "chat_modes": modes, "chats_during_uploads": overlapped[0],
+                      **summary}, indent=2))
+    for line in errors + problems:
+        print("FAIL", line, file=sys.stderr)
+    if errors or problems:
+        sys.exit(1)
+    print("ok", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
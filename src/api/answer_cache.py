@@ -0,0 +1,116 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    scope: Tuple
+    vector: np.ndarray  # unit-normalized query embedding
+    answer: str
+    sources: List[dict]
+    mode: str
+    created_at: float
+
+
+class AnswerCache:
+    """
+    Semantic cache of /chat answers.
+
+    An entry matches a new query when both share the same scope (the versions of
+    the stores searched plus top_k) and their query embeddings have cosine
+    similarity >= threshold. Entries expire after ttl seconds, the cache holds at
+    most max_entries (LRU), and invalidate_dir() drops everything that was
+    answered from a store that has since changed.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> CachedAnswer
+        self._by_scope = {}  # scope -> set of ids
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def lookup(self, scope: Tuple, vector) -> Optional[CachedAnswer]:
+        q = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            ids = [i for i in list(self._by_scope.get(scope, ())) if self._fresh(i, now)]
+            if ids:
+                sims = np.stack([self._entries[i].vector for i in ids]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]]
+            self.misses += 1
+            return None
+
+    def put(self, scope: Tuple, vector, answer: str, sources: List[dict], mode: str):
+        entry = CachedAnswer(scope, self._normalize(vector), answer, sources, mode, time.time())
+        with self._lock:
+            i = next(self._ids)
+            self._entries[i] = entry
+            self._by_scope.setdefault(scope, set()).add(i)
+            while len(self._entries) > self.max_entries:
+                old, _ = next(iter(self._entries.items()))
+                self._remove(old)
+                self.evictions += 1
+
+    def invalidate_dir(self, dir_path: str):
+        # scopes are ((dir, version), ..., top_k); drop every scope that touches dir_path
+        with self._lock:
+            for scope in [s for s in self._by_scope if any(d == dir_path for d, _ in s[:-1])]:
+                for i in list(self._by_scope[scope]):
+                    self._remove(i)
+                    self.invalidations += 1
+
+    def invalidate_session(self, session_id: str):
+        # shared-store scopes carry (fingerprint, session_id, membership version) as the version
+        with self._lock:
+            for scope in [s for s in self._by_scope
+                          if any(isinstance(v, tuple) and len(v) == 3 and v[1] == session_id for _, v in s[:-1])]:
+                for i in list(self._by_scope[scope]):
+                    self._remove(i)
+                    self.invalidations += 1
+
+    def _fresh(self, i: int, now: float) -> bool:
+        if now - self._entries[i].created_at <= self.ttl:
+            return True
+        self._remove(i)
+        return False
+
+    def _remove(self, i: int):
+        entry = self._entries.pop(i)
+        ids = self._by_scope[entry.scope]
+        ids.discard(i)
+        if not ids:
+            del self._by_scope[entry.scope]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
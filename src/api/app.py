@@ -1,14 +1,73 @@
-import os, shutil
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import time
+_IMPORT_START = time.perf_counter()
+
+import asyncio
+import os, json, shutil, threading, uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from src.api.models import SessionCreateResponse, UploadResponse, ChatRequest, ChatResponse, Source
-from src.api.deps import UPLOADS_DIR, GLOBAL_DIR, session_dir
+from src.api.models import (
+    SessionCreateResponse, UploadResponse, JobStatus, ChatRequest, ChatResponse, ContextUsage, Source,
+    ChatBatchRequest, ChatBatchResult,
+)
+from src.api.deps import (
+    UPLOADS_DIR, GLOBAL_DIR, SHARED_DIR, TENANCY_MODE, session_dir, tenants, store_cache, answer_cache, embeddings, jobs, llm_gateway, query_batcher,
+    session_manager, file_index, RESERVED_SESSION_IDS, ANSWER_CACHE_SIZE, DELETE_UPLOADS_AFTER_INGEST, CHAT_BATCH_MAX_SIZE, CHAT_BATCH_CONCURRENCY, SLOW_REQUEST_PROFILE_MS, WARMUP, WARMUP_BLOCKING,
+)
+from src.api.jobs import QueueFull
 from src.api import rag_service as rag
+from src.vectorstore import store_exists
+from src import metrics
+
+metrics.set_buckets("rag_chat_batch_size", metrics.COUNT_BUCKETS)
+
+# liveness is "the process answers"; readiness is "models and global index are loaded"
+STARTUP = {"ready": False, "import_seconds": None, "warmup_seconds": {}, "error": None}
 
-app = FastAPI(title="Project-1 RAG API", version="1.0.0")
+def _warm_up():
+    """Load the embedding model, run one encode and load the global store (timed per step)."""
+    steps = STARTUP["warmup_seconds"]
+    try:
+        for name, fn in (
+            ("embedding_model", embeddings),
+            ("warmup_encode", lambda: embeddings().embed_query("warm up")),
+            ("global_index", lambda: store_cache().get(GLOBAL_DIR)),
+        ):
+            start = time.perf_counter()
+            fn()
+            steps[name] = round(time.perf_counter() - start, 3)
+            metrics.observe("rag_startup_seconds", steps[name], phase=name)
+        STARTUP["ready"] = True
+    except Exception as e:
+        STARTUP["error"] = f"{type(e).__name__}: {e}"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not WARMUP:
+        STARTUP["ready"] = True
+    elif WARMUP_BLOCKING:
+        # don't accept traffic until warm (single-process deploys without a readiness probe)
+        _warm_up()
+    else:
+        # serve /health right away; /ready flips once warm-up finishes
+        threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+    # sessions created before the manager (or by another version) start their TTL from their mtime
+    session_manager().discover(rag.disk_sessions())
+    session_manager().start()
+    yield
+    session_manager().close()
+    jobs().shutdown(wait=False)
+    if llm_gateway.cache_info().currsize:
+        llm_gateway().close()
+    if query_batcher.cache_info().currsize:
+        query_batcher().close()
+
+app = FastAPI(title="Project-1 RAG API", version="1.0.0", lifespan=lifespan)
 
 # CORS – update for your domain(s)
 app.add_middleware(
@@ -19,17 +78,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    # per-stage spans recorded while serving this request end up in Server-Timing
+    token = metrics.begin_request()
+    start = time.perf_counter()
+    try:
+        if SLOW_REQUEST_PROFILE_MS > 0:
+            label = f"{request.method} {request.url.path}"
+            with metrics.SlowRequestSampler(label, SLOW_REQUEST_PROFILE_MS / 1000):
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+    finally:
+        spans = metrics.end_request(token)
+    elapsed = time.perf_counter() - start
+    # label by route template (not raw path) to keep cardinality bounded
+    route = request.scope.get("route")
+    metrics.observe("rag_http_request_seconds", elapsed, method=request.method, path=getattr(route, "path", "other"))
+    spans.append(("total", elapsed))
+    response.headers["Server-Timing"] = metrics.server_timing(spans)
+    return response
+
+@app.get("/metrics")
+def prometheus_metrics():
+    counters = {}
+    caches = [("store", store_cache().stats()), ("answer", answer_cache().stats())]
+    if embeddings.cache_info().currsize:  # don't load the model just to report on it
+        emb = embeddings()
+        if hasattr(emb, "stats"):
+            caches.append(("embedding", emb.stats()))
+    if file_index.cache_info().currsize:
+        caches.append(("file", file_index().stats()))
+    for cache, st in caches:
+        for key in ("hits", "misses", "evictions"):
+            counters.setdefault(f"rag_cache_{key}_total", {})[(("cache", cache),)] = st[key]
+    if llm_gateway.cache_info().currsize:
+        gw = llm_gateway().stats()
+        for key in ("calls", "coalesced", "retries", "failures"):
+            counters[f"rag_llm_{key}_total"] = {(): gw[key]}
+    if session_manager.cache_info().currsize:
+        evictions = session_manager().stats()["evictions"]
+        counters["rag_session_evictions_total"] = {(("reason", r),): n for r, n in evictions.items()}
+    return PlainTextResponse(metrics.render_prometheus(counters), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health():
-    return {"ok": True}
+    # liveness: always 200 while the process is up
+    return {"ok": True, **STARTUP}
+
+@app.get("/ready")
+def ready():
+    # readiness: 503 until warm-up is done, so load balancers hold traffic back
+    return JSONResponse(STARTUP, status_code=200 if STARTUP["ready"] else 503)
+
+@app.get("/stats")
+def stats():
+    out = {
+        "store_cache": store_cache().stats(),
+        "answer_cache": answer_cache().stats(),
+        "jobs": jobs().stats(),
+        "timings": metrics.snapshot(),
+    }
+    if llm_gateway.cache_info().currsize:
+        out["llm_gateway"] = llm_gateway().stats()
+    if query_batcher.cache_info().currsize:
+        out["query_batcher"] = query_batcher().stats()
+    if TENANCY_MODE == "shared":
+        out["tenancy"] = tenants().stats()
+    if session_manager.cache_info().currsize:
+        out["sessions"] = session_manager().stats()
+    if file_index.cache_info().currsize:
+        out["file_index"] = file_index().stats()
+    if embeddings.cache_info().currsize:  # as in /metrics: a stats probe must not load the model
+        emb = embeddings()
+        if hasattr(emb, "stats"):
+            out["embedding_cache"] = emb.stats()
+    return out
 
 @app.post("/sessions", response_model=SessionCreateResponse)
 def create_session():
     sid = rag.new_session_id()
+    session_manager().register(sid)
+    if TENANCY_MODE == "shared":
+        tenants().create(sid)  # one row; the upload creates its directory
+        return SessionCreateResponse(session_id=sid)
     os.makedirs(session_dir(sid), exist_ok=True)
     os.makedirs(os.path.join(UPLOADS_DIR, sid), exist_ok=True)
     return SessionCreateResponse(session_id=sid)
 
+def _session_id(session_id: str) -> str:
+    # "global" / "shared" are stores under DATA_DIR, not sessions a client may write or delete
+    if session_id in RESERVED_SESSION_IDS:
+        raise HTTPException(400, f"Reserved session id: {session_id}")
+    return session_id
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_files(
     files: List[UploadFile] = File(...),
@@ -41,58 +184,227 @@ async def upload_files(
     if session_id is None:
         sid = rag.new_session_id()
     else:
-        sid = session_id
+        sid = _session_id(session_id)
 
-    upload_dir = os.path.join(UPLOADS_DIR, sid)
-    os.makedirs(upload_dir, exist_ok=True)
+    sessions = session_manager()
+    # pinned until the job is queued (busy from then on): the sweep can't evict the session under this upload
+    await run_in_threadpool(sessions.pin, sid)
+    try:
+        sessions.register(sid)
+        sessions.touch(sid)
+        # a directory per upload: a concurrent upload of the same file name for this
+        # session can't overwrite a file while an earlier job is still reading it
+        upload_dir = os.path.join(UPLOADS_DIR, sid, uuid.uuid4().hex[:12])
+        os.makedirs(upload_dir, exist_ok=True)
 
-    paths = []
-    for f in files:
-        # simple extension guard
-        if not f.filename.lower().endswith(".pdf"):
-            raise HTTPException(400, f"Only PDF accepted: {f.filename}")
-        dest = os.path.join(upload_dir, f.filename)
-        with open(dest, "wb") as out:
-            out.write(await f.read())
-        paths.append(dest)
+        paths, hashes = [], {}
+        for f in files:
+            # simple extension guard
+            if not f.filename.lower().endswith(".pdf"):
+                raise HTTPException(400, f"Only PDF accepted: {f.filename}")
+            dest = os.path.join(upload_dir, os.path.basename(f.filename))
+            # copied in fixed-size blocks and hashed on the way, never held whole in memory
+            hashes[dest] = await run_in_threadpool(rag.save_stream, f.file, dest)
+            paths.append(dest)
 
-    _, added, names = rag.ingest_pdfs(paths, sid)
-    return UploadResponse(session_id=sid, files_ingested=names, chunks_added=added)
+        # ingest in the background; /chat keeps serving the last committed index meanwhile
+        names = [os.path.basename(p) for p in paths]
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    # prefer session store; optionally combine with global store
-    docs = []
+        def ingest(job):
+            result = rag.ingest_pdfs(paths, sid, progress=job.progress, hashes=hashes)
+            if DELETE_UPLOADS_AFTER_INGEST:
+                # the index keeps the text; the raw PDFs only take up disk
+                shutil.rmtree(upload_dir, ignore_errors=True)
+            return result
+
+        try:
+            job = jobs().submit(sid, names, ingest)
+        except QueueFull as e:
+            raise HTTPException(503, str(e))
+    finally:
+        sessions.unpin(sid)
+    return UploadResponse(session_id=sid, files_ingested=names, job_id=job.job_id, status=job.status)
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: str):
+    job = jobs().get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown job: {job_id}")
+    return JobStatus(**vars(job))
+
+def _targets(req: ChatRequest):
+    # session store and (optionally) global store, searched together and merged by score;
+    # scopes: shared store dir -> the session whose chunks to search there
+    dirs, scopes = [], {}
     mode = "llm_only"
 
     # session RAG
     if req.session_id:
+        session_manager().touch(req.session_id)
+    if req.session_id and TENANCY_MODE == "shared":
+        if store_exists(SHARED_DIR) and tenants().has_members(req.session_id):
+            dirs.append(SHARED_DIR)
+            scopes[SHARED_DIR] = req.session_id
+            mode = "session_rag"
+    elif req.session_id:
         sdir = session_dir(req.session_id)
-        if os.path.exists(os.path.join(sdir, "index.faiss")):
-            docs = rag.retrieve_answer(req.query, sdir, k=req.top_k)
+        if store_exists(sdir):
+            dirs.append(sdir)
             mode = "session_rag"
 
-    # if no session docs OR we also want global
-    if req.use_global and os.path.exists(os.path.join(GLOBAL_DIR, "index.faiss")):
-        global_docs = rag.retrieve_answer(req.query, GLOBAL_DIR, k=req.top_k)
-        # simple blend: prefer session docs first
-        if mode == "session_rag":
-            docs = (docs or []) + global_docs
-        else:
-            docs = global_docs
-            mode = "global_rag" if global_docs else mode
+    if req.use_global and store_exists(GLOBAL_DIR):
+        dirs.append(GLOBAL_DIR)
+    return dirs, scopes, mode
 
-    answer = rag.answer_with_llm(docs, req.query)
+def _with_docs(mode, docs):
+    return "global_rag" if mode == "llm_only" and docs else mode
+
+def _retrieve(req: ChatRequest, dirs, scopes, mode, query_vector):
+    docs = rag.retrieve_by_vector(query_vector, dirs, k=req.top_k, query=req.query, scopes=scopes) if dirs else []
+    return docs, _with_docs(mode, docs)
+
+def _cache_lookup(req: ChatRequest, dirs, scopes, query_vector):
+    # scope pins the store versions, so an upload makes old answers unreachable
+    scope = rag.cache_scope(dirs, req.top_k, scopes)
+    hit = None
+    if ANSWER_CACHE_SIZE > 0:
+        with metrics.span("answer_cache"):
+            hit = answer_cache().lookup(scope, query_vector)
+    return scope, hit
+
+def _prepare(req: ChatRequest):
+    # everything before the LLM call: blocking work, run in the threadpool
+    dirs, scopes, mode = _targets(req)
+    vec = rag.embed_query(req.query)
+    scope, hit = _cache_lookup(req, dirs, scopes, vec)
+    docs = None
+    if hit is None:
+        docs, mode = _retrieve(req, dirs, scopes, mode, vec)
+    return vec, scope, hit, docs, mode
+
+async def _answer(req: ChatRequest, vec, scope, hit, docs, mode) -> ChatResponse:
+    if hit is not None:
+        return ChatResponse(answer=hit.answer, sources=[Source(**s) for s in hit.sources], mode=f"{hit.mode}_cached")
+    usage = {}
+    answer = await rag.aanswer_with_llm(docs, req.query, usage)
     sources = rag.format_sources(docs)
-    return ChatResponse(answer=answer, sources=[Source(**s) for s in sources], mode=mode)
+    if ANSWER_CACHE_SIZE > 0:
+        answer_cache().put(scope, vec, answer, sources, mode)
+    return ChatResponse(answer=answer, sources=[Source(**s) for s in sources], mode=mode, context=ContextUsage(**usage))
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    # async so that waiting on the LLM gateway doesn't tie up a threadpool worker
+    prepared = await run_in_threadpool(_prepare, req)
+    return await _answer(req, *prepared)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events variant of /chat.
+
+    Emits one "sources" event (sources + mode), then a "token" event per LLM chunk,
+    then "done" with ttft_ms / total_ms and the context token usage ("error"
+    instead if generation fails).
+    A cached answer arrives as a single token event.
+    """
+    vec, scope, hit, docs, mode = await run_in_threadpool(_prepare, req)
+    if hit is None:
+        sources = rag.format_sources(docs)
+    else:
+        sources, mode = hit.sources, f"{hit.mode}_cached"
+    sources = [Source(**s).model_dump() for s in sources]
+
+    async def events():
+        yield _sse("sources", {"sources": sources, "mode": mode})
+        if hit is not None:
+            yield _sse("token", {"text": hit.answer})
+            yield _sse("done", {"ttft_ms": 0.0, "total_ms": 0.0})
+            return
+        timings = {}
+        usage = {}
+        tokens = []
+        try:
+            async for token in rag.astream_answer(docs, req.query, timings, usage):
+                tokens.append(token)
+                yield _sse("token", {"text": token})
+        except Exception as e:
+            yield _sse("error", {"error": f"{type(e).__name__}: {e}"})
+            return
+        if ANSWER_CACHE_SIZE > 0:
+            answer_cache().put(scope, vec, "".join(tokens), sources, mode)
+        yield _sse("done", {**timings, "context": usage})
+
+    # no-cache/no-buffering so proxies pass tokens through as they arrive
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+def _prepare_batch(reqs: List[ChatRequest]):
+    # _prepare for many requests: one encode call, then one search per store over all its queries
+    targets = [_targets(r) for r in reqs]
+    vecs = rag.embed_queries([r.query for r in reqs])
+    lookups = [_cache_lookup(r, dirs, scopes, v) for r, (dirs, scopes, _), v in zip(reqs, targets, vecs)]
+    todo = [i for i, (_, hit) in enumerate(lookups) if hit is None and targets[i][0]]
+    found = {}
+    if todo:
+        docs = rag.retrieve_batch(
+            [reqs[i].query for i in todo], [vecs[i] for i in todo], [targets[i][0] for i in todo],
+            [reqs[i].top_k for i in todo], [targets[i][1] for i in todo],
+        )
+        found = dict(zip(todo, docs))
+    out = []
+    for i, ((_, _, mode), (scope, hit)) in enumerate(zip(targets, lookups)):
+        docs = None
+        if hit is None:
+            docs = found.get(i, [])
+            mode = _with_docs(mode, docs)
+        out.append((vecs[i], scope, hit, docs, mode))
+    return out
+
+@app.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest):
+    """
+    Answer many ChatRequests in one call, as NDJSON: one ChatBatchResult per line.
+
+    All queries are embedded together and each store is searched once with the
+    whole query matrix; LLM calls then run at most `concurrency` at a time.
+    Lines come in request order (each as soon as it and those before it are
+    done), or in completion order with ordered=false. A failed item carries
+    "error" instead of "response"; the others are unaffected.
+    """
+    if len(req.requests) > CHAT_BATCH_MAX_SIZE:
+        raise HTTPException(413, f"At most {CHAT_BATCH_MAX_SIZE} requests per batch")
+    metrics.observe("rag_chat_batch_size", len(req.requests))
+    prepared = await run_in_threadpool(_prepare_batch, req.requests) if req.requests else []
+    limit = asyncio.Semaphore(max(1, min(req.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY)))
+
+    async def one(i: int) -> ChatBatchResult:
+        try:
+            async with limit:
+                response = await _answer(req.requests[i], *prepared[i])
+            return ChatBatchResult(index=i, response=response)
+        except Exception as e:
+            return ChatBatchResult(index=i, error=f"{type(e).__name__}: {e}")
+
+    async def lines():
+        tasks = [asyncio.ensure_future(one(i)) for i in range(len(prepared))]
+        try:
+            for task in (tasks if req.ordered else asyncio.as_completed(tasks)):
+                yield (await task).model_dump_json() + "\n"
+        finally:
+            for task in tasks:  # client went away: stop generating
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
 
 @app.delete("/sessions/{session_id}")
 def delete_session(session_id: str):
-    sdir = session_dir(session_id)
-    udir = os.path.join(UPLOADS_DIR, session_id)
-    for d in [sdir, udir]:
-        if os.path.exists(d):
-            shutil.rmtree(d)
+    _session_id(session_id)
+    rag.delete_session(session_id)
+    session_manager().forget(session_id)
     return {"deleted": session_id}
 
 from fastapi.staticfiles import StaticFiles
@@ -108,4 +420,7 @@ if FRONTEND_DIR.exists():
     app.mount("/", StaticFiles(directory=str(FRONTEND_DIR), html=True), name="web")
 else:
     # Helpful fallback / dev message
-    print(f"WARNING: frontend folder not found at {FRONTEND_DIR}. Verify src/ui/web exists.")
\ No newline at end of file
+    print(f"WARNING: frontend folder not found at {FRONTEND_DIR}. Verify src/ui/web exists.")
+
+STARTUP["import_seconds"] = round(time.perf_counter() - _IMPORT_START, 3)
+metrics.observe("rag_startup_seconds", STARTUP["import_seconds"], phase="import")
@@ -1,28 +1,201 @@
 import os
+import threading
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
 from src.embed import get_embedding_model  # reuse your embedding model
-from functools import lru_cache
+from functools import lru_cache, wraps
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-DATA_DIR = os.path.join(ROOT, "faiss_db")
-UPLOADS_DIR = os.path.join(ROOT, "uploads")
+load_dotenv(os.path.join(ROOT, ".env"))
+
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(ROOT, "faiss_db"))
+UPLOADS_DIR = os.getenv("RAG_UPLOADS_DIR", os.path.join(ROOT, "uploads"))
 GLOBAL_DIR = os.path.join(DATA_DIR, "global")
+# "dirs": one store per session under DATA_DIR/<session_id>; "shared": every
+# session's chunks in one deduplicated store, filtered by membership (src/api/tenancy.py)
+TENANCY_MODE = os.getenv("TENANCY_MODE", "dirs")
+SHARED_DIR = os.path.join(DATA_DIR, "shared")
+# rewrite the shared index once this fraction of it belongs to deleted sessions only
+TENANT_PURGE_RATIO = float(os.getenv("TENANT_PURGE_RATIO", "0.1"))
+# directories under DATA_DIR that are not sessions: never a session id
+RESERVED_SESSION_IDS = frozenset({os.path.basename(GLOBAL_DIR), os.path.basename(SHARED_DIR)})
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-load_dotenv(os.path.join(ROOT, ".env"))
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+# all-MiniLM-L6-v2 on "hf" (PyTorch), "onnx" / "onnx-int8" (ONNX Runtime, see
+# src/embed_onnx.py), or "hash" (deterministic offline stub, see src/embed.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hf")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# intra-op threads for the embedding model (0 = runtime default)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# device for the "hf" model ("cpu", "cuda", ...); unset = sentence-transformers picks one
+EMBED_DEVICE = os.getenv("EMBED_DEVICE") or None
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(ROOT, "models", "all-MiniLM-L6-v2-onnx"))
+# concurrent /chat queries are embedded together: wait up to this long for
+# more (0 = no batching), at most EMBED_MAX_BATCH per encode
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "2"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+FAKE_LLM_ANSWER = os.getenv("FAKE_LLM_ANSWER", "This is a canned answer from the fake LLM.")
+
+# LLM gateway: provider calls in flight at once, and retries of 429/5xx/timeouts
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# /chat/batch: most requests per call, and LLM calls in flight per batch
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "512"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+# how many loaded FAISS stores /chat keeps in memory, and roughly how much memory they may use (0 = no limit)
+STORE_CACHE_SIZE = int(os.getenv("STORE_CACHE_SIZE", "8"))
+STORE_CACHE_MAX_MB = int(os.getenv("STORE_CACHE_MAX_MB", "0"))
+# opt-in expiry: sessions untouched for SESSION_TTL_S are deleted (0 = never); past SESSION_DISK_QUOTA_MB
+# of indexes + uploads the least recently used go first (0 = no quota); checked every SESSION_SWEEP_S
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "0"))
+SESSION_DISK_QUOTA_MB = int(os.getenv("SESSION_DISK_QUOTA_MB", "0"))
+SESSION_SWEEP_S = float(os.getenv("SESSION_SWEEP_S", "60"))
+# past SESSION_MEMORY_QUOTA_MB of loaded session indexes the least recently used are unloaded (0 = no quota)
+SESSION_MEMORY_QUOTA_MB = int(os.getenv("SESSION_MEMORY_QUOTA_MB", "0"))
+SESSIONS_DB_PATH = os.getenv("SESSIONS_DB_PATH", os.path.join(DATA_DIR, "sessions.sqlite"))
+# remove the raw PDFs from uploads/ once they are indexed
+DELETE_UPLOADS_AFTER_INGEST = os.getenv("DELETE_UPLOADS_AFTER_INGEST", "0") == "1"
+# uploads are streamed to disk (and hashed) this many bytes at a time
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1 << 20)))
+# file hash -> chunks + vectors of already ingested PDFs, reused by repeat uploads; FILE_INDEX_MAX_FILES=0 disables it
+FILE_INDEX_PATH = os.getenv("FILE_INDEX_PATH", os.path.join(DATA_DIR, "files.sqlite"))
+FILE_INDEX_MAX_FILES = int(os.getenv("FILE_INDEX_MAX_FILES", "500"))
+# persistent chunk-embedding cache; EMBED_CACHE_SIZE=0 disables it
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(DATA_DIR, "embeddings_cache.sqlite"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "200000"))
+# retrieved chunks from the same page overlapping by at least this fraction are duplicates
+DEDUP_OVERLAP = float(os.getenv("DEDUP_OVERLAP", "0.5"))
+# approximate prompt tokens of retrieved context per /chat answer (0 = no limit)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# fuse BM25 keyword hits with vector hits (reciprocal rank fusion, constant RRF_K)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+# semantic answer cache for /chat; ANSWER_CACHE_SIZE=0 disables it
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# FAISS index type per store: flat | hnsw | ivf_flat | ivf_pq | sq8 | fp16 (see src/vectorstore.py)
+SESSION_INDEX_TYPE = os.getenv("SESSION_INDEX_TYPE", "flat")
+GLOBAL_INDEX_TYPE = os.getenv("GLOBAL_INDEX_TYPE", "flat")
+# open the global store memory-mapped so every worker process shares one copy of it
+GLOBAL_INDEX_MMAP = os.getenv("GLOBAL_INDEX_MMAP", "1") == "1"
+# log sampled stacks for requests slower than this (0 = profiler off)
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+# preload the embedding model and global index at startup; blocking = before serving
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "0") == "1"
+# background ingestion pool for /upload
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "100"))
+# ingestion job state, readable by every worker process (GET /jobs/{job_id})
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite"))
+# processes used to parse + split PDFs (1 = serial, in-process)
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# streaming ingestion: chunks per embedding batch, text bytes per batch,
+# batches between on-disk checkpoints, and an optional RSS ceiling (0 = off)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_BATCH_MAX_BYTES = int(os.getenv("INGEST_BATCH_MAX_BYTES", str(1 << 20)))
+INGEST_CHECKPOINT_BATCHES = int(os.getenv("INGEST_CHECKPOINT_BATCHES", "16"))
+INGEST_MAX_RSS_MB = int(os.getenv("INGEST_MAX_RSS_MB", "0"))
 
 @lru_cache(maxsize=1)
 def embeddings():
-    # from embed.py: all-MiniLM-L6-v2
-    return get_embedding_model()
+    # from embed.py: all-MiniLM-L6-v2, behind the on-disk embedding cache
+    options = dict(backend=EMBEDDING_BACKEND, batch_size=EMBED_BATCH_SIZE, threads=EMBED_THREADS,
+                   onnx_model_dir=ONNX_MODEL_DIR, device=EMBED_DEVICE)
+    if EMBED_CACHE_SIZE <= 0:
+        return get_embedding_model(**options)
+    return get_embedding_model(cache_path=EMBED_CACHE_PATH, cache_max_entries=EMBED_CACHE_SIZE, **options)
 
 @lru_cache(maxsize=1)
 def llm():
-    # fast/cheap reasoning for RAG answering
-    return ChatGroq(model="llama-3.1-8b-instant", temperature=0)
+    # LLM_PROVIDER=fake swaps in a local canned-answer model (offline dev/tests)
+    if LLM_PROVIDER == "fake":
+        from langchain_core.language_models.fake_chat_models import FakeListChatModel
+        return FakeListChatModel(responses=[FAKE_LLM_ANSWER])
+    # fast/cheap reasoning for RAG answering; GROQ_API_BASE can point it at
+    # benchmarks/fake_llm_server.py. Retries are left to the gateway.
+    from langchain_groq import ChatGroq
+    return ChatGroq(model="llama-3.1-8b-instant", temperature=0, max_retries=0)
+
+_init_lock = threading.RLock()
+
+def _singleton(factory):
+    # lru_cache(maxsize=1), but concurrent first calls build one instance, not
+    # one each: for objects that own threads or event loops
+    cached = lru_cache(maxsize=1)(factory)
+
+    @wraps(factory)
+    def get():
+        if cached.cache_info().currsize:
+            return cached()
+        with _init_lock:
+            return cached()
+
+    get.cache_info = cached.cache_info
+    get.cache_clear = cached.cache_clear
+    return get
+
+@_singleton
+def llm_gateway():
+    from src.api.llm_gateway import LLMGateway
+    return LLMGateway(
+        llm(), max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+        base_delay=LLM_RETRY_BASE_DELAY, max_delay=LLM_RETRY_MAX_DELAY,
+    )
+
+@_singleton
+def query_batcher():
+    from src.api.query_batcher import QueryBatcher
+    return QueryBatcher(embeddings(), window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH)
+
+@lru_cache(maxsize=1)
+def store_cache():
+    from src.vectorstore import load_faiss
+    from src.api.store_cache import StoreCache
+    global_dir = os.path.abspath(GLOBAL_DIR)
+    return StoreCache(
+        lambda d: load_faiss(embeddings(), d, mmap=GLOBAL_INDEX_MMAP and d == global_dir),
+        max_entries=STORE_CACHE_SIZE, max_bytes=STORE_CACHE_MAX_MB << 20,
+    )
+
+@lru_cache(maxsize=1)
+def answer_cache():
+    from src.api.answer_cache import AnswerCache
+    return AnswerCache(threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE)
+
+@lru_cache(maxsize=1)
+def jobs():
+    from src.api.jobs import JobManager
+    return JobManager(max_workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING, path=JOBS_DB_PATH)
+
+@lru_cache(maxsize=1)
+def tenants():
+    from src.api.tenancy import TenantIndex, TENANTS_FILE
+    return TenantIndex(os.path.join(SHARED_DIR, TENANTS_FILE))
+
+@lru_cache(maxsize=1)
+def file_index():
+    from src.api.file_index import FileIndex
+    from src.splitter import CHUNK_OVERLAP, CHUNK_SIZE
+    return FileIndex(FILE_INDEX_PATH, f"{EMBEDDING_BACKEND}:{CHUNK_SIZE}/{CHUNK_OVERLAP}", max_files=FILE_INDEX_MAX_FILES)
+
+@_singleton
+def session_manager():
+    from src.api import rag_service
+    from src.api.sessions import SessionManager
+    return SessionManager(
+        SESSIONS_DB_PATH, evict=rag_service.delete_session, usage=rag_service.session_usage,
+        busy=lambda sid: jobs().busy(sid), reserved=RESERVED_SESSION_IDS, ttl=SESSION_TTL_S,
+        disk_quota=SESSION_DISK_QUOTA_MB << 20,
+        memory=rag_service.session_memory, unload=rag_service.unload_session,
+        memory_quota=SESSION_MEMORY_QUOTA_MB << 20,
+        sweep_interval=SESSION_SWEEP_S,
+    )
 
 def session_dir(session_id: str) -> str:
     return os.path.join(DATA_DIR, session_id)
@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+class FileIndex:
+    """
+    Content-hash manifest of ingested PDFs: file sha256 -> its chunks and their vectors.
+
+    Every file ingested from its first page is recorded batch by batch as it
+    is indexed, and marked complete once its last page is in. A later upload of
+    the same bytes, into any session, replays the recorded chunks and vectors
+    instead of parsing, splitting and embedding the PDF again. Entries are
+    namespaced (embedding backend and chunking), since both shape the result.
+    At most max_files complete files are kept; the least recently used go first.
+    Rows of a file whose ingest crashed or was cancelled are dropped when the
+    file is recorded again, or swept once nothing wrote to them for stale_after
+    seconds.
+    """
+
+    def __init__(self, path: str, namespace: str, max_files: int = 500, stale_after: float = 3600.0):
+        self.namespace = namespace
+        self.max_files = max_files
+        self.stale_after = stale_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.swept = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " namespace TEXT NOT NULL, file_hash TEXT NOT NULL, name TEXT NOT NULL, pages INTEGER NOT NULL,"
+            " chunks INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (namespace, file_hash));"
+            "CREATE INDEX IF NOT EXISTS files_last_used ON files(last_used);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " namespace TEXT NOT NULL, file_hash TEXT NOT NULL, pos INTEGER NOT NULL, text TEXT NOT NULL,"
+            " metadata TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (namespace, file_hash, pos)) WITHOUT ROWID;"
+            # files being recorded (chunks but no files row yet) and when they were last written to
+            "CREATE TABLE IF NOT EXISTS recording ("
+            " namespace TEXT NOT NULL, file_hash TEXT NOT NULL, updated REAL NOT NULL,"
+            " PRIMARY KEY (namespace, file_hash));"
+        )
+        with self._conn:
+            # incomplete rows left by a version that did not track recordings: sweep them next time
+            self._conn.execute(
+                "INSERT OR IGNORE INTO recording (namespace, file_hash, updated)"
+                " SELECT DISTINCT namespace, file_hash, 0 FROM chunks c WHERE NOT EXISTS"
+                " (SELECT 1 FROM files f WHERE f.namespace = c.namespace AND f.file_hash = c.file_hash)"
+            )
+
+    def lookup(self, file_hash: str) -> Optional[Tuple[int, int]]:
+        """(pages, chunks) of a completely recorded file, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages, chunks FROM files WHERE namespace = ? AND file_hash = ?", (self.namespace, file_hash)
+            ).fetchone()
+            if row is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE files SET last_used = ? WHERE namespace = ? AND file_hash = ?",
+                        (time.time(), self.namespace, file_hash),
+                    )
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def iter_pages(self, file_hash: str) -> Iterator[Tuple[int, List[Document], np.ndarray]]:
+        """(page, chunks, vectors) of a recorded file, page by page in order."""
+        page, docs, vectors = None, [], []
+        last = -1
+        while True:
+            # a page's worth of rows at a time, so a big file is never held whole
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT pos, text, metadata, vector FROM chunks"
+                    " WHERE namespace = ? AND file_hash = ? AND pos > ? ORDER BY pos LIMIT 256",
+                    (self.namespace, file_hash, last),
+                ).fetchall()
+            if not rows:
+                break
+            for last, text, meta, blob in rows:
+                meta = json.loads(meta)
+                if docs and meta.get("page") != page:
+                    yield page, docs, np.vstack(vectors)
+                    docs, vectors = [], []
+                page = meta.get("page")
+                docs.append(Document(page_content=text, metadata=meta))
+                vectors.append(np.frombuffer(blob, dtype=np.float32))
+        if docs:
+            yield page, docs, np.vstack(vectors)
+
+    def record(self, file_hash: str, start: int, docs: List[Document], vectors):
+        """Store chunks start, start + 1, ... of a file being ingested (not visible until complete())."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._conn:
+            if start == 0 and not self._is_complete(file_hash):
+                # a new recording: drop what an earlier, unfinished one left behind
+                self._conn.execute("DELETE FROM chunks WHERE namespace = ? AND file_hash = ?",
+                                   (self.namespace, file_hash))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recording (namespace, file_hash, updated) VALUES (?, ?, ?)",
+                (self.namespace, file_hash, time.time()),
+            )
+            # rows are a pure function of the file's bytes: a concurrent or
+            # crashed-and-retried recording of the same file writes the same values
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (namespace, file_hash, pos, text, metadata, vector)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (self.namespace, file_hash, start + i, d.page_content, json.dumps(d.metadata or {}, default=str),
+                     v.tobytes())
+                    for i, (d, v) in enumerate(zip(docs, vectors))
+                ),
+            )
+
+    def complete(self, file_hash: str, name: str, pages: int, chunks: int):
+        """Publish a file whose chunks 0 .. chunks - 1 were all recorded."""
+        with self._lock, self._conn:
+            (have,) = self._conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE namespace = ? AND file_hash = ?", (self.namespace, file_hash)
+            ).fetchone()
+            if have != chunks:
+                return  # another writer replaced rows meanwhile; record it next time
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (namespace, file_hash, name, pages, chunks, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, file_hash, name, pages, chunks, time.time()),
+            )
+            self._conn.execute("DELETE FROM recording WHERE namespace = ? AND file_hash = ?",
+                               (self.namespace, file_hash))
+            self._evict()
+
+    def _is_complete(self, file_hash: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM files WHERE namespace = ? AND file_hash = ?", (self.namespace, file_hash)
+        ).fetchone() is not None
+
+    def _sweep(self):
+        # recordings nobody wrote to for stale_after seconds: their ingest is gone
+        stale = [h for (h,) in self._conn.execute(
+            "SELECT file_hash FROM recording WHERE namespace = ? AND updated < ?",
+            (self.namespace, time.time() - self.stale_after),
+        )]
+        for file_hash in stale:
+            self._conn.execute("DELETE FROM recording WHERE namespace = ? AND file_hash = ?",
+                               (self.namespace, file_hash))
+            if not self._is_complete(file_hash):
+                self._conn.execute("DELETE FROM chunks WHERE namespace = ? AND file_hash = ?",
+                                   (self.namespace, file_hash))
+                self.swept += 1
+
+    def _evict(self):
+        self._sweep()
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM files WHERE namespace = ?", (self.namespace,)).fetchone()
+        excess = count - self.max_files
+        if excess <= 0:
+            return
+        victims = [h for (h,) in self._conn.execute(
+            "SELECT file_hash FROM files WHERE namespace = ? ORDER BY last_used LIMIT ?", (self.namespace, excess)
+        )]
+        for file_hash in victims:
+            self._conn.execute("DELETE FROM files WHERE namespace = ? AND file_hash = ?", (self.namespace, file_hash))
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ? AND file_hash = ?", (self.namespace, file_hash))
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, chunks = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM files WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        return {
+            "files": files,
+            "chunks": chunks,
+            "max_files": self.max_files,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "swept": self.swept,
+        }
@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    job_id: str
+    session_id: str
+    files: List[str]
+    status: str = "queued"  # "queued" | "running" | "done" | "failed"
+    pages_done: int = 0
+    chunks_done: int = 0
+    vectors_done: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    on_progress: Optional[Callable[["Job"], None]] = field(default=None, repr=False, compare=False)
+
+    def progress(self, pages: int = 0, chunks: int = 0, vectors: int = 0):
+        # called from the worker thread; int += is fine for a single writer
+        self.pages_done += pages
+        self.chunks_done += chunks
+        self.vectors_done += vectors
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+
+COLUMNS = ("job_id", "session_id", "status", "files", "pages_done", "chunks_done", "vectors_done", "error",
+           "created_at", "started_at", "finished_at")
+
+
+class JobStore:
+    """
+    Job state in jobs.sqlite, shared by every worker process: a job runs in the
+    process that accepted the upload, but GET /jobs/{job_id} may land on any.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, status TEXT NOT NULL, files TEXT NOT NULL,"
+            " pages_done INTEGER NOT NULL, chunks_done INTEGER NOT NULL, vectors_done INTEGER NOT NULL,"
+            " error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs(finished_at)")
+        self._conn.commit()
+
+    def save(self, job: Job):
+        row = tuple(json.dumps(job.files) if c == "files" else getattr(job, c) for c in COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", row
+            )
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        values = dict(zip(COLUMNS, row))
+        values["files"] = json.loads(values["files"])
+        return Job(**values)
+
+    def trim(self, keep: int):
+        """Forget all but the keep most recently finished jobs."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN"
+                " (SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?)",
+                (keep,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on a bounded thread pool.
+
+    Jobs for the same session run strictly in submission order (one at a time per
+    session), so two uploads never race on the same store; different sessions run
+    in parallel up to max_workers.
+
+    With a path, every job's state is also written to a JobStore there (on each
+    status change, progress at most every progress_interval seconds), so get()
+    finds jobs run by other worker processes too.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 100, keep_finished: int = 1000,
+                 path: Optional[str] = None, progress_interval: float = 0.5):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._max_pending = max_pending
+        self._keep_finished = keep_finished
+        self._store = JobStore(path) if path else None
+        self._progress_interval = progress_interval
+        self._saved_at = {}  # job_id -> last progress write
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> Job
+        self._queues = {}  # session_id -> deque[(Job, fn)]
+        self._pending = 0
+
+    def submit(self, session_id: str, files: List[str], fn: Callable[[Job], object]) -> Job:
+        job = Job(job_id=uuid.uuid4().hex, session_id=session_id, files=files)
+        with self._lock:
+            if self._pending >= self._max_pending:
+                raise QueueFull(f"{self._pending} ingestion jobs already pending")
+            self._pending += 1
+            self._jobs[job.job_id] = job
+            self._trim()
+            self._save(job)
+            queue = self._queues.get(session_id)
+            if queue is None:
+                # no drainer running for this session: start one
+                self._queues[session_id] = deque([(job, fn)])
+                self._pool.submit(self._drain, session_id)
+            else:
+                queue.append((job, fn))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            job = self._store.load(job_id)
+        return job
+
+    def busy(self, session_id: str) -> bool:
+        """Whether the session has a job queued or running."""
+        with self._lock:
+            return session_id in self._queues
+
+    def _drain(self, session_id: str):
+        while True:
+            with self._lock:
+                queue = self._queues[session_id]
+                if not queue:
+                    del self._queues[session_id]
+                    return
+                job, fn = queue.popleft()
+            self._run(job, fn)
+
+    def _run(self, job: Job, fn: Callable[[Job], object]):
+        job.status = "running"
+        job.started_at = time.time()
+        job.on_progress = self._progress
+        self._save(job)
+        try:
+            fn(job)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+            job.on_progress = None
+            self._saved_at.pop(job.job_id, None)
+            self._save(job)
+            with self._lock:
+                self._pending -= 1
+
+    def _progress(self, job: Job):
+        now = time.monotonic()
+        if now - self._saved_at.get(job.job_id, 0.0) >= self._progress_interval:
+            self._saved_at[job.job_id] = now
+            self._save(job)
+
+    def _save(self, job: Job):
+        if self._store is not None:
+            self._store.save(job)
+
+    def _trim(self):
+        # forget the oldest finished jobs once we hold too many
+        excess = len(self._jobs) - self._keep_finished
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+        if self._store is not None:
+            self._store.trim(self._keep_finished)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == "running")
+            return {"pending": self._pending, "running": running, "sessions_active": len(self._queues)}
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+        if wait and self._store is not None:
+            self._store.close()
@@ -0,0 +1,180 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from src import metrics
+
+# HTTP statuses worth retrying: timeout, conflict, rate limit, server errors
+RETRY_STATUSES = {408, 409, 429}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    # connection resets / timeouts from the provider SDK or httpx carry no status
+    name = type(exc).__name__
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Async front for a LangChain chat model, shared by every request.
+
+    - at most max_concurrency calls to the provider at once; waiting time for a
+      slot is recorded in rag_llm_queue_seconds
+    - identical prompts already in flight are coalesced onto one call
+    - retryable failures (429, 5xx, timeouts) are retried up to max_retries
+      times with full-jitter exponential backoff, honouring Retry-After
+
+    The gateway runs its own event loop thread, so the limit and the coalescing
+    hold across sync callers (threadpool endpoints) and async ones alike.
+    """
+
+    def __init__(self, model, max_concurrency: int = 8, max_retries: int = 4,
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop = asyncio.new_event_loop()
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    # --- public API ---
+
+    def invoke(self, prompt: str) -> str:
+        return asyncio.run_coroutine_threadsafe(self._invoke(prompt), self._loop).result()
+
+    async def ainvoke(self, prompt: str) -> str:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._invoke(prompt), self._loop))
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        fut = asyncio.run_coroutine_threadsafe(
+            self._stream(prompt, lambda item: loop.call_soon_threadsafe(items.put_nowait, item)), self._loop
+        )
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "token":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            fut.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # --- on the gateway loop ---
+
+    @asynccontextmanager
+    async def _slot(self):
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        metrics.observe("rag_llm_queue_seconds", time.perf_counter() - start)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, _retry_after(exc) or 0.0)
+
+    async def _invoke(self, prompt: str) -> str:
+        task = self._inflight.get(prompt)
+        if task is None:
+            # its own task, so a caller that gives up doesn't cancel it for the others
+            task = self._loop.create_task(self._call(prompt))
+            self._inflight[prompt] = task
+            task.add_done_callback(lambda t: self._call_done(prompt, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _call_done(self, prompt: str, task: asyncio.Task):
+        if self._inflight.get(prompt) is task:
+            del self._inflight[prompt]
+        if not task.cancelled():
+            task.exception()  # retrieved here even if every caller went away
+
+    async def _call(self, prompt: str) -> str:
+        async with self._slot():
+            for attempt in range(self.max_retries + 1):
+                self.calls += 1
+                try:
+                    return (await self.model.ainvoke(prompt)).content
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, e))
+
+    async def _stream(self, prompt: str, push):
+        try:
+            async with self._slot():
+                for attempt in range(self.max_retries + 1):
+                    self.calls += 1
+                    started = False
+                    try:
+                        async for chunk in self.model.astream(prompt):
+                            if chunk.content:
+                                started = True
+                                push(("token", chunk.content))
+                        break
+                    except Exception as e:
+                        # once tokens went out a retry would repeat them
+                        if started or attempt >= self.max_retries or not is_retryable(e):
+                            self.failures += 1
+                            raise
+                        self.retries += 1
+                        await asyncio.sleep(self._backoff(attempt, e))
+            push(("end", None))
+        except BaseException as e:
+            push(("error", e))
+            if not isinstance(e, Exception):
+                raise
@@ -7,7 +7,22 @@ class SessionCreateResponse(BaseModel):
 class UploadResponse(BaseModel):
     session_id: str
     files_ingested: List[str] = Field(default_factory=list)
-    chunks_added: int
+    chunks_added: Optional[int] = None  # not known yet: the job reports chunks_done, see GET /jobs/{job_id}
+    job_id: Optional[str] = None        # ingestion runs in the background: poll GET /jobs/{job_id}
+    status: str = "queued"
+
+class JobStatus(BaseModel):
+    job_id: str
+    session_id: str
+    status: str  # "queued" | "running" | "done" | "failed"
+    files: List[str] = Field(default_factory=list)
+    pages_done: int = 0
+    chunks_done: int = 0
+    vectors_done: int = 0
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 class ChatRequest(BaseModel):
     query: str
@@ -18,9 +33,31 @@ class ChatRequest(BaseModel):
 class Source(BaseModel):
     doc_name: Optional[str] = None
     page: Optional[int] = None
-    score: Optional[float] = None
+    score: Optional[float] = None       # vector similarity (None for a keyword-only hit)
+    fused_score: Optional[float] = None # hybrid search: the RRF score the sources are ranked by
+
+class ContextUsage(BaseModel):
+    # approximate token counts of the retrieved context before and after packing
+    chunks_in: int = 0
+    chunks_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    budget: int = 0
+    truncated: bool = False
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Source] = Field(default_factory=list)
-    mode: str  # "session_rag" | "global_rag" | "llm_only"
+    context: Optional[ContextUsage] = None  # not set for cached answers
+    mode: str  # "session_rag" | "global_rag" | "llm_only", with "_cached" appended on answer-cache hits
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    concurrency: Optional[int] = None   # LLM calls in flight for this batch (default/max: CHAT_BATCH_CONCURRENCY)
+    ordered: bool = True                # emit results in request order (else as each completes)
+
+class ChatBatchResult(BaseModel):
+    # one NDJSON line of a /chat/batch response
+    index: int                          # position in ChatBatchRequest.requests
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src import metrics
+from src.embed import embed_queries
+
+metrics.set_buckets("rag_query_embed_batch_size", metrics.COUNT_BUCKETS)
+
+
+class QueryBatcher:
+    """
+    Micro-batches concurrent query embeddings into one encode call.
+
+    A request waits at most window_ms after the first query of its batch
+    arrived, or until max_batch queries are queued, then the whole batch is
+    encoded at once and each caller gets its own vector back. Queries that
+    arrive while a batch is encoding form the next one, so the batch size
+    grows with load instead of with the window.
+
+    Batch sizes are recorded in rag_query_embed_batch_size and the time each
+    query waited before its batch started in rag_query_embed_wait_seconds.
+    """
+
+    def __init__(self, model: Embeddings, window_ms: float = 2.0, max_batch: int = 32):
+        # queries skip the persistent chunk cache, as embed_query always did
+        self.model = getattr(model, "underlying", model)
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self.largest = 0
+        self._pending: List[Tuple[str, Future, float]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, text: str) -> List[float]:
+        fut = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("query batcher is closed")
+            self._pending.append((text, fut, time.perf_counter()))
+            self._cond.notify()
+        return fut.result()
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _next_batch(self) -> List[Tuple[str, Future, float]]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._pending:
+                deadline = self._pending[0][2] + self.window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # closed and drained
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                metrics.observe("rag_query_embed_wait_seconds", start - queued)
+            metrics.observe("rag_query_embed_batch_size", len(batch))
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest = max(self.largest, len(batch))
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, embed_queries(self.model, texts)))
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            for text, fut, _ in batch:
+                fut.set_result(list(vectors[text]))
@@ -1,61 +1,777 @@
+import gc
+import hashlib
+import json
 import os
+import shutil
+import time
 import uuid
-from typing import List, Tuple
-from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
-from src.ingest import load_pdf
-from src.splitter import split_documents
-from src.vectorstore import load_faiss, create_faiss, save_faiss
-from src.api.deps import embeddings, session_dir, GLOBAL_DIR, llm
+import contextvars
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from src.ingest import iter_pdf_chunks
+from src.embed import embed_queries as _embed_queries
+from src.vectorstore import (
+    load_faiss, save_faiss, needs_training, INDEX_TRAIN_SIZE, append_faiss, new_segment, segment_template, segment_index_type,
+    schedule_compaction, search_params, remove_documents, store_exists, write_lock,
+)
+from src import metrics
+from src.metrics import span
+from src.api.store_cache import store_fingerprint
+if TYPE_CHECKING:  # FAISS/langchain_community is heavy; only needed for hints here
+    from langchain_community.vectorstores import FAISS
+from src.api.deps import (
+    embeddings, file_index, query_batcher, session_dir, tenants, DATA_DIR, UPLOADS_DIR, GLOBAL_DIR, SHARED_DIR, TENANCY_MODE, TENANT_PURGE_RATIO, llm_gateway, store_cache, answer_cache, PDF_PARSE_WORKERS,
+    RESERVED_SESSION_IDS, EMBED_BATCH_WINDOW_MS, FILE_INDEX_MAX_FILES, UPLOAD_CHUNK_BYTES, DEDUP_OVERLAP, CONTEXT_TOKEN_BUDGET, HYBRID_SEARCH, RRF_K, SESSION_INDEX_TYPE, GLOBAL_INDEX_TYPE, INGEST_BATCH_SIZE, INGEST_BATCH_MAX_BYTES, INGEST_CHECKPOINT_BATCHES, INGEST_MAX_RSS_MB,
+)
+
+log = logging.getLogger("rag.service")
 
 # helpers
 
 def new_session_id() -> str:
     return uuid.uuid4().hex
 
-def ensure_store(dir_path: str):
-    emb = embeddings()
-    store = load_faiss(emb, dir_path)
-    return store
+def index_type_for(dir_path: str) -> str:
+    # the global store is the big one; it gets its own (usually approximate) index type
+    if os.path.abspath(dir_path) == os.path.abspath(GLOBAL_DIR):
+        return GLOBAL_INDEX_TYPE
+    return SESSION_INDEX_TYPE
+
+def store_changed(dir_path: str):
+    """Drop everything cached for the store at dir_path (loaded index, answers)."""
+    dir_path = os.path.abspath(dir_path)
+    store_cache().invalidate(dir_path)
+    answer_cache().invalidate_dir(dir_path)
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def save_stream(src: BinaryIO, dest: str) -> str:
+    """Copy src to dest UPLOAD_CHUNK_BYTES at a time, hashing on the way; returns the sha256."""
+    h = hashlib.sha256()
+    with open(dest, "wb") as out:
+        for block in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+            h.update(block)
+            out.write(block)
+    return h.hexdigest()
+
+def _rss_mb() -> float:
+    # current (not peak) resident set size; Linux only, 0 elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        return 0.0
+
+INGEST_STATE = "ingest_progress.json"
+
+def _load_ingest_state(dir_path: str) -> dict:
+    try:
+        with open(os.path.join(dir_path, INGEST_STATE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_ingest_state(dir_path: str, state: dict):
+    tmp = os.path.join(dir_path, INGEST_STATE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(dir_path, INGEST_STATE))
+
+def _merge_ingest_state(current: dict, ours: dict, file_keys: List[str]) -> dict:
+    # ingest state on disk, with this writer's progress on file_keys folded in
+    for key in file_keys:
+        mine = ours.get(key)
+        if mine is None:
+            continue
+        theirs = current.get(key) or {}
+        current[key] = {**mine, "pages": max(mine["pages"], theirs.get("pages", 0))}
+        if theirs.get("done"):
+            current[key]["done"] = True
+    return current
+
+def _drop_from_segment(store, doc_ids, emb, index_type, template):
+    # an in-memory segment without doc_ids' vectors (None if nothing is left)
+    try:
+        remove_documents(store, doc_ids)
+    except RuntimeError:
+        # HNSW can't remove vectors: build the segment again from the rest
+        keep = [(pos, doc_id) for pos, doc_id in sorted(store.index_to_docstore_id.items()) if doc_id not in doc_ids]
+        if not keep:
+            return None
+        docs = [store.docstore.search(doc_id) for _, doc_id in keep]
+        for doc, (_, doc_id) in zip(docs, keep):
+            doc.id = doc_id
+        vectors = np.vstack([store.index.reconstruct(pos) for pos, _ in keep])
+        return new_segment(docs, emb, index_type, template, vectors=vectors)
+    return store if store.index.ntotal else None
 
-def _add_documents_to_store(store: FAISS, docs: List[Document], dir_path: str) -> int:
-    # FAISS supports add_documents; then persist
-    store.add_documents(docs)
-    save_faiss(store, dir_path)
-    return len(docs)
+def ingest_into_store(dir_path: str, paths: List[str], progress: Optional[Callable] = None,
+                      session_id: Optional[str] = None, hashes: Optional[Dict[str, str]] = None) -> int:
+    """
+    Stream PDFs into the store at dir_path: pages -> chunks -> embedding batches -> index appends.
 
-def build_or_update_store(dir_path: str, docs: List[Document]) -> Tuple[FAISS, int]:
+    Only one batch of chunks is held at a time (INGEST_BATCH_SIZE chunks or
+    INGEST_BATCH_MAX_BYTES of text, whichever comes first). Every
+    INGEST_CHECKPOINT_BATCHES batches the vectors added since the last
+    checkpoint are appended to the store as a new segment, together with how
+    many pages of each file (keyed by content hash) it contains, so a crashed job
+    resumes where the last checkpoint left off. The existing store is never
+    loaded or rewritten; segments are compacted in the background afterwards.
+    Crossing INGEST_MAX_RSS_MB forces a checkpoint and halves the batch size. A
+    new store with a trained index type (IVF/PQ/SQ8) is built from a first batch
+    of INDEX_TRAIN_SIZE chunks.
+
+    With session_id, dir_path is the shared multi-tenant store: chunks get
+    content-derived ids, chunks already in the store are not embedded again,
+    and each checkpoint makes the session a member of the chunks it covered. A
+    file some session already ingested is attached without being parsed.
+    Several writers may parse and embed into it at once: the write lock is only
+    held while a checkpoint commits, which first drops pending chunks another
+    writer committed meanwhile and re-embeds skipped ones a purge removed.
+
+    Otherwise a file the file index (see file_index.py) has seen before, in
+    any store, is replayed from its recorded chunks and vectors: no parsing,
+    splitting or embedding. Files parsed here are recorded for next time.
+    hashes (path -> sha256, e.g. computed while the upload streamed in)
+    saves reading the files once more to hash them.
+    """
+    # progress (optional) is called as progress(pages=..., chunks=..., vectors=...)
+    progress = progress or (lambda **kw: None)
     emb = embeddings()
-    store = load_faiss(emb, dir_path)
-    if store is None:
-        store = create_faiss(docs, emb, dir_path)  # persists
-        return store, len(docs)
-    else:
-        added = _add_documents_to_store(store, docs, dir_path)
-        return store, added
+    template = segment_template(dir_path)
+    pending = None  # in-memory segment: vectors added since the last checkpoint
 
-def ingest_pdfs(paths: List[str], session_id: str) -> Tuple[str, int, List[str]]:
-    # load -> split -> index/update
-    all_docs = []
-    file_names = []
+    hashes = hashes or {}
+    keys = {p: hashes.get(p) or file_sha256(p) for p in paths}
+    # identical files (same hash) are ingested once
+    first_path = {}
     for p in paths:
-        docs = load_pdf(p)  # 1 Document per page :contentReference[oaicite:8]{index=8}
-        file_names.append(os.path.basename(p))
-        all_docs.extend(docs)
+        first_path.setdefault(keys[p], p)
+    # the shared store's writers take the write lock only to read and commit; a
+    # per-session store's caller holds it throughout (it is re-entrant)
+    with write_lock(dir_path):
+        state = _load_ingest_state(dir_path)
+        if session_id is not None:
+            # chunks of these files committed earlier, by this session or any other
+            for p in first_path.values():
+                tenants().add_members(session_id, tenants().file_chunks(keys[p]))
+    todo = [p for p in first_path.values() if not state.get(keys[p], {}).get("done")]
+    start_pages = {p: state.get(keys[p], {}).get("pages", 0) for p in todo}
+    for p in todo:
+        progress(pages=start_pages[p])  # already committed by an earlier attempt
+    files = file_index() if session_id is None and FILE_INDEX_MAX_FILES > 0 else None
+    replay = {}            # path -> pages, for files replayed from the file index
+    if files is not None:
+        for p in todo:
+            known = files.lookup(keys[p]) if start_pages[p] == 0 else None
+            if known is not None:
+                replay[p] = known[0]
+    parse = [p for p in todo if p not in replay]
+    # files parsed from their first page: chunks recorded so far, and pages
+    recording = {p: 0 for p in parse if start_pages[p] == 0} if files is not None else {}
+    file_pages = dict.fromkeys(recording, 0)
+    seen = set()           # chunk ids added to the store (or pending) by this run
+    unsaved_ids = {}       # file hash -> chunk ids covered since the last checkpoint
+    skipped = {}           # chunk id -> chunk left out since the last checkpoint as already committed
+
+    # an existing store keeps its type (a small one stays flat until compaction retrains it)
+    index_type = segment_index_type(dir_path, index_type_for(dir_path))
+    batch_size = INGEST_BATCH_SIZE
+    batch, batch_bytes = [], 0
+    batch_vectors = []     # per chunk in batch: its vector if known already, else None
+    batch_paths = []       # per chunk in batch: the file it came from
+    batch_pages = {}       # pages fully contained in the current batch
+    unsaved_pages = {}     # pages appended to the index since the last checkpoint
+    unsaved_batches = 0
+    added = 0
+
+    def reconcile():
+        # shared store, under the write lock: other writers may have committed
+        # pending chunks meanwhile, or a purge dropped chunks we skipped
+        nonlocal pending, added
+        pending_ids = set(pending.index_to_docstore_id.values()) if pending is not None else set()
+        committed = tenants().committed(pending_ids | skipped.keys())
+        dup = pending_ids & committed
+        if dup:
+            pending = _drop_from_segment(pending, dup, emb, index_type, template)
+            added -= len(dup)
+        lost = [c for doc_id, c in skipped.items() if doc_id not in committed and doc_id not in pending_ids]
+        if lost:
+            add_to_pending(lost, np.asarray(emb.embed_documents([c.page_content for c in lost]), dtype=np.float32))
+            added += len(lost)
+        skipped.clear()
+
+    def checkpoint():
+        nonlocal pending, template, index_type, unsaved_batches, state
+        with write_lock(dir_path):
+            if session_id is not None:
+                reconcile()
+            if pending is not None:
+                append_faiss(pending, dir_path)
+                pending = None
+                template = template or segment_template(dir_path)
+                index_type = segment_index_type(dir_path, index_type)
+            if session_id is not None and unsaved_ids:
+                tenants().commit_chunks(session_id, unsaved_ids)
+                unsaved_ids.clear()
+            for p, n in unsaved_pages.items():
+                entry = state.setdefault(keys[p], {"name": os.path.basename(p), "pages": 0})
+                entry["pages"] += n
+            unsaved_pages.clear()
+            unsaved_batches = 0
+            if session_id is not None:
+                # other writers' progress (and a purge's forgetting) since we read it
+                state = _merge_ingest_state(_load_ingest_state(dir_path), state, [keys[p] for p in todo])
+            _save_ingest_state(dir_path, state)
+        store_changed(dir_path)
+
+    def add_to_pending(docs, vectors):
+        nonlocal pending
+        if pending is None:
+            pending = new_segment(docs, emb, index_type, template, vectors=vectors)
+        else:
+            ids = [c.id for c in docs]
+            pending.add_embeddings(zip([c.page_content for c in docs], vectors.tolist()),
+                                   metadatas=[c.metadata for c in docs], ids=ids if any(ids) else None)
+
+    def flush():
+        nonlocal batch, batch_bytes, batch_vectors, batch_paths, added, unsaved_batches
+        if batch:
+            with span("index_add"):
+                missing = [i for i, v in enumerate(batch_vectors) if v is None]
+                if missing:
+                    for i, vec in zip(missing, emb.embed_documents([batch[i].page_content for i in missing])):
+                        batch_vectors[i] = vec
+                vectors = np.asarray(batch_vectors, dtype=np.float32)
+                add_to_pending(batch, vectors)
+            for p in recording:
+                rows = [i for i, q in enumerate(batch_paths) if q == p]
+                if rows:
+                    files.record(keys[p], recording[p], [batch[i] for i in rows], vectors[rows])
+                    recording[p] += len(rows)
+            added += len(batch)
+            progress(vectors=len(batch))
+        for p, n in batch_pages.items():
+            unsaved_pages[p] = unsaved_pages.get(p, 0) + n
+        batch, batch_bytes = [], 0
+        batch_vectors, batch_paths = [], []
+        batch_pages.clear()
+        unsaved_batches += 1
+
+    def dedup(path, chunks):
+        # shared store: content ids; keep only chunks whose vectors it doesn't have yet
+        from src.api.tenancy import chunk_id
+        for c in chunks:
+            c.metadata["source"] = os.path.basename(path)  # no other session's upload path
+            c.id = chunk_id(c)
+        ids = [c.id for c in chunks]
+        unsaved_ids.setdefault(keys[path], []).extend(ids)
+        committed = tenants().committed(i for i in ids if i not in seen)
+        known = committed | seen
+        fresh = []
+        for c in chunks:
+            if c.id not in known:
+                known.add(c.id)
+                seen.add(c.id)
+                fresh.append(c)
+            elif c.id in committed:
+                skipped.setdefault(c.id, c)
+        return fresh
+
+    def replayed():
+        # recorded chunks page by page, with the page counts iter_pdf_chunks would report
+        for p, pages in replay.items():
+            done = 0
+            with span("file_index"):
+                for page, chunks, vectors in files.iter_pages(keys[p]):
+                    for c in chunks:
+                        c.metadata["source"] = p  # this upload's path, as parsing it would give
+                    yield p, page + 1 - done, chunks, vectors
+                    done = page + 1
+            if pages > done:
+                yield p, pages - done, [], None
 
+    def sources():
+        yield from replayed()
+        for path, n_pages, chunks in iter_pdf_chunks(parse, workers=PDF_PARSE_WORKERS, start_pages=start_pages):
+            yield path, n_pages, chunks, None
+
+    for path, n_pages, chunks, vectors in sources():
+        progress(pages=n_pages, chunks=len(chunks))
+        if path in file_pages:
+            file_pages[path] += n_pages
+        if session_id is not None:
+            chunks = dedup(path, chunks)
+        batch.extend(chunks)
+        batch_vectors.extend([None] * len(chunks) if vectors is None else list(vectors))
+        batch_paths.extend([path] * len(chunks))
+        batch_bytes += sum(len(c.page_content) for c in chunks)
+        batch_pages[path] = batch_pages.get(path, 0) + n_pages
+        # batches end on page boundaries so checkpoints can record whole pages
+        # a trained index type needs a bigger first batch to train on
+        limit = batch_size
+        if pending is None and template is None and needs_training(index_type):
+            limit = max(batch_size, INDEX_TRAIN_SIZE)
+        if len(batch) >= limit or (batch_bytes >= INGEST_BATCH_MAX_BYTES and limit == batch_size):
+            flush()
+            if INGEST_MAX_RSS_MB and _rss_mb() > INGEST_MAX_RSS_MB:
+                checkpoint()
+                gc.collect()
+                batch_size = max(1, batch_size // 2)
+            elif unsaved_batches >= INGEST_CHECKPOINT_BATCHES:
+                checkpoint()
+
+    flush()
+    for p in recording:
+        files.complete(keys[p], os.path.basename(p), file_pages[p], recording[p])
+    for p in todo:
+        state.setdefault(keys[p], {"name": os.path.basename(p), "pages": 0})["done"] = True
+    checkpoint()
+    schedule_compaction(emb, dir_path, on_done=store_changed)
+    return added
+
+def ingest_pdfs(paths: List[str], session_id: str, progress: Optional[Callable] = None,
+                hashes: Optional[Dict[str, str]] = None) -> Tuple[str, int, List[str]]:
+    # load -> split -> index/update, streamed in bounded batches (see ingest_into_store);
     # chunking configs are from your splitter (1000/200) :contentReference[oaicite:9]{index=9}
-    chunks = split_documents(all_docs)
-    dir_path = session_dir(session_id)
-    os.makedirs(dir_path, exist_ok=True)
-    store, added = build_or_update_store(dir_path, chunks)
+    # one writer per session store, across API workers too: the second upload waits and
+    # then finds the first one's files in the ingest state instead of indexing them again
+    if TENANCY_MODE == "shared":
+        dir_path = SHARED_DIR
+        # writers of the shared store parse and embed concurrently and take the lock
+        # per checkpoint; the one creating the store holds it throughout, so the
+        # store's first segment (and trained template) has a single author
+        with write_lock(dir_path) if not store_exists(dir_path) else nullcontext():
+            added = ingest_into_store(dir_path, paths, progress, session_id=session_id, hashes=hashes)
+    else:
+        dir_path = session_dir(session_id)
+        os.makedirs(dir_path, exist_ok=True)
+        with write_lock(dir_path):
+            added = ingest_into_store(dir_path, paths, progress, hashes=hashes)
+    file_names = [os.path.basename(p) for p in paths]
     return dir_path, added, file_names
 
+def delete_session(session_id: str):
+    """Delete a session's index and uploads and drop what is cached for it."""
+    udir = os.path.join(UPLOADS_DIR, session_id)
+    if os.path.exists(udir):
+        shutil.rmtree(udir)
+    if TENANCY_MODE == "shared":
+        # tombstone now; the purge drops memberships and unreferenced chunks later
+        if tenants().delete(session_id):
+            schedule_purge()
+        answer_cache().invalidate_session(session_id)
+        return
+    sdir = session_dir(session_id)
+    if os.path.exists(sdir):
+        shutil.rmtree(sdir)
+    store_changed(sdir)
+
+def session_usage(session_id: str) -> Tuple[int, int, bool]:
+    """(index bytes, upload bytes, has indexed chunks) of a session; a shared store isn't attributed."""
+    from src.api.sessions import dir_bytes
+    upload_bytes = dir_bytes(os.path.join(UPLOADS_DIR, session_id))
+    if TENANCY_MODE == "shared":
+        return 0, upload_bytes, tenants().has_members(session_id)
+    sdir = session_dir(session_id)
+    return dir_bytes(sdir), upload_bytes, store_exists(sdir)
+
+def session_memory(session_id: str) -> int:
+    """Bytes the session's loaded index holds in this process; a shared store isn't attributed."""
+    if TENANCY_MODE == "shared":
+        return 0
+    return store_cache().bytes_of(session_dir(session_id))
+
+def unload_session(session_id: str):
+    """Drop what is loaded and cached for a session; its files stay and load again on the next query."""
+    store_changed(session_dir(session_id))
+
+def disk_sessions() -> List[Tuple[str, float]]:
+    """(session id, last modified) of every session directory in faiss_db/ and uploads/."""
+    found = {}
+    for root in (DATA_DIR, UPLOADS_DIR):
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir() and entry.name not in RESERVED_SESSION_IDS and not entry.name.startswith("."):
+                found[entry.name] = max(found.get(entry.name, 0.0), entry.stat().st_mtime)
+    return list(found.items())
+
+def purge_shared() -> int:
+    """
+    Clean up after deleted sessions of the shared store: drop their tombstones
+    and memberships and, once the chunks no live session references reach
+    TENANT_PURGE_RATIO of the index, rewrite it without them. Returns the
+    number of vectors removed.
+    """
+    with write_lock(SHARED_DIR):
+        garbage = tenants().purge()
+        if not garbage:
+            return 0
+        store = load_faiss(embeddings(), SHARED_DIR)
+        if store is None or len(garbage) < TENANT_PURGE_RATIO * store.index.ntotal:
+            return 0
+        try:
+            with span("purge"):
+                removed = remove_documents(store, garbage)
+        except RuntimeError as e:
+            # e.g. HNSW; filtering keeps the chunks unreachable, they just take space
+            log.warning("shared store: vectors not removed (%s)", e)
+            return 0
+        save_faiss(store, SHARED_DIR)
+        store.docstore.close()
+        # a file whose chunks were dropped is parsed again if someone uploads it again
+        state = _load_ingest_state(SHARED_DIR)
+        for file_hash in tenants().forget_chunks(garbage):
+            state.pop(file_hash, None)
+        _save_ingest_state(SHARED_DIR, state)
+    store_changed(SHARED_DIR)
+    return removed
+
+_purge_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purge")
+_purge_guard = threading.Lock()
+_purge_queued = False
+
+def schedule_purge():
+    """Run purge_shared in the background; calls while one is still queued share it."""
+    global _purge_queued
+    with _purge_guard:
+        if _purge_queued:
+            return
+        _purge_queued = True
+
+    def run():
+        global _purge_queued
+        with _purge_guard:
+            _purge_queued = False
+        try:
+            purge_shared()
+        except Exception:
+            log.exception("shared store purge failed")
+
+    _purge_pool.submit(run)
+
+# session + global searches run side by side (FAISS releases the GIL while searching)
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search")
+
+# dir -> loaded store, pinned for one retrieval so its vector and BM25 searches
+# read the same committed version even if an upload publishes a new one meanwhile
+_pinned: contextvars.ContextVar[Optional[Dict[str, "FAISS"]]] = contextvars.ContextVar("pinned_stores", default=None)
+
+def _store(dir_path: str) -> Optional["FAISS"]:
+    pinned = _pinned.get()
+    key = os.path.abspath(dir_path)
+    if pinned is not None and key in pinned:
+        return pinned[key]
+    return store_cache().get(key)
+
+@contextmanager
+def pinned_stores(dir_paths: List[str]):
+    """Pin the current version of each store for the searches run inside (and in threads given this context)."""
+    # loaded stores are never modified in place, so a pinned one stays a consistent snapshot
+    token = _pinned.set({os.path.abspath(d): store_cache().get(d) for d in dict.fromkeys(dir_paths)})
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+def _to_similarity(distance: float) -> float:
+    # MiniLM vectors are unit length, so squared L2 d maps to cosine as 1 - d/2
+    return 1.0 - float(distance) / 2.0
+
+def _overlap_len(a: str, b: str, max_len: int = 400) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (up to max_len)."""
+    for n in range(min(len(a), len(b), max_len), 0, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+def _is_duplicate(a: Document, b: Document) -> bool:
+    # same text, or neighbouring chunks of the same page that mostly overlap
+    if a.page_content == b.page_content:
+        return True
+    ma, mb = a.metadata or {}, b.metadata or {}
+    if (ma.get("source"), ma.get("page")) != (mb.get("source"), mb.get("page")):
+        return False
+    ta, tb = a.page_content, b.page_content
+    shorter = min(len(ta), len(tb)) or 1
+    if ta in tb or tb in ta:
+        return True
+    return max(_overlap_len(ta, tb), _overlap_len(tb, ta)) / shorter >= DEDUP_OVERLAP
+
+def _positions(store) -> Dict[str, List[int]]:
+    # doc id -> vector positions, built once per loaded store
+    positions = getattr(store, "positions_by_id", None)
+    if positions is None:
+        positions = {}
+        for pos, doc_id in store.index_to_docstore_id.items():
+            positions.setdefault(doc_id, []).append(pos)
+        store.positions_by_id = positions
+    return positions
+
+_filters_lock = threading.Lock()
+
+def _session_filter(store, session_id: str):
+    """(member doc ids, faiss selector over their positions) of a session in the shared store; None if it has none."""
+    import faiss
+    version = tenants().version(session_id)
+    if version is None:
+        return None
+    with _filters_lock:
+        cache = store.__dict__.setdefault("session_filters", OrderedDict())
+        hit = cache.get((session_id, version))
+        if hit is not None:
+            cache.move_to_end((session_id, version))
+            return hit
+    ids = tenants().member_ids(session_id)
+    positions = _positions(store)
+    pos = np.fromiter((p for doc_id in ids for p in positions.get(doc_id, ())), dtype=np.int64)
+    entry = (ids, faiss.IDSelectorBatch(pos)) if len(pos) else None
+    with _filters_lock:
+        cache[(session_id, version)] = entry
+        while len(cache) > 64:
+            cache.popitem(last=False)
+    return entry
+
+def _search_matrix(store, query_vectors, k: int, selector=None) -> List[List[Tuple[Document, float]]]:
+    import faiss
+    matrix = np.asarray(query_vectors, dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(matrix)
+    params = None if selector is None else search_params(store.index, selector)
+    distances, indices = store.index.search(matrix, k, params=params)
+    out = []
+    for row_dist, row_idx in zip(distances, indices):
+        hits = []
+        for dist, i in zip(row_dist, row_idx):
+            if i == -1:  # fewer than k vectors
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[i])
+            if isinstance(doc, Document):
+                hits.append((doc, _to_similarity(dist)))
+        out.append(hits)
+    return out
+
+def search_store(dir_path: str, query_vector: List[float], k: int,
+                 session_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+    """
+    Top-k (document, similarity) pairs from one store; [] if it does not exist.
+    With session_id (shared store) only that session's chunks are searched.
+    """
+    store = _store(dir_path)
+    if store is None:
+        return []
+    if session_id is not None:
+        scope = _session_filter(store, session_id)
+        if scope is None:
+            return []
+        with span("search"):
+            return _search_matrix(store, [query_vector], k, scope[1])[0]
+    with span("search"):
+        hits = store.similarity_search_with_score_by_vector(query_vector, k=k)
+    return [(doc, _to_similarity(dist)) for doc, dist in hits]
+
+def search_store_batch(dir_path: str, query_vectors: List[List[float]], k: int,
+                       session_id: Optional[str] = None) -> List[List[Tuple[Document, float]]]:
+    """search_store for many queries at once: one FAISS search over the whole query matrix."""
+    store = _store(dir_path)
+    scope = None
+    if store is not None and session_id is not None:
+        scope = _session_filter(store, session_id)
+    if store is None or (session_id is not None and scope is None):
+        return [[] for _ in query_vectors]
+    with span("search"):
+        return _search_matrix(store, query_vectors, k, scope and scope[1])
+
+def keyword_search_store(dir_path: str, query: str, k: int,
+                         session_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+    """Top-k (document, fused rank score) pairs from one store's inverted index; [] if it has none."""
+    store = _store(dir_path)
+    if store is None or not hasattr(store.docstore, "keyword_search"):
+        return []
+    allowed = None
+    if session_id is not None:
+        scope = _session_filter(store, session_id)
+        if scope is None:
+            return []
+        allowed = scope[0]
+    with span("bm25"):
+        return store.docstore.keyword_search(query, k, RRF_K, allowed=allowed)
+
+def _doc_key(doc: Document) -> str:
+    return doc.id or doc.page_content
+
+def fuse_rrf(rankings: List[List[Document]], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Reciprocal rank fusion: each document scores sum(1 / (k + rank)) over the rankings it appears in."""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [(docs[key], score) for key, score in scores.items()]
+
+def _ranked(results: List[List[Tuple[Document, float]]]) -> List[Document]:
+    return [doc for doc, _ in sorted((hit for hits in results for hit in hits), key=lambda h: h[1], reverse=True)]
+
+def merge_results(results: List[List[Tuple[Document, float]]], k: int) -> List[Document]:
+    """
+    Merge per-store hits by similarity, drop duplicates and cut to k.
+
+    Returned Documents are copies with metadata["score"] set; the cached stores'
+    documents are never mutated.
+    """
+    with span("merge"):
+        return _merge(results, k)
+
+def _merge(results, k, similarity=None):
+    # similarity given: results are fused (RRF) hits, ranked by that score but
+    # reported with each document's vector similarity (None for keyword-only hits)
+    ranked = sorted((hit for hits in results for hit in hits), key=lambda h: h[1], reverse=True)
+    kept = []
+    for doc, score in ranked:
+        if any(_is_duplicate(doc, other) for other in kept):
+            continue
+        meta = {**(doc.metadata or {}), "score": round(score, 4)}
+        if similarity is not None:
+            sim = similarity.get(_doc_key(doc))
+            meta.update(score=None if sim is None else round(sim, 4), fused_score=round(score, 6))
+        kept.append(Document(page_content=doc.page_content, metadata=meta))
+        if len(kept) >= k:
+            break
+    return kept
+
+def embed_query(query: str) -> List[float]:
+    with span("embed_query"):
+        if EMBED_BATCH_WINDOW_MS > 0:
+            return query_batcher().embed(query)
+        return embeddings().embed_query(query)
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed many queries in one encode call (past the chunk cache, like embed_query)."""
+    model = embeddings()
+    with span("embed_query"):
+        return _embed_queries(getattr(model, "underlying", model), list(queries))
+
+def _fetch_k(k: int) -> int:
+    # over-fetch a little so dedup can still fill k
+    return k + max(2, k // 2)
+
+def _combine(results: List[List[Tuple[Document, float]]], keyword_results: Optional[List[List[Tuple[Document, float]]]],
+             k: int) -> List[Document]:
+    if keyword_results is None:
+        return merge_results(results, k)
+    with span("fuse"):
+        fused = fuse_rrf([_ranked(results), _ranked(keyword_results)])
+    similarity = {}
+    for doc, score in (hit for hits in results for hit in hits):
+        key = _doc_key(doc)
+        similarity[key] = max(score, similarity.get(key, score))
+    with span("merge"):
+        return _merge([fused], k, similarity)
+
+def retrieve_by_vector(query_vector: List[float], dir_paths: List[str], k: int = 4,
+                       query: Optional[str] = None, scopes: Optional[Dict[str, str]] = None) -> List[Document]:
+    """
+    Search every store concurrently with one query vector and merge by score.
+
+    With the query text (and HYBRID_SEARCH on) each store's BM25 index is
+    searched alongside, and the vector and keyword rankings are fused with
+    reciprocal rank fusion: hits are ordered by metadata["fused_score"], while
+    metadata["score"] stays the vector similarity (None for keyword-only hits).
+    scopes maps a shared store's dir to the session whose chunks to search.
+    """
+    scopes = scopes or {}
+    fetch_k = _fetch_k(k)
+    with pinned_stores(dir_paths):
+        # copy the request context into each search thread so its spans reach Server-Timing
+        futures = [
+            _search_pool.submit(contextvars.copy_context().run, search_store, d, query_vector, fetch_k, scopes.get(d))
+            for d in dir_paths
+        ]
+        keyword_futures = None
+        if query and HYBRID_SEARCH:
+            keyword_futures = [
+                _search_pool.submit(contextvars.copy_context().run, keyword_search_store, d, query, fetch_k, scopes.get(d))
+                for d in dir_paths
+            ]
+    results = [f.result() for f in futures]
+    keyword_results = None if keyword_futures is None else [f.result() for f in keyword_futures]
+    return _combine(results, keyword_results, k)
+
+def retrieve_batch(queries: List[str], query_vectors: List[List[float]], dir_lists: List[List[str]],
+                   ks: List[int], scopes: Optional[List[Dict[str, str]]] = None) -> List[List[Document]]:
+    """
+    retrieve_by_vector for many queries. Each store (per session, for the
+    shared store) is searched once, with the matrix of every query that targets
+    it (at the largest fetch_k among them); BM25, fusion and merging stay per query.
+    """
+    scopes = scopes or [{} for _ in queries]
+    with pinned_stores([d for dirs in dir_lists for d in dirs]):
+        groups = {}
+        for qi, dirs in enumerate(dir_lists):
+            for d in dirs:
+                groups.setdefault((d, scopes[qi].get(d)), []).append(qi)
+        futures = {
+            key: _search_pool.submit(
+                contextvars.copy_context().run, search_store_batch, key[0],
+                [query_vectors[qi] for qi in qis], max(_fetch_k(ks[qi]) for qi in qis), key[1],
+            )
+            for key, qis in groups.items()
+        }
+        keyword_futures = {}
+        if HYBRID_SEARCH:
+            keyword_futures = {
+                (qi, d): _search_pool.submit(
+                    contextvars.copy_context().run, keyword_search_store, d, queries[qi], _fetch_k(ks[qi]),
+                    scopes[qi].get(d),
+                )
+                for qi, dirs in enumerate(dir_lists) for d in dirs
+            }
+        per_query = [dict() for _ in queries]
+        for key, qis in groups.items():
+            for qi, hits in zip(qis, futures[key].result()):
+                per_query[qi][key[0]] = hits[:_fetch_k(ks[qi])]
+    out = []
+    for qi, dirs in enumerate(dir_lists):
+        results = [per_query[qi][d] for d in dirs]
+        keyword_results = [keyword_futures[qi, d].result() for d in dirs] if HYBRID_SEARCH else None
+        out.append(_combine(results, keyword_results, ks[qi]))
+    return out
+
+def retrieve(query: str, dir_paths: List[str], k: int = 4, scopes: Optional[Dict[str, str]] = None) -> List[Document]:
+    """Embed the query once, search every store concurrently and merge by score."""
+    return retrieve_by_vector(embed_query(query), dir_paths, k, query=query, scopes=scopes)
+
 def retrieve_answer(query: str, dir_path: str, k: int = 4):
-    emb = embeddings()
-    store = FAISS.load_local(dir_path, emb, allow_dangerous_deserialization=True)
-    retriever = store.as_retriever(search_kwargs={"k": k})
-    docs = retriever.get_relevant_documents(query)
-    return docs
+    return retrieve(query, [dir_path], k)
+
+def cache_scope(dir_paths: List[str], k: int, scopes: Optional[Dict[str, str]] = None) -> Tuple:
+    """
+    Answer-cache scope: each searched store with its current version, plus
+    top_k. For a shared store the version includes the session's membership version.
+    """
+    scopes = scopes or {}
+
+    def version(d):
+        if d not in scopes:
+            return store_fingerprint(d)
+        return store_fingerprint(d), scopes[d], tenants().version(scopes[d])
+
+    return tuple((os.path.abspath(d), version(d)) for d in dir_paths) + (k,)
 
 def format_sources(docs):
     out = []
@@ -64,16 +780,144 @@ def format_sources(docs):
         out.append({
             "doc_name": meta.get("source") and os.path.basename(meta.get("source")),
             "page": meta.get("page"),
-            "score": meta.get("score")
+            "score": meta.get("score"),
+            "fused_score": meta.get("fused_score"),
         })
     return out
 
-def answer_with_llm(context: List[Document], query: str) -> str:
+# --- context packing ---
+
+# rough BPE rate for English text (no tokenizer for the hosted model is available locally)
+CHARS_PER_TOKEN = 4
+# chunks sharing at least this many characters at a boundary are stitched together
+MIN_MERGE_OVERLAP = 20
+# a block is cut to fit the remaining budget only if that leaves this many tokens of it
+MIN_TRUNCATED_TOKENS = 32
+
+metrics.set_buckets("rag_context_tokens", metrics.COUNT_BUCKETS)
+
+def count_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _stitch(a: str, b: str) -> Optional[str]:
+    # a and b overlapping at a boundary (either order) -> one text, else None
+    n = _overlap_len(a, b)
+    if n >= MIN_MERGE_OVERLAP:
+        return a + b[n:]
+    n = _overlap_len(b, a)
+    if n >= MIN_MERGE_OVERLAP:
+        return b + a[n:]
+    return None
+
+def _rank_score(doc: Document) -> float:
+    # the fused score when hybrid search ranked the hits, else the similarity
+    meta = doc.metadata or {}
+    score = meta.get("fused_score", meta.get("score"))
+    return score or 0.0
+
+def pack_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[Document], dict]:
+    """
+    Fit retrieved chunks into a token budget (0 = unlimited).
+
+    Chunks are taken best score first. One that is contained in, or stitches onto
+    (the splitter's chunk overlap), a kept chunk of the same source and page is
+    merged into it; an exact duplicate from anywhere is dropped. Kept blocks are
+    added until the budget is spent, the last one cut at a word boundary if
+    enough of it fits. Returns the packed Documents (score order) and token stats.
+    """
+    ranked = sorted(docs, key=_rank_score, reverse=True)
+    blocks = []  # [text, metadata]
+    seen = set()
+    for doc in ranked:
+        text, meta = doc.page_content, doc.metadata or {}
+        if text in seen:
+            continue
+        seen.add(text)
+        for block in blocks:
+            if (block[1].get("source"), block[1].get("page")) != (meta.get("source"), meta.get("page")):
+                continue
+            if text in block[0]:
+                break
+            merged = text if block[0] in text else _stitch(block[0], text)
+            if merged is not None:
+                block[0] = merged
+                break
+        else:
+            blocks.append([text, meta])
+
+    packed, used, truncated = [], 0, False
+    for text, meta in blocks:
+        tokens = count_tokens(text)
+        if budget and used + tokens > budget:
+            room = budget - used
+            if room >= MIN_TRUNCATED_TOKENS:
+                text = text[:room * CHARS_PER_TOKEN].rsplit(None, 1)[0]
+                packed.append(Document(page_content=text, metadata=meta))
+                used += count_tokens(text)
+            truncated = True
+            break
+        packed.append(Document(page_content=text, metadata=meta))
+        used += tokens
+
+    stats = {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "tokens_in": sum(count_tokens(d.page_content) for d in docs),
+        "tokens_out": used,
+        "budget": budget,
+        "truncated": truncated,
+    }
+    metrics.observe("rag_context_tokens", stats["tokens_in"], stage="retrieved")
+    metrics.observe("rag_context_tokens", stats["tokens_out"], stage="packed")
+    return packed, stats
+
+def build_prompt(context: List[Document], query: str, usage: Optional[dict] = None) -> str:
+    """Pack the context to the token budget and build the prompt; token stats go into usage if given."""
+    with span("prompt_build"):
+        packed, stats = pack_context(context)
+        if usage is not None:
+            usage.update(stats)
+        return _build_prompt(packed, query)
+
+def _build_prompt(context: List[Document], query: str) -> str:
     # simple "stuff" prompt; langchain chain optional, but direct is fine
     system = (
         "You are a helpful RAG assistant. Use the provided context if available. "
         "If the answer isn't in the context, say so briefly and answer from your general knowledge."
     )
     ctx_text = "\n\n".join([d.page_content for d in context]) if context else ""
-    prompt = f"{system}\n\nContext:\n{ctx_text}\n\nUser question: {query}\nAnswer:"
-    return llm().invoke(prompt).content
+    return f"{system}\n\nContext:\n{ctx_text}\n\nUser question: {query}\nAnswer:"
+
+def answer_with_llm(context: List[Document], query: str, usage: Optional[dict] = None) -> str:
+    """Answer from the LLM gateway, blocking; for callers outside an event loop (scripts, the Streamlit UI)."""
+    prompt = build_prompt(context, query, usage)
+    with span("llm"):
+        return llm_gateway().invoke(prompt)
+
+async def aanswer_with_llm(context: List[Document], query: str, usage: Optional[dict] = None) -> str:
+    """answer_with_llm for async endpoints: waits for the LLM without holding a worker thread."""
+    prompt = build_prompt(context, query, usage)
+    with span("llm"):
+        return await llm_gateway().ainvoke(prompt)
+
+async def astream_answer(context: List[Document], query: str, timings: Optional[dict] = None,
+                         usage: Optional[dict] = None) -> AsyncIterator[str]:
+    """
+    Yield the answer token by token as the LLM produces it.
+
+    Time-to-first-token and total generation time (seconds) are recorded in the
+    rag_llm_ttft_seconds / rag_llm_generation_seconds histograms and, if given, in timings.
+    """
+    prompt = build_prompt(context, query, usage)
+    start = time.perf_counter()
+    first = None
+    async for token in llm_gateway().astream(prompt):
+        if first is None:
+            first = time.perf_counter() - start
+            metrics.observe("rag_llm_ttft_seconds", first)
+        yield token
+    total = time.perf_counter() - start
+    metrics.observe("rag_llm_generation_seconds", total)
+    if timings is not None:
+        timings["ttft_ms"] = round((first if first is not None else total) * 1000, 1)
+        timings["total_ms"] = round(total * 1000, 1)
@@ -0,0 +1,257 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Collection, Dict, Iterable, Optional, Tuple
+
+log = logging.getLogger("rag.sessions")
+
+STATES = ("empty", "indexing", "ready")
+
+
+def dir_bytes(path: str) -> int:
+    """Total size of the files under path (0 if it does not exist)."""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except (FileNotFoundError, NotADirectoryError):
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += dir_bytes(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass  # removed while we walked (compaction, eviction)
+    return total
+
+
+class SessionManager:
+    """
+    Last-access tracking, expiry and disk quota for sessions.
+
+    Every session has a row in sessions.sqlite: last access, bytes of index and
+    of uploads, and a state ("empty": nothing indexed, "indexing": an ingest
+    job is queued or running, "ready"). A background sweep every
+    sweep_interval seconds refreshes sizes and states, then evicts
+
+    - sessions not accessed for ttl seconds (0 = never expire)
+    - least recently used sessions while all sessions together use more than
+      disk_quota bytes (0 = no quota)
+
+    and finally unloads (unload(session_id): loaded index, cached answers; the
+    files stay) the least recently used sessions while the sessions loaded in
+    this process hold more than memory_quota bytes (0 = no quota, see memory).
+
+    Sessions with ingestion in flight are never evicted, and the reserved ids
+    (stores that are not sessions, e.g. "global") are never tracked. evict(session_id)
+    removes the session's files and in-memory state (loaded index, cached
+    answers). A request about to write to a session pins it first (an upload
+    until its job is queued): the sweep re-checks pins and busy() under the same
+    lock right before evicting, and pin() waits for an eviction already under way.
+    Accesses are written at most once per touch_interval per session.
+    """
+
+    def __init__(self, path: str, evict: Callable[[str], None], usage: Callable[[str], Tuple[int, int, bool]],
+                 busy: Callable[[str], bool], reserved: Collection[str] = (), ttl: float = 0,
+                 disk_quota: int = 0, sweep_interval: float = 60, touch_interval: float = 30,
+                 memory: Optional[Callable[[str], int]] = None, unload: Optional[Callable[[str], None]] = None,
+                 memory_quota: int = 0):
+        self._evict = evict
+        self.reserved = frozenset(reserved)
+        self._usage = usage  # session_id -> (index_bytes, upload_bytes, indexed)
+        self._busy = busy
+        self._memory = memory  # session_id -> bytes its loaded state holds in this process
+        self._unload = unload
+        self.ttl = ttl
+        self.disk_quota = disk_quota
+        self.memory_quota = memory_quota
+        self.sweep_interval = sweep_interval
+        self.touch_interval = touch_interval
+        self.evictions = {"ttl": 0, "quota": 0, "memory": 0}
+        self.last_sweep: Optional[float] = None
+        self._touched: Dict[str, float] = {}  # session_id -> last access written
+        self._memory_bytes: Dict[str, int] = {}  # state -> loaded bytes, as of the last sweep
+        self._lock = threading.Lock()
+        # pins and evictions under way; the sweep decides on a victim holding it
+        self._admission = threading.Condition()
+        self._pins: Dict[str, int] = {}
+        self._evicting = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, created_at REAL NOT NULL, last_access REAL NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'empty', index_bytes INTEGER NOT NULL DEFAULT 0,"
+            " upload_bytes INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions(last_access)")
+        self._conn.commit()
+
+    # --- tracking ---
+
+    def register(self, session_id: str, last_access: Optional[float] = None):
+        """Start tracking a session (no-op if it is tracked already). Reserved ids raise ValueError."""
+        if session_id in self.reserved:
+            raise ValueError(f"{session_id!r} is reserved and can't be used as a session id")
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, last_access) VALUES (?, ?, ?)",
+                (session_id, now, last_access or now),
+            )
+
+    def touch(self, session_id: str):
+        """Record an access. Unknown ids are ignored (sessions are created by register)."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(session_id, 0.0) < self.touch_interval:
+                return
+            self._touched[session_id] = now
+            with self._conn:
+                self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+
+    def forget(self, session_id: str):
+        """Stop tracking a session that was deleted."""
+        with self._lock, self._conn:
+            self._touched.pop(session_id, None)
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def discover(self, session_ids: Iterable[Tuple[str, float]]):
+        """Track sessions found on disk (id, last modified), e.g. written before this manager existed."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, last_access) VALUES (?, ?, ?)",
+                ((sid, mtime, mtime) for sid, mtime in session_ids if sid not in self.reserved),
+            )
+
+    def pin(self, session_id: str):
+        """Keep the sweep from evicting a session until unpin(); waits out an eviction already under way."""
+        with self._admission:
+            while session_id in self._evicting:
+                self._admission.wait()
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def unpin(self, session_id: str):
+        with self._admission:
+            self._pins[session_id] -= 1
+            if not self._pins[session_id]:
+                del self._pins[session_id]
+
+    # --- eviction ---
+
+    def sweep(self) -> Dict[str, int]:
+        """Refresh sizes and states, then evict expired and over-quota sessions. Returns evictions by reason."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("SELECT session_id, last_access FROM sessions ORDER BY last_access").fetchall()
+        sessions = []  # (session_id, last_access, bytes, busy), least recently used first
+        updates = []
+        states = {}
+        for sid, last_access in rows:
+            if sid in self.reserved:
+                self.forget(sid)  # tracked by an older version; never evict it
+                continue
+            index_bytes, upload_bytes, indexed = self._usage(sid)
+            busy = self._busy(sid)
+            state = "indexing" if busy else "ready" if indexed else "empty"
+            updates.append((state, index_bytes, upload_bytes, sid))
+            states[sid] = state
+            sessions.append((sid, last_access, index_bytes + upload_bytes, busy))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE sessions SET state = ?, index_bytes = ?, upload_bytes = ? WHERE session_id = ?", updates
+            )
+
+        victims = {}
+        if self.ttl > 0:
+            for sid, last_access, _, busy in sessions:
+                if not busy and last_access < now - self.ttl:
+                    victims[sid] = "ttl"
+        if self.disk_quota > 0:
+            total = sum(size for sid, _, size, _ in sessions if sid not in victims)
+            for sid, _, size, busy in sessions:
+                if total <= self.disk_quota:
+                    break
+                if busy or sid in victims:
+                    continue
+                victims[sid] = "quota"
+                total -= size
+
+        done = {"ttl": 0, "quota": 0, "memory": 0}
+        for sid, reason in victims.items():
+            with self._admission:
+                # an upload may have started since the sizes were taken
+                if self._pins.get(sid) or self._busy(sid):
+                    continue
+                self._evicting.add(sid)
+            try:
+                self._evict(sid)
+                self.forget(sid)
+            except Exception:
+                log.exception("evicting session %s failed", sid)
+                continue
+            finally:
+                with self._admission:
+                    self._evicting.discard(sid)
+                    self._admission.notify_all()
+            done[reason] += 1
+            self.evictions[reason] += 1
+
+        memory_bytes = {}
+        if self._memory is not None:
+            loaded = [(sid, self._memory(sid), busy) for sid, _, _, busy in sessions if sid not in victims]
+            total = sum(size for _, size, _ in loaded)
+            for sid, size, busy in loaded:
+                if self.memory_quota > 0 and total > self.memory_quota and size and not busy:
+                    self._unload(sid)
+                    total -= size
+                    done["memory"] += 1
+                    self.evictions["memory"] += 1
+                    continue
+                memory_bytes[states[sid]] = memory_bytes.get(states[sid], 0) + size
+        self._memory_bytes = memory_bytes
+        self.last_sweep = now
+        return done
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                log.exception("session sweep failed")
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """Session counts and bytes per state (as of the last sweep), plus eviction totals."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*), SUM(index_bytes), SUM(upload_bytes) FROM sessions GROUP BY state"
+            ).fetchall()
+        memory = self._memory_bytes
+        states = {s: {"sessions": 0, "index_bytes": 0, "upload_bytes": 0, "memory_bytes": memory.get(s, 0)}
+                  for s in STATES}
+        for state, n, index_bytes, upload_bytes in rows:
+            states[state].update(sessions=n, index_bytes=index_bytes or 0, upload_bytes=upload_bytes or 0)
+        return {
+            "states": states,
+            "total_bytes": sum(s["index_bytes"] + s["upload_bytes"] for s in states.values()),
+            "memory_bytes": sum(memory.values()),
+            "ttl_s": self.ttl,
+            "disk_quota_bytes": self.disk_quota,
+            "memory_quota_bytes": self.memory_quota,
+            "evictions": dict(self.evictions),
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+
+from src.vectorstore import MANIFEST_FILE
+
+# index file of a store written before segments existed
+STORE_FILES = ("index.faiss",)
+
+
+def store_fingerprint(dir_path: str) -> Optional[Tuple]:
+    """
+    Version of the store at dir_path: (mtime_ns, size, inode) of its manifest,
+    which is replaced on every commit, or (mtime_ns, size) of each legacy store
+    file. None if the store does not exist.
+    """
+    try:
+        st = os.stat(os.path.join(dir_path, MANIFEST_FILE))
+        return ((st.st_mtime_ns, st.st_size, st.st_ino),)
+    except FileNotFoundError:
+        pass
+    parts = []
+    for name in STORE_FILES:
+        try:
+            st = os.stat(os.path.join(dir_path, name))
+        except FileNotFoundError:
+            return None
+        parts.append((st.st_mtime_ns, st.st_size))
+    return tuple(parts)
+
+
+def estimate_bytes(store) -> int:
+    """Approximate heap held by a loaded store: vector codes (unless memory-mapped) plus the id map."""
+    index = store.index
+    try:
+        code_size = index.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    codes = 0 if getattr(store, "mmap", False) else index.ntotal * code_size
+    # dict entry + doc id string per vector
+    return codes + len(store.index_to_docstore_id) * 160
+
+
+class StoreCache:
+    """
+    Bounded LRU cache of loaded vector stores, keyed by store directory.
+
+    Every lookup re-stats the store's manifest; if the fingerprint changed since the
+    store was loaded (upload, delete, rebuild) the entry is dropped and reloaded.
+    Holds at most max_entries stores and, if max_bytes is set, about that much
+    memory (see estimate_bytes); the most recently used store always stays.
+    """
+
+    def __init__(self, loader: Callable[[str], object], max_entries: int = 8, max_bytes: int = 0):
+        self._loader = loader
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = OrderedDict()  # dir -> (fingerprint, store, bytes)
+        self._loading = {}  # dir -> [lock held while that store loads, callers using it]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, dir_path: str):
+        key = os.path.abspath(dir_path)
+        fp = store_fingerprint(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and fp is not None and entry[0] == fp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        if fp is None:
+            self.invalidate(key)
+            return None
+
+        # one load per store at a time: concurrent lookups (e.g. the vector and
+        # keyword search of one query) wait for it instead of loading it twice
+        with self._load_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == fp:
+                    return entry[1]
+            # load outside the cache lock so a slow load doesn't block other stores
+            try:
+                store = self._loader(key)
+            except Exception:
+                # a writer may be halfway through replacing the files:
+                # keep serving the last good copy until the next lookup
+                if entry is None:
+                    raise
+                return entry[1]
+            size = estimate_bytes(store)
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[2]
+                if entry is not None:
+                    self.invalidations += 1
+                self._entries[key] = (fp, store, size)
+                self._bytes += size
+                while len(self._entries) > 1 and (
+                    len(self._entries) > self._max_entries or (self._max_bytes and self._bytes > self._max_bytes)
+                ):
+                    _, (_, _, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+                    self.evictions += 1
+        return store
+
+    @contextmanager
+    def _load_lock(self, key: str):
+        with self._lock:
+            slot = self._loading.get(key)
+            if slot is None:
+                slot = self._loading[key] = [threading.Lock(), 0]
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            # the last caller out drops the lock, so stores loaded once don't pile up here
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._loading[key]
+
+    def invalidate(self, dir_path: str):
+        key = os.path.abspath(dir_path)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+                self.invalidations += 1
+
+    def bytes_of(self, dir_path: str) -> int:
+        """Estimated bytes of the store loaded for dir_path (0 if it isn't loaded)."""
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(dir_path))
+            return entry[2] if entry is not None else 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
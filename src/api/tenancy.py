@@ -0,0 +1,284 @@
+"""
+Session membership for the shared multi-tenant store (TENANCY_MODE=shared).
+
+Instead of one FAISS store per session, every session's chunks live in one
+store (faiss_db/shared). A chunk's id is derived from its content (file name,
+page, text), so the same document uploaded by many sessions is embedded and
+stored once. tenants.sqlite next to the store records:
+
+- sessions: one row per session, with a membership version (bumped whenever
+  the session gains chunks, so cached answers go stale) and a deletion
+  tombstone
+- members: which chunks each session may retrieve
+- file_chunks: the committed chunks of each uploaded file (by content hash),
+  so a file that is already in the store is attached to a new session
+  without parsing it again
+
+Creating or deleting a session is a single row write. purge() later drops the
+tombstoned sessions' membership and returns the chunks nobody references any
+more, for the caller to remove from the index.
+
+Existing per-session stores can be folded into the shared store with
+
+    python -m src.api.tenancy migrate faiss_db
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from langchain_core.documents import Document
+
+TENANTS_FILE = "tenants.sqlite"
+
+
+def chunk_id(doc: Document) -> str:
+    """Content-derived id of a chunk: the same file name, page and text always map to the same id."""
+    meta = doc.metadata or {}
+    source = os.path.basename(str(meta.get("source", "")))
+    key = json.dumps([source, meta.get("page"), doc.page_content], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class TenantIndex:
+    """Sessions, their chunk memberships and the chunks of each ingested file, in SQLite."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, created_at REAL NOT NULL, deleted_at REAL,"
+            " version INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS members ("
+            " session_id TEXT NOT NULL, doc_id TEXT NOT NULL, PRIMARY KEY (session_id, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS members_doc ON members(doc_id);"
+            "CREATE TABLE IF NOT EXISTS file_chunks ("
+            " file_hash TEXT NOT NULL, doc_id TEXT NOT NULL, PRIMARY KEY (file_hash, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS file_chunks_doc ON file_chunks(doc_id);"
+        )
+        self._conn.commit()
+
+    # --- sessions ---
+
+    def create(self, session_id: str):
+        """Register a session (no-op if it is live). Re-creating a deleted id starts it empty."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT deleted_at FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None and row[0] is None:
+                return
+            if row is not None:
+                self._conn.execute("DELETE FROM members WHERE session_id = ?", (session_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, deleted_at, version) VALUES (?, ?, NULL, 0)",
+                (session_id, time.time()),
+            )
+
+    def delete(self, session_id: str) -> bool:
+        """Tombstone a session; its memberships are dropped by the next purge()."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE sessions SET deleted_at = ? WHERE session_id = ? AND deleted_at IS NULL",
+                (time.time(), session_id),
+            )
+            return cur.rowcount > 0
+
+    def version(self, session_id: str) -> Optional[int]:
+        """Membership version of a live session, None if it does not exist or was deleted."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM sessions WHERE session_id = ? AND deleted_at IS NULL", (session_id,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def has_members(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM members m JOIN sessions s USING (session_id)"
+                " WHERE m.session_id = ? AND s.deleted_at IS NULL LIMIT 1", (session_id,)
+            ).fetchone()
+        return row is not None
+
+    def member_ids(self, session_id: str) -> List[str]:
+        with self._lock:
+            return [doc_id for (doc_id,) in self._conn.execute(
+                "SELECT doc_id FROM members WHERE session_id = ?", (session_id,)
+            )]
+
+    def add_members(self, session_id: str, doc_ids: Iterable[str]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._lock, self._conn:
+            self._ensure(session_id)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO members (session_id, doc_id) VALUES (?, ?)",
+                ((session_id, doc_id) for doc_id in doc_ids),
+            )
+            self._bump(session_id)
+
+    # --- chunks ---
+
+    def file_chunks(self, file_hash: str) -> List[str]:
+        with self._lock:
+            return [doc_id for (doc_id,) in self._conn.execute(
+                "SELECT doc_id FROM file_chunks WHERE file_hash = ?", (file_hash,)
+            )]
+
+    def committed(self, doc_ids: Iterable[str]) -> Set[str]:
+        """The ids among doc_ids whose vectors are already committed to the store."""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = set()
+        with self._lock:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(doc_ids), 500):
+                part = doc_ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                found.update(doc_id for (doc_id,) in self._conn.execute(
+                    f"SELECT DISTINCT doc_id FROM file_chunks WHERE doc_id IN ({marks})", part
+                ))
+        return found
+
+    def commit_chunks(self, session_id: str, chunks_by_file: Dict[str, List[str]]):
+        """Record chunks just appended to the store (file hash -> doc ids) and make session a member of them."""
+        with self._lock, self._conn:
+            self._ensure(session_id)
+            for file_hash, doc_ids in chunks_by_file.items():
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO file_chunks (file_hash, doc_id) VALUES (?, ?)",
+                    ((file_hash, doc_id) for doc_id in doc_ids),
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO members (session_id, doc_id) VALUES (?, ?)",
+                    ((session_id, doc_id) for doc_id in doc_ids),
+                )
+            self._bump(session_id)
+
+    def purge(self) -> Set[str]:
+        """
+        Drop tombstoned sessions and their memberships. Returns the committed
+        chunks no live session references (candidates for removal from the index).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM members WHERE session_id IN (SELECT session_id FROM sessions WHERE deleted_at IS NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM sessions WHERE deleted_at IS NOT NULL")
+            return {doc_id for (doc_id,) in self._conn.execute(
+                "SELECT DISTINCT doc_id FROM file_chunks f"
+                " WHERE NOT EXISTS (SELECT 1 FROM members m WHERE m.doc_id = f.doc_id)"
+            )}
+
+    def forget_chunks(self, doc_ids: Iterable[str]) -> Set[str]:
+        """Forget chunks removed from the index; returns the hashes of the files they came from."""
+        doc_ids = list(doc_ids)
+        files = set()
+        with self._lock, self._conn:
+            for i in range(0, len(doc_ids), 500):
+                part = doc_ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                files.update(h for (h,) in self._conn.execute(
+                    f"SELECT DISTINCT file_hash FROM file_chunks WHERE doc_id IN ({marks})", part
+                ))
+                self._conn.execute(f"DELETE FROM file_chunks WHERE doc_id IN ({marks})", part)
+        return files
+
+    def stats(self) -> dict:
+        with self._lock:
+            live, deleted = self._conn.execute(
+                "SELECT COUNT(*) FILTER (WHERE deleted_at IS NULL), COUNT(*) FILTER (WHERE deleted_at IS NOT NULL)"
+                " FROM sessions"
+            ).fetchone()
+            (members,) = self._conn.execute("SELECT COUNT(*) FROM members").fetchone()
+            (chunks,) = self._conn.execute("SELECT COUNT(DISTINCT doc_id) FROM file_chunks").fetchone()
+        return {"sessions": live, "tombstones": deleted, "memberships": members, "chunks": chunks}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- helpers (caller holds the lock and a transaction) ---
+
+    def _ensure(self, session_id: str):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, created_at, version) VALUES (?, ?, 0)",
+            (session_id, time.time()),
+        )
+
+    def _bump(self, session_id: str):
+        self._conn.execute("UPDATE sessions SET version = version + 1 WHERE session_id = ?", (session_id,))
+
+
+# --- migration from per-session stores ---------------------------------------
+
+def migrate(data_dir: str, shared_dir: str, embedding_model=None, remove: bool = False) -> Dict[str, int]:
+    """
+    Fold every per-session store under data_dir into the shared store.
+
+    Vectors are read back from the session indexes (no re-embedding), chunks
+    already in the shared store are only linked, and each session becomes a
+    member of its chunks. Returns session id -> chunks linked. With remove=True
+    the migrated session directories are deleted.
+    """
+    import shutil
+
+    import numpy as np
+    from src.embed import HashEmbeddings
+    from src.vectorstore import append_faiss, load_faiss, new_faiss_from_vectors, store_exists
+
+    emb = embedding_model or HashEmbeddings()  # vectors are copied, never computed
+    tenants = TenantIndex(os.path.join(shared_dir, TENANTS_FILE))
+    skip = {os.path.abspath(shared_dir), os.path.abspath(os.path.join(data_dir, "global"))}
+    done = {}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if os.path.abspath(path) in skip or not os.path.isdir(path) or not store_exists(path):
+            continue
+        store = load_faiss(emb, path)
+        docs, vectors, by_file = [], [], {}
+        fresh = set()
+        known = tenants.committed(chunk_id(store.docstore.search(i)) for i in store.index_to_docstore_id.values())
+        for pos in range(store.index.ntotal):
+            doc = store.docstore.search(store.index_to_docstore_id[pos])
+            meta = {**(doc.metadata or {}), "source": os.path.basename(str((doc.metadata or {}).get("source", "")))}
+            doc = Document(page_content=doc.page_content, metadata=meta)
+            doc.id = chunk_id(doc)
+            # no per-file hash for migrated chunks; group them under their file name
+            by_file.setdefault(f"migrated:{meta['source']}", []).append(doc.id)
+            if doc.id not in known and doc.id not in fresh:
+                fresh.add(doc.id)
+                docs.append(doc)
+                vectors.append(store.index.reconstruct(pos))
+        if docs:
+            append_faiss(new_faiss_from_vectors(docs, np.vstack(vectors), emb), shared_dir)
+        tenants.create(name)
+        tenants.commit_chunks(name, by_file)
+        done[name] = sum(len(v) for v in by_file.values())
+        print(f"{name}: {done[name]} chunks ({len(docs)} new)", file=sys.stderr)
+        if remove:
+            shutil.rmtree(path)
+    tenants.close()
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="fold per-session stores into the shared store")
+    p.add_argument("data_dir", nargs="?", default="faiss_db")
+    p.add_argument("--shared-dir", help="default: <data_dir>/shared")
+    p.add_argument("--remove", action="store_true", help="delete each session directory once migrated")
+    args = parser.parse_args(argv)
+    done = migrate(args.data_dir, args.shared_dir or os.path.join(args.data_dir, "shared"), remove=args.remove)
+    print(f"migrated {len(done)} sessions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+On-disk docstore for FAISS segments.
+
+Each segment keeps its chunks in docs.sqlite (one row per vector position:
+doc id, text, JSON metadata) instead of a pickled InMemoryDocstore. Loading a
+store reads only the doc ids; text and metadata are fetched per hit. An FTS5
+table over the same rows is the segment's BM25 inverted index.
+
+Stores written before this format have an index.pkl instead. Loading one
+converts it in place (keeping the pickle); to convert every store up front and
+remove the pickles, run
+
+    python -m src.docstore faiss_db
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+DOCSTORE_FILE = "docs.sqlite"
+PICKLE_FILE = "index.pkl"
+
+
+def _create_fts(conn: sqlite3.Connection):
+    # external-content table: the inverted index only, text stays in docs
+    conn.execute("CREATE VIRTUAL TABLE docs_fts USING fts5(text, content='docs', content_rowid='pos')")
+    conn.execute("INSERT INTO docs_fts(docs_fts) VALUES ('rebuild')")
+
+
+def _has_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'").fetchone() is not None
+
+
+def fts_query(query: str) -> str:
+    """FTS5 MATCH expression: any of the query's words (each quoted, so no query syntax leaks through)."""
+    terms = dict.fromkeys(re.findall(r"\w+", query.lower()))
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def write_docstore(path: str, rows: Iterable[Tuple[str, Document]]):
+    """Write (doc_id, Document) pairs, in vector-position order, to a new docs.sqlite at path."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(
+            "CREATE TABLE docs ("
+            " pos INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO docs (pos, doc_id, text, metadata) VALUES (?, ?, ?, ?)",
+            (
+                (pos, doc_id, doc.page_content, json.dumps(doc.metadata or {}, default=str))
+                for pos, (doc_id, doc) in enumerate(rows)
+            ),
+        )
+        # not UNIQUE: content-addressed ids (shared store) may land twice if two
+        # processes add the same chunk at once; both rows hold the same chunk
+        conn.execute("CREATE INDEX docs_doc_id ON docs(doc_id)")
+        _create_fts(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def store_rows(store) -> Iterable[Tuple[str, Document]]:
+    """(doc_id, Document) for every vector of a LangChain FAISS store, in position order."""
+    for pos in range(store.index.ntotal):
+        doc_id = store.index_to_docstore_id[pos]
+        yield doc_id, store.docstore.search(doc_id)
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    Read-only view over the docs.sqlite files of one or more segments.
+
+    Only doc id -> segment is held in memory; a search() reads that one row.
+    Documents added after loading (add/merge of a new segment) live in a small
+    in-memory overlay until the store is reloaded from disk; keyword_search()
+    does not see them.
+    """
+
+    def __init__(self):
+        self._conns: List[sqlite3.Connection] = []
+        self._fts: List[bool] = []
+        self._where: Dict[str, int] = {}  # doc id -> index into _conns
+        self._added: Dict[str, Document] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, path: str) -> List[str]:
+        """Open a segment's docs.sqlite; returns its doc ids in vector-position order."""
+        # the open connection keeps reading the file even after compaction unlinks it
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        ids = [doc_id for (doc_id,) in conn.execute("SELECT doc_id FROM docs ORDER BY pos")]
+        with self._lock:
+            n = len(self._conns)
+            self._conns.append(conn)
+            self._fts.append(_has_fts(conn))
+            for doc_id in ids:
+                self._where[doc_id] = n
+        return ids
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._added.get(search)
+        if doc is not None:
+            return doc
+        n = self._where.get(search)
+        if n is None:
+            return f"ID {search} not found."
+        with self._lock:
+            row = self._conns[n].execute("SELECT text, metadata FROM docs WHERE doc_id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def keyword_search(self, query: str, k: int, rrf_k: int,
+                       allowed: Optional[List[str]] = None) -> List[Tuple[Document, float]]:
+        """
+        Top-k (document, score) pairs, higher is better. Each segment ranks its
+        hits with its own BM25 term statistics, so raw scores are not comparable
+        across segments; the per-segment ranks are fused instead, a hit scoring
+        1 / (rrf_k + rank), the same constant the caller fuses vector and keyword
+        rankings with. allowed restricts the hits to those doc ids.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT d.doc_id, d.text, d.metadata FROM docs_fts"
+            " JOIN docs d ON d.pos = docs_fts.rowid WHERE docs_fts MATCH ?"
+        )
+        args = [match]
+        if allowed is not None:
+            sql += " AND d.doc_id IN (SELECT value FROM json_each(?))"
+            args.append(json.dumps(allowed))
+        hits = []
+        with self._lock:
+            for conn, fts in zip(self._conns, self._fts):
+                if not fts:
+                    continue
+                # FTS5's bm25() is negated so that ascending order is best-first
+                rows = conn.execute(sql + " ORDER BY bm25(docs_fts) LIMIT ?", (*args, k)).fetchall()
+                rows = [row for row in rows if row[0] in self._where]
+                hits.extend(
+                    (Document(id=doc_id, page_content=text, metadata=json.loads(meta)), 1.0 / (rrf_k + rank))
+                    for rank, (doc_id, text, meta) in enumerate(rows, start=1)
+                )
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:k]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts) & (set(self._added) | self._where.keys())
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None and self._where.pop(doc_id, None) is None:
+                raise ValueError(f"ID {doc_id} not found.")
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+
+# --- migration from index.pkl ------------------------------------------------
+
+def add_fts(path: str) -> bool:
+    """Build the BM25 index of a docs.sqlite written without one. Returns whether it did."""
+    conn = sqlite3.connect(path)
+    try:
+        if _has_fts(conn):
+            return False
+        _create_fts(conn)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def migrate_dir(dir_path: str, keep_pickle: bool = False) -> int:
+    """
+    Convert one index.pkl next to an index.faiss into docs.sqlite. Returns the
+    number of documents written (0 if there was nothing to migrate).
+    """
+    import pickle
+    pkl = os.path.join(dir_path, PICKLE_FILE)
+    if not os.path.exists(pkl) or os.path.exists(os.path.join(dir_path, DOCSTORE_FILE)):
+        return 0
+    # the one place a pickle is still read: our own files, once
+    with open(pkl, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    rows = [(index_to_docstore_id[pos], docstore.search(index_to_docstore_id[pos]))
+            for pos in range(len(index_to_docstore_id))]
+    # a private name per writer: concurrent conversions of the same store each
+    # publish a complete file, and readers never see a partial one
+    tmp = os.path.join(dir_path, f"{DOCSTORE_FILE}.{uuid.uuid4().hex}.tmp")
+    try:
+        write_docstore(tmp, rows)
+        os.replace(tmp, os.path.join(dir_path, DOCSTORE_FILE))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if not keep_pickle:
+        os.remove(pkl)
+    return len(rows)
+
+
+def migrate_tree(root: str, keep_pickle: bool = False) -> Dict[str, int]:
+    """
+    Migrate every store (legacy top-level files and segments) under root, and
+    add the BM25 index to docstores written before it existed.
+    """
+    done = {}
+    for dir_path, _, files in os.walk(root):
+        if PICKLE_FILE in files and "index.faiss" in files:
+            n = migrate_dir(dir_path, keep_pickle)
+            if n:
+                done[dir_path] = n
+        elif DOCSTORE_FILE in files and add_fts(os.path.join(dir_path, DOCSTORE_FILE)):
+            done[dir_path] = 0
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert pickled FAISS docstores (index.pkl) to docs.sqlite and add missing BM25 indexes."
+    )
+    parser.add_argument("roots", nargs="*", default=["faiss_db"], help="store directories to scan recursively")
+    parser.add_argument("--keep-pickle", action="store_true", help="leave index.pkl in place")
+    args = parser.parse_args(argv)
+    total = 0
+    for root in args.roots:
+        for dir_path, n in migrate_tree(root, args.keep_pickle).items():
+            print(f"{dir_path}: {n} documents" if n else f"{dir_path}: added BM25 index")
+            total += n
+    print(f"migrated {total} documents", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
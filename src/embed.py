@@ -1,7 +1,192 @@
-from langchain_huggingface import HuggingFaceEmbeddings
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List
 
-def get_embedding_model():
+from langchain_core.embeddings import Embeddings
+from src.metrics import span
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# where `python -m src.embed_onnx export` puts the ONNX model by default
+ONNX_MODEL_DIR = os.path.join("models", "all-MiniLM-L6-v2-onnx")
+
+def get_embedding_model(cache_path: str = None, cache_max_entries: int = 200_000, backend: str = "hf",
+                        batch_size: int = 32, threads: int = 0, onnx_model_dir: str = None, device: str = None):
+    """
+    Initialize and return the all-MiniLM-L6-v2 embedding model.
+
+    backend picks the runtime: "hf" (sentence-transformers on PyTorch), "onnx"
+    or "onnx-int8" (ONNX Runtime, fp32 or int8-quantized weights; see
+    src/embed_onnx.py), or "hash", a deterministic stub for offline benchmarks
+    whose vectors carry no meaning. batch_size is the encoding batch size and
+    threads the intra-op thread count (0 = the runtime's default). device
+    ("cpu", "cuda", "mps", ...) places the "hf" model; None lets
+    sentence-transformers pick the best one available.
+    If cache_path is given, the model is wrapped in a persistent CachedEmbeddings
+    so chunks that were embedded before are looked up instead of re-encoded.
+    Each backend caches under its own namespace.
+    """
+    if backend == "hash":
+        model, namespace = HashEmbeddings(), "hash-384"
+    elif backend in ("onnx", "onnx-int8"):
+        from src.embed_onnx import OnnxEmbeddings
+        model = OnnxEmbeddings(onnx_model_dir or ONNX_MODEL_DIR, quantized=backend == "onnx-int8",
+                               batch_size=batch_size, threads=threads)
+        namespace = f"{MODEL_NAME}@{backend}"
+    elif backend == "hf":
+        # imported here: pulls in sentence-transformers/torch
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        model = HuggingFaceEmbeddings(
+            model_name=MODEL_NAME, model_kwargs={"device": device} if device else {},
+            encode_kwargs={"batch_size": batch_size},
+        )
+        namespace = MODEL_NAME
+    else:
+        raise ValueError(f"unknown embedding backend {backend!r} (hf, onnx, onnx-int8, hash)")
+    if cache_path:
+        return CachedEmbeddings(model, cache_path, namespace=namespace, max_entries=cache_max_entries)
+    return model
+
+
+def embed_queries(model: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    embed_query() for each of texts, batched where the model allows it.
+
+    Models whose queries encode exactly like their documents say so with an
+    embed_queries() method and get one embed_documents() call; so does a
+    HuggingFaceEmbeddings without query_encode_kwargs. Any other model is
+    asked one query at a time, since its query encoding may differ.
+    """
+    if hasattr(model, "embed_queries"):
+        return model.embed_queries(texts)
+    if not getattr(model, "query_encode_kwargs", True):
+        return model.embed_documents(texts)
+    return [model.embed_query(t) for t in texts]
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic, dependency-free stand-in for MiniLM: unit vectors seeded by sha256(text)."""
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        import numpy as np
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.size).astype("float32")
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+class CachedEmbeddings(Embeddings):
     """
-    Initialize and return a HuggingFace embedding model.
+    Content-addressed embedding cache in front of another Embeddings object.
+
+    Document vectors are stored in SQLite keyed by sha256(namespace + text), so the
+    same chunk text is never encoded twice by the same model. The table is capped at
+    max_entries; the least recently used rows are evicted first.
+    Queries are passed straight through (they rarely repeat verbatim).
     """
-    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+    def __init__(self, underlying: Embeddings, path: str, namespace: str, max_entries: int = 200_000):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = {}
+        now = time.time()
+        with self._lock, span("embed_cache"):
+            unique = list(dict.fromkeys(keys))
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for key, blob in self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ):
+                    found[key] = array("f", blob).tolist()
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *part]
+                )
+            self._conn.commit()
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        if missing:
+            with span("embed"):
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            rows = []
+            for key, vec in zip(missing.keys(), vectors):
+                vec = list(vec)
+                found[key] = vec
+                rows.append((key, array("f", vec).tobytes(), now))
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+                )
+                self._evict()
+                self._conn.commit()
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN"
+                " (SELECT key FROM embeddings ORDER BY last_used, rowid LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
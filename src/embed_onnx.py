@@ -0,0 +1,207 @@
+"""
+ONNX Runtime backend for all-MiniLM-L6-v2 (CPU inference without torch).
+
+The model is exported once to a directory holding model.onnx (fp32),
+model-int8.onnx (dynamically quantized weights) and tokenizer.json:
+
+    python -m src.embed_onnx export models/all-MiniLM-L6-v2-onnx
+
+Inference reproduces the sentence-transformers pipeline of the PyTorch model
+(mean pooling over the attention mask, then L2 normalisation), so its vectors
+can be searched against stores built with the "hf" backend. Check that before
+switching a deployment over:
+
+    python -m src.embed_onnx parity --backend onnx-int8 --store faiss_db/global
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from src.embed import MODEL_NAME
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model-int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+# all-MiniLM-L6-v2's max_seq_length; longer inputs are truncated, as in sentence-transformers
+MAX_SEQ_LENGTH = 256
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime.
+
+    Texts are encoded batch_size at a time, sorted by length so each batch pads
+    to similar lengths. threads sets ONNX Runtime's intra-op thread count (0 =
+    one per physical core).
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, batch_size: int = 32, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(path):
+            raise RuntimeError(f"{path} not found; export it with: python -m src.embed_onnx export {model_dir}")
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]):
+        import numpy as np
+        encodings = self.tokenizer.encode_batch(texts)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self._inputs})[0]
+        mask = feed["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: List[List[float]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vec in zip(batch, self._encode([texts[i] for i in batch])):
+                out[i] = vec.tolist()
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # MiniLM encodes queries and documents alike
+        return self.embed_documents(texts)
+
+
+def export(model_dir: str, model_name: str = MODEL_NAME, opset: int = 17):
+    """Export model_name to model_dir as fp32 ONNX, plus an int8 dynamically quantized copy."""
+    # export-time only dependencies
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(model_dir)  # writes tokenizer.json (fast tokenizer)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32 = os.path.join(model_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[n] for n in names), fp32, input_names=names,
+            output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset,
+        )
+    quantize_dynamic(fp32, os.path.join(model_dir, INT8_FILE), weight_type=QuantType.QInt8)
+    with open(os.path.join(model_dir, "export.json"), "w") as f:
+        json.dump({"model": model_name, "opset": opset, "max_seq_length": MAX_SEQ_LENGTH}, f, indent=2)
+
+
+def _reference_vectors(store_dir: str, n: int):
+    """Up to n (text, stored vector) pairs from a flat store (vectors exactly as the index holds them)."""
+    import numpy as np
+    from src.embed import HashEmbeddings
+    from src.vectorstore import load_faiss
+
+    store = load_faiss(HashEmbeddings(), store_dir)  # the embedder is not used here
+    if store is None:
+        raise SystemExit(f"no store at {store_dir}")
+    if "Flat" not in type(store.index).__name__:
+        raise SystemExit(f"{store_dir}: stored vectors can only be read back exactly from a flat index")
+    step = max(1, store.index.ntotal // n)
+    positions = list(range(0, store.index.ntotal, step))[:n]
+    texts = [store.docstore.search(store.index_to_docstore_id[p]).page_content for p in positions]
+    return texts, np.vstack([store.index.reconstruct(p) for p in positions])
+
+
+def parity(backend: str, reference: str = "hf", store: str = None, n: int = 256,
+           batch_size: int = 32, threads: int = 0, model_dir: str = None) -> dict:
+    """
+    Cosine similarity between backend's vectors and a reference: the vectors
+    already stored in a flat index (store) or the reference backend's output on
+    the same texts. Also reports top-5 neighbour agreement and throughput.
+    """
+    import numpy as np
+    from src.embed import get_embedding_model
+
+    def build(name):
+        return get_embedding_model(backend=name, batch_size=batch_size, threads=threads, onnx_model_dir=model_dir)
+
+    if store:
+        texts, ref = _reference_vectors(store, n)
+        ref_name = f"stored:{store}"
+    else:
+        texts = [f"Sample passage {i} about {topic}." for i, topic in enumerate(
+            ["retrieval augmented generation", "vector search", "PDF parsing", "quantization", "rate limits"] * (n // 5 + 1)
+        )][:n]
+        ref_model, ref_name = build(reference), reference
+        ref = np.asarray(ref_model.embed_documents(texts), dtype=np.float32)
+
+    model = build(backend)
+    start = time.perf_counter()
+    got = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    seconds = time.perf_counter() - start
+
+    cos = (got * ref).sum(axis=1) / (np.linalg.norm(got, axis=1) * np.linalg.norm(ref, axis=1))
+    k = min(5, len(texts) - 1)
+    overlap = 1.0
+    if k > 0:
+        top = lambda m: np.argsort(-(m @ m.T), axis=1)[:, 1:k + 1]
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top(ref), top(got))]))
+    return {
+        "backend": backend,
+        "reference": ref_name,
+        "texts": len(texts),
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_mean": round(float(cos.mean()), 5),
+        "top5_agreement": round(overlap, 4),
+        "texts_per_s": round(len(texts) / seconds, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="export the model to ONNX (fp32 + int8); needs torch and transformers")
+    p.add_argument("model_dir")
+    p.add_argument("--model", default=MODEL_NAME)
+    p = sub.add_parser("parity", help="compare a backend's vectors with a stored index or another backend")
+    p.add_argument("--backend", default="onnx-int8")
+    p.add_argument("--reference", default="hf", help="reference backend when --store is not given")
+    p.add_argument("--store", help="flat store directory whose stored vectors are the reference")
+    p.add_argument("--model-dir", help="exported ONNX model directory")
+    p.add_argument("--n", type=int, default=256, help="texts to compare")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--threads", type=int, default=0)
+    p.add_argument("--min-cosine", type=float, default=0.98, help="exit non-zero below this minimum cosine")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export(args.model_dir, args.model)
+        print(f"exported {args.model} to {args.model_dir}", file=sys.stderr)
+        return
+    result = parity(args.backend, args.reference, args.store, args.n, args.batch_size, args.threads, args.model_dir)
+    print(json.dumps(result, indent=2))
+    if result["cosine_min"] < args.min_cosine:
+        sys.exit(f"parity check failed: min cosine {result['cosine_min']} < {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
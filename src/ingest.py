@@ -1,6 +1,18 @@
 # document ingestion layer
 
-from langchain_community.document_loaders import PyPDFLoader
+import atexit
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+from src.splitter import split_documents
+from src.metrics import span
+
+# pages handed to one worker at a time when parsing in parallel
+PAGES_PER_TASK = 16
 
 def load_pdf(path: str):
     """
@@ -12,6 +24,124 @@ def load_pdf(path: str):
     Returns:
         List[Document]: One Document per page of the PDF.
     """
+    from langchain_community.document_loaders import PyPDFLoader
     loader = PyPDFLoader(path)
     documents = loader.load()
-    return documents
\ No newline at end of file
+    return documents
+
+def count_pages(path: str) -> int:
+    """Number of pages in a PDF (reads only the page tree, no text extraction)."""
+    import pypdf
+    return len(pypdf.PdfReader(path).pages)
+
+def _pdf_metadata(info: dict) -> dict:
+    # document metadata normalized the way PyPDFParser does it: "/Key" -> "key",
+    # values str (stripped) or int, PDF dates ("D:20240101120000+01'00'") as ISO 8601
+    out = {}
+    for k, v in info.items():
+        if type(v) not in (str, int):
+            v = str(v)
+        k = (k[1:] if k.startswith("/") else k).lower()
+        if k in ("creationdate", "moddate"):
+            try:
+                out[k] = datetime.strptime(v.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                out[k] = v
+        elif k in ("page_count", "file_path"):
+            out["total_pages" if k == "page_count" else "source"] = v
+            out[k] = v
+        else:
+            out[k] = v.strip() if isinstance(v, str) else v
+    return out
+
+def iter_pdf_pages(path: str, start: int = 0, stop: int = None) -> Iterator[Document]:
+    """
+    Lazily load pages [start, stop) of a PDF, one Document at a time.
+
+    Produces exactly the Documents PyPDFLoader(path).load()[start:stop] would
+    (same text and metadata, including "source" and "page"), without extracting
+    text from the other pages or holding more than one page in memory.
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(path)
+    n = len(reader.pages)
+    doc_metadata = _pdf_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": str(path), "total_pages": n}
+    )
+    for page_number in range(start, n if stop is None else min(stop, n)):
+        with span("parse"):
+            text = reader.pages[page_number].extract_text(extraction_mode="plain")
+        yield Document(
+            page_content=text.strip(),
+            metadata=doc_metadata | {"page": page_number, "page_label": reader.page_labels[page_number]},
+        )
+
+def load_pdf_pages(path: str, start: int, stop: int) -> List[Document]:
+    """Load pages [start, stop) of a PDF (see iter_pdf_pages)."""
+    return list(iter_pdf_pages(path, start, stop))
+
+def _parse_and_split(task: Tuple[str, int, int]) -> Tuple[int, List[Document]]:
+    # runs in a worker process
+    path, start, stop = task
+    pages = load_pdf_pages(path, start, stop)
+    return len(pages), split_documents(pages)
+
+_pool = None
+_pool_workers = 0
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # one long-lived pool per process; forkserver avoids forking a threaded server
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        _pool_workers = workers
+        atexit.register(_pool.shutdown)
+    return _pool
+
+def iter_pdf_chunks(paths: List[str], workers: int = 1, pages_per_task: int = PAGES_PER_TASK,
+                    start_pages: Dict[str, int] = None) -> Iterator[Tuple[str, int, List[Document]]]:
+    """
+    Parse and split PDFs, yielding (path, pages_parsed, chunks) in document/page order.
+
+    Serially, pages are streamed and split one at a time. With workers > 1, each PDF
+    is cut into page ranges that are parsed *and* split in a process pool. The
+    splitter works page by page, so the chunks (text, metadata and order) are
+    identical to the serial load_pdf -> split_documents path either way.
+    At most 2 * workers ranges are in flight, so results never pile up in memory.
+    start_pages (path -> first page) resumes a partially ingested file.
+    """
+    start_pages = start_pages or {}
+    if workers <= 1:
+        for path in paths:
+            for page in iter_pdf_pages(path, start_pages.get(path, 0)):
+                yield path, 1, split_documents([page])
+        return
+
+    tasks = []
+    for path in paths:
+        n = count_pages(path)
+        first = start_pages.get(path, 0)
+        tasks.extend((path, start, min(start + pages_per_task, n)) for start in range(first, n, pages_per_task))
+
+    pool = _get_pool(workers)
+    in_flight = deque()
+    todo = iter(tasks)
+    for task in todo:
+        in_flight.append((task[0], pool.submit(_parse_and_split, task)))
+        if len(in_flight) >= 2 * workers:
+            break
+    while in_flight:
+        path, fut = in_flight.popleft()
+        # parse/split spans are recorded in the worker; here we see the wait
+        with span("parse_split_wait"):
+            n_pages, chunks = fut.result()
+        task = next(todo, None)
+        if task is not None:
+            in_flight.append((task[0], pool.submit(_parse_and_split, task)))
+        yield path, n_pages, chunks
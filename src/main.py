@@ -1,8 +1,9 @@
-from ingest import load_pdf
-from splitter import split_documents
-from embed import get_embedding_model
-from vectorstore import create_faiss, load_faiss
-from qa_chain import build_qa_chain
+# dev loop; run from the repo root: python -m src.main
+from src.ingest import load_pdf
+from src.splitter import split_documents
+from src.embed import get_embedding_model
+from src.vectorstore import create_faiss, load_faiss
+from src.qa_chain import build_qa_chain
 import os
 
 def main():
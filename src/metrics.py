@@ -0,0 +1,210 @@
+import contextvars
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# seconds; covers sub-ms cache hits up to multi-minute ingests
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# for histograms of counts (tokens, batch sizes) rather than seconds
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+log = logging.getLogger("rag.metrics")
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus style: cumulative on export)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "avg": self.sum / self.count if self.count else 0.0,
+            }
+
+    def cumulative(self) -> List[int]:
+        with self._lock:
+            out, total = [], 0
+            for c in self.counts:
+                total += c
+                out.append(total)
+            return out
+
+
+# (name, sorted label items) -> Histogram
+_histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+# name -> buckets, for histograms that don't measure seconds
+_buckets: Dict[str, Tuple[float, ...]] = {}
+_lock = threading.Lock()
+
+
+def set_buckets(name: str, buckets: Tuple[float, ...]):
+    """Use these buckets for every histogram called name (call before the first observe)."""
+    _buckets[name] = buckets
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = (name, tuple(sorted(labels.items())))
+    h = _histograms.get(key)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(key, Histogram(_buckets.get(name, DEFAULT_BUCKETS)))
+    return h
+
+
+def observe(name: str, value: float, **labels):
+    histogram(name, **labels).observe(value)
+
+
+def _label_str(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def snapshot() -> dict:
+    with _lock:
+        items = list(_histograms.items())
+    return {name + _label_str(labels): h.snapshot() for (name, labels), h in sorted(items)}
+
+
+def render_prometheus(extra_counters: Optional[Dict[str, Dict[Tuple, float]]] = None) -> str:
+    """
+    Prometheus text exposition of every histogram, plus extra_counters given as
+    {metric_name: {label_items: value}} (e.g. cache hit counters owned elsewhere).
+    """
+    with _lock:
+        items = sorted(_histograms.items())
+    lines = []
+    seen = set()
+    for (name, labels), h in items:
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = h.cumulative()
+        for bound, count in zip(list(h.buckets) + ["+Inf"], cumulative):
+            lines.append(f"{name}_bucket{_label_str(labels + (('le', bound),))} {count}")
+        snap = h.snapshot()
+        lines.append(f"{name}_sum{_label_str(labels)} {snap['sum']}")
+        lines.append(f"{name}_count{_label_str(labels)} {snap['count']}")
+    for name, series in sorted((extra_counters or {}).items()):
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(series.items()):
+            lines.append(f"{name}{_label_str(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- per-request stage timings -------------------------------------------------
+
+# list of (stage, seconds) for the request being served, if any
+_request_spans: contextvars.ContextVar = contextvars.ContextVar("request_spans", default=None)
+
+
+def begin_request():
+    return _request_spans.set([])
+
+
+def end_request(token) -> List[Tuple[str, float]]:
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    return spans
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a pipeline stage: recorded in the rag_stage_seconds{stage=...} histogram
+    and, inside a request, in that request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("rag_stage_seconds", elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    # repeated stages (e.g. one search per store) are summed
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+# --- optional sampling profiler for slow requests ------------------------------
+
+_IDLE_FILES = {"threading.py", "selectors.py", "queue.py", "thread.py", "base_events.py"}
+
+
+class SlowRequestSampler:
+    """
+    Samples every thread's stack once a request has run longer than threshold
+    seconds, and logs the hottest stacks when it finishes. Costs one idle
+    thread per request until the threshold is crossed; nothing when disabled.
+    """
+
+    def __init__(self, label: str, threshold: float, interval: float = 0.005, top: int = 10):
+        self.label = label
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.samples = Counter()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        if self.samples:
+            total = sum(self.samples.values())
+            report = "\n".join(
+                f"  {count / total:6.1%}  {stack}" for stack, count in self.samples.most_common(self.top)
+            )
+            log.warning("slow request %s: %d stack samples\n%s", self.label, total, report)
+
+    def _run(self):
+        if self._done.wait(self.threshold):
+            return
+        me = threading.get_ident()
+        while not self._done.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                # skip idle threads (pool workers, event loop waiting in select)
+                if frame.f_code.co_filename.rsplit("/", 1)[-1] in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 30:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name}({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[" <- ".join(stack[:8])] += 1
@@ -5,8 +5,8 @@
 from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
 from langchain_groq import ChatGroq
-from retriever import get_retriever
-from embed import get_embedding_model
+from src.retriever import get_retriever
+from src.embed import get_embedding_model
 from dotenv import load_dotenv
 import os
 
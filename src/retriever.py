@@ -1,15 +1,12 @@
 # create a retriever — an object that knows how to search and fetch the most relevant chunks from your vector database (e.g., ChromaDB) when the user asks a question.
 
-from langchain_community.vectorstores import FAISS
-import os
+from src.vectorstore import load_faiss
 
 def get_retriever(persist_directory, embedding_model, k=3):
     """Return a retriever for FAISS vectorstore."""
-    path = os.path.join(persist_directory, "index.faiss")
+    store = load_faiss(embedding_model, persist_directory)
 
-    if not os.path.exists(path):
+    if store is None:
         raise FileNotFoundError(f"FAISS index not found at {persist_directory}")
     
-    store = FAISS.load_local(persist_directory, embedding_model, allow_dangerous_deserialization=True)
-    
     return store.as_retriever(search_kwargs={"k": k})
\ No newline at end of file
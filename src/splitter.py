@@ -1,13 +1,18 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.metrics import span
+
+CHUNK_SIZE = 1000     # characters per chunk
+CHUNK_OVERLAP = 200   # overlap between chunks
 
 def split_documents(documents):
     """
     Split documents into smaller chunks for embedding and retrieval.
     """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,      # characters per chunk
-        chunk_overlap=200,    # overlap between chunks
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         separators=["\n\n", "\n", ".", " ", ""]
     )
-    chunks = text_splitter.split_documents(documents)
-    return chunks
\ No newline at end of file
+    with span("split"):
+        chunks = text_splitter.split_documents(documents)
+    return chunks
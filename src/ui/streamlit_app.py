@@ -1,4 +1,4 @@
-import os, requests, streamlit as st
+import os, json, time, requests, streamlit as st
 
 API_BASE = os.environ.get("API_BASE", "http://localhost:8000")
 
@@ -23,6 +23,18 @@ with st.expander("📄 Upload PDFs", expanded=True):
             r = requests.post(f"{API_BASE}/upload", files=files_param, data=data)
             r.raise_for_status()
             res = r.json()
+            # ingestion runs in the background; wait for the job to finish
+            with st.spinner(f"Indexing {f.name}..."):
+                while True:
+                    jr = requests.get(f"{API_BASE}/jobs/{res['job_id']}")
+                    jr.raise_for_status()
+                    job = jr.json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    time.sleep(1)
+            if job["status"] == "failed":
+                st.error(f"Failed to index {f.name}: {job['error']}")
+                continue
             uploaded.extend(res["files_ingested"])
         st.success(f"Uploaded: {', '.join(uploaded)}")
 
@@ -41,13 +53,36 @@ if st.button("Ask") and query.strip():
         "top_k": top_k,
         "use_global": use_global
     }
-    r = requests.post(f"{API_BASE}/chat", json=payload)
+    # stream the answer: "sources" first, then "token" events, then "done"
+    r = requests.post(f"{API_BASE}/chat/stream", json=payload, stream=True)
     r.raise_for_status()
-    res = r.json()
-    st.markdown(f"**Mode:** `{res['mode']}`")
-    st.write(res["answer"])
-    if res.get("sources"):
+    meta = {"sources": [], "mode": "", "done": {}}
+
+    def tokens():
+        event = None
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "sources":
+                    meta["sources"], meta["mode"] = data["sources"], data["mode"]
+                elif event == "token":
+                    yield data["text"]
+                elif event == "error":
+                    yield f"\n\n[error] {data['error']}"
+                elif event == "done":
+                    meta["done"] = data
+
+    st.write_stream(tokens())
+    st.markdown(f"**Mode:** `{meta['mode']}`")
+    if meta["done"]:
+        st.caption(f"First token {meta['done'].get('ttft_ms')} ms, total {meta['done'].get('total_ms')} ms")
+        ctx = meta["done"].get("context") or {}
+        if ctx:
+            st.caption(f"Context ~{ctx.get('tokens_out')} tokens (from ~{ctx.get('tokens_in')} retrieved)")
+    if meta["sources"]:
         st.divider()
         st.subheader("Sources")
-        for s in res["sources"]:
+        for s in meta["sources"]:
             st.write(f"- {s.get('doc_name')} (page {s.get('page')})")
@@ -203,6 +203,17 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   };
 
+  // Poll an ingestion job until it is done or failed
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const r = await fetch(`${API}/jobs/${jobId}`);
+      const job = await r.json();
+      if (!r.ok) throw new Error(job.detail || `HTTP ${r.status}`);
+      if (job.status === "done" || job.status === "failed") return job;
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   // Upload PDFs
   btnUpload.onclick = async () => {
     const files = filesEl.files;
@@ -239,10 +250,17 @@ document.addEventListener("DOMContentLoaded", () => {
       try {
         const r = await fetch(`${API}/upload`, { method: "POST", body: fd });
         const data = await r.json();
-        
-        if (data.files_ingested && data.files_ingested.length > 0) {
+        if (!r.ok) throw new Error(data.detail || `HTTP ${r.status}`);
+
+        // ingestion runs in the background: wait for the job before counting the file
+        showStatus(`Indexing ${f.name}...`, "loading");
+        const job = await waitForJob(data.job_id);
+        if (job.status === "done") {
           successCount++;
           addBubble(`📄 Uploaded: ${data.files_ingested.join(", ")}`);
+        } else {
+          failCount++;
+          addBubble(`❌ Failed to index ${f.name}: ${job.error}`);
         }
       } catch (err) {
         console.error(err);
@@ -1,20 +1,637 @@
-from langchain_community.vectorstores import FAISS
+import json
+import logging
+import math
 import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only hold within one process
+    fcntl = None
+
+import numpy as np
+from src.metrics import span
+
+log = logging.getLogger("rag.vectorstore")
+
+# index_type -> faiss.index_factory spec; {nlist}/{m}/{nbits} are sized from the training set
+INDEX_SPECS = {
+    "flat": "Flat",                    # exact, float32
+    "hnsw": "HNSW32",                  # graph, float32, no training
+    "ivf_flat": "IVF{nlist},Flat",     # inverted lists, float32
+    "ivf_pq": "IVF{nlist},PQ{m}x{nbits}",  # inverted lists, ~m bytes per vector
+    "sq8": "SQ8",                      # int8 scalar quantizer, 4x smaller
+    "fp16": "SQfp16",                  # float16 scalar quantizer, 2x smaller
+}
+META_FILE = "index_meta.json"  # legacy single-file stores only
+
+# segmented layout: <dir>/manifest.json lists the committed segments, each a
+# <dir>/seg-<id>/ holding index.faiss + docs.sqlite (see src/docstore.py). Appends write
+# a new segment and swap the manifest atomically; a store written before
+# segments existed (index.faiss at the top level) reads as one segment ".".
+MANIFEST_FILE = "manifest.json"
+SEGMENT_PREFIX = "seg-"
+TMP_PREFIX = ".tmp-"
+# empty copy of a trained (IVF/PQ/SQ8) index, so later segments share its centroids
+TEMPLATE_FILE = "trained.faiss"
+# lock files: one for manifest read-modify-write, one held by a writer for a whole ingest/rewrite
+MANIFEST_LOCK = ".manifest.lock"
+WRITE_LOCK = ".write.lock"
+LEGACY_FILES = ("index.faiss", "docs.sqlite", "index.pkl", META_FILE)
+
+# size-tiered compaction: the newest segments are merged while the segment before
+# them holds at most COMPACT_RATIO times their combined vectors, which keeps the
+# segment count and the number of times a vector is rewritten both O(log n)
+COMPACT_RATIO = float(os.getenv("FAISS_COMPACT_RATIO", "2"))
+# unreferenced segment dirs younger than this may belong to a writer still running
+ORPHAN_GRACE_S = 600
+
+# vectors a trained index type (IVF/PQ/SQ8) is trained on: ingest collects this
+# many chunks before building a new store; given fewer, the store starts out flat
+# and compaction rebuilds it as that type once it holds enough of them
+INDEX_TRAIN_SIZE = int(os.getenv("INDEX_TRAIN_SIZE", "4096"))
+
+# search-time knobs applied whenever an index is built or loaded
+IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+def needs_training(index_type: str) -> bool:
+    return index_type in ("ivf_flat", "ivf_pq", "sq8")
+
+def index_spec(index_type: str, dim: int, n_train: int) -> str:
+    """faiss.index_factory string for index_type, sized for n_train training vectors."""
+    if index_type not in INDEX_SPECS:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {sorted(INDEX_SPECS)}")
+    # faiss wants ~39 training points per centroid
+    nlist = max(1, min(int(4 * math.sqrt(n_train)), n_train // 39))
+    nbits = max(1, min(8, int(math.log2(max(2, n_train // 39)))))
+    m = next(m for m in (48, 32, 24, 16, 12, 8, 6, 4, 3, 2, 1) if dim % m == 0)
+    return INDEX_SPECS[index_type].format(nlist=nlist, m=m, nbits=nbits)
+
+def tune_index(index):
+    """Apply nprobe / efSearch to IVF and HNSW indexes (no-op for others)."""
+    import faiss
+    if isinstance(index, faiss.IndexShards):
+        for i in range(index.count()):
+            tune_index(faiss.downcast_index(index.at(i)))
+        return index
+    try:
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+def measure_recall(index, vectors: np.ndarray, k: int = 10, n_queries: int = 100) -> float:
+    """
+    recall@k of a trained, empty index against exact flat search. A sample of
+    vectors is held out as queries and the rest go into a copy of index, so no
+    query finds itself.
+    """
+    import faiss
+    n_held = min(n_queries, len(vectors) // 10)
+    if n_held == 0:
+        return 1.0
+    rng = np.random.default_rng(0)
+    held = np.zeros(len(vectors), dtype=bool)
+    held[rng.choice(len(vectors), size=n_held, replace=False)] = True
+    queries, base = vectors[held], vectors[~held]
+    k = min(k, len(base))
+    probe = tune_index(faiss.clone_index(index))
+    probe.add(base)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+    _, found = probe.search(queries, k)
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+def _read_meta(persist_directory):
+    try:
+        with open(os.path.join(persist_directory, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"index_type": "flat"}
+
+# --- manifest ---------------------------------------------------------------
+
+class StoreLock:
+    """
+    Re-entrant lock on one store directory, held across threads and processes.
+
+    Threads of this process queue on an RLock; the outermost holder also takes
+    an flock on a file in the directory, so uvicorn workers and CLI ingests
+    writing the same store wait for each other too.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+        except BaseException:
+            self._lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+_dir_locks = {}
+_dir_locks_guard = threading.Lock()
+
+def _store_lock(persist_directory, name) -> StoreLock:
+    key = os.path.join(os.path.abspath(persist_directory), name)
+    with _dir_locks_guard:
+        lock = _dir_locks.get(key)
+        if lock is None:
+            lock = _dir_locks[key] = StoreLock(key)
+        return lock
+
+def _dir_lock(persist_directory) -> StoreLock:
+    # serializes manifest read-modify-write between appends, saves and compaction
+    return _store_lock(persist_directory, MANIFEST_LOCK)
+
+def write_lock(persist_directory) -> StoreLock:
+    """
+    One writer per store: hold it for a whole ingest or rewrite, so two writers
+    never both decide what is missing from the same version. Readers never take
+    it; they read whichever manifest was last published, whose segments are
+    immutable.
+    """
+    return _store_lock(persist_directory, WRITE_LOCK)
+
+def store_exists(persist_directory) -> bool:
+    return (os.path.exists(os.path.join(persist_directory, MANIFEST_FILE))
+            or os.path.exists(os.path.join(persist_directory, "index.faiss")))
+
+def read_manifest(persist_directory):
+    """The store's manifest ({"version", "segments", "index_meta"}), or None if there is no store."""
+    try:
+        with open(os.path.join(persist_directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    if not os.path.exists(os.path.join(persist_directory, "index.faiss")):
+        return None
+    meta = _read_meta(persist_directory)
+    return {"version": 0, "segments": [{"name": ".", "ntotal": meta.get("ntotal", 0)}], "index_meta": meta}
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_manifest(persist_directory, manifest):
+    # write-then-rename: readers see the old manifest or the new one, never half of one
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync(persist_directory)
+
+def _write_segment(store, persist_directory) -> dict:
+    name = SEGMENT_PREFIX + uuid.uuid4().hex[:12]
+    tmp = os.path.join(persist_directory, TMP_PREFIX + name)
+    _save_segment_files(store, tmp)
+    for f in os.listdir(tmp):
+        _fsync(os.path.join(tmp, f))
+    os.rename(tmp, os.path.join(persist_directory, name))
+    _fsync(persist_directory)
+    return {"name": name, "ntotal": store.index.ntotal}
+
+def _remove_segments(persist_directory, segments):
+    for seg in segments:
+        if seg["name"] == ".":
+            for f in LEGACY_FILES:
+                try:
+                    os.remove(os.path.join(persist_directory, f))
+                except FileNotFoundError:
+                    pass
+        else:
+            shutil.rmtree(os.path.join(persist_directory, seg["name"]), ignore_errors=True)
+
+def _remove_orphans(persist_directory, manifest):
+    # leftovers of writers that crashed before publishing their segment
+    live = {seg["name"] for seg in manifest["segments"]}
+    cutoff = time.time() - ORPHAN_GRACE_S
+    for name in os.listdir(persist_directory):
+        if not name.startswith((SEGMENT_PREFIX, TMP_PREFIX)) or name in live:
+            continue
+        path = os.path.join(persist_directory, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+def _write_template(persist_directory, index):
+    import faiss
+    empty = faiss.clone_index(index)
+    empty.reset()
+    path = os.path.join(persist_directory, TEMPLATE_FILE)
+    faiss.write_index(empty, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def segment_index_type(persist_directory, index_type: str) -> str:
+    """Index type new segments of the store should use: the store's own, or index_type for a new store."""
+    manifest = read_manifest(persist_directory)
+    if manifest is None:
+        return index_type
+    return manifest["index_meta"].get("index_type", "flat")
+
+def segment_template(persist_directory):
+    """
+    Empty trained index new segments of this store should be built from, or
+    None if the store's index type needs no training (or there is no store).
+    """
+    manifest = read_manifest(persist_directory)
+    if manifest is None or not needs_training(manifest["index_meta"].get("index_type", "flat")):
+        return None
+    import faiss
+    path = os.path.join(persist_directory, TEMPLATE_FILE)
+    if os.path.exists(path):
+        return faiss.read_index(path)
+    # stores written before templates existed: empty out a copy of the first segment
+    index = faiss.read_index(os.path.join(persist_directory, manifest["segments"][0]["name"], "index.faiss"))
+    index.reset()
+    return index
+
+# --- save / load ------------------------------------------------------------
 
 def save_faiss(store, persist_directory="faiss_db"):
-    """Save FAISS vectorstore to disk."""
+    """Save FAISS vectorstore to disk as a single segment, replacing whatever was there."""
     os.makedirs(persist_directory, exist_ok=True)
-    store.save_local(persist_directory)
+    meta = getattr(store, "index_meta", None) or {"index_type": "flat"}
+    # a full rewrite waits for ingests in flight rather than dropping what they append
+    with write_lock(persist_directory), span("save"):
+        seg = _write_segment(store, persist_directory)
+        with _dir_lock(persist_directory):
+            old = read_manifest(persist_directory)
+            version = old["version"] + 1 if old else 1
+            _write_manifest(persist_directory, {"version": version, "segments": [seg], "index_meta": meta})
+            if needs_training(meta.get("index_type", "flat")):
+                _write_template(persist_directory, store.index)
+        if old:
+            _remove_segments(persist_directory, old["segments"])
 
-def load_faiss(embedding_model, persist_directory="faiss_db"):
-    """Load FAISS vectorstore if it exists."""
-    path = os.path.join(persist_directory, "index.faiss")
-    if os.path.exists(path):
-        return FAISS.load_local(persist_directory, embedding_model, allow_dangerous_deserialization=True)
-    return None
+def append_faiss(store, persist_directory="faiss_db"):
+    """
+    Persist store (only the new documents) as one more segment of the store at
+    persist_directory. Cost is proportional to the new documents, not the store.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    with span("save"):
+        seg = _write_segment(store, persist_directory)
+        with _dir_lock(persist_directory):
+            manifest = read_manifest(persist_directory)
+            if manifest is None:
+                meta = getattr(store, "index_meta", None) or {"index_type": "flat"}
+                manifest = {"version": 0, "segments": [], "index_meta": meta}
+                if needs_training(meta.get("index_type", "flat")):
+                    _write_template(persist_directory, store.index)
+            manifest["segments"].append(seg)
+            manifest["version"] += 1
+            _write_manifest(persist_directory, manifest)
+
+def _save_segment_files(store, path):
+    import faiss
+    from src.docstore import DOCSTORE_FILE, store_rows, write_docstore
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(store.index, os.path.join(path, "index.faiss"))
+    write_docstore(os.path.join(path, DOCSTORE_FILE), store_rows(store))
+
+def _merge_index(base, other):
+    # appends other's vectors to base; positions continue from base.ntotal
+    import faiss
+    if isinstance(base, faiss.IndexShards):
+        base.add_shard(other)
+        return
+    try:
+        try:
+            base.merge_from(other)
+        except TypeError:
+            # IVF stores ids explicitly and wants the offset for other's ids
+            base.merge_from(other, base.ntotal)
+    except RuntimeError:
+        # index types without merge_from (HNSW) or segments of different types
+        base.add(other.reconstruct_n(0, other.ntotal))
+
+def merge_stores(base, other):
+    """Add every vector and document of other to base (in place)."""
+    start = base.index.ntotal
+    _merge_index(base.index, other.index)
+    base.docstore.add({doc_id: other.docstore.search(doc_id) for doc_id in other.index_to_docstore_id.values()})
+    base.index_to_docstore_id.update({start + i: doc_id for i, doc_id in other.index_to_docstore_id.items()})
+    return base
+
+def _read_index(path, mmap=False):
+    import faiss
+    if not mmap:
+        return faiss.read_index(path)
+    # map the vector codes straight from the page cache instead of copying them
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+
+def _load_segments(embedding_model, persist_directory, segments, mmap=False):
+    # one index with every segment's vectors; chunk text stays on disk until a hit needs it
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from src.docstore import DOCSTORE_FILE, PICKLE_FILE, SqliteDocstore, migrate_dir
+    index, docstore, index_to_docstore_id = None, SqliteDocstore(), {}
+    for seg in segments:
+        path = os.path.join(persist_directory, seg["name"])
+        if not os.path.exists(os.path.join(path, DOCSTORE_FILE)) and os.path.exists(os.path.join(path, PICKLE_FILE)):
+            # written before docs.sqlite existed: convert it once. The pickle stays in
+            # place, unread from now on (python -m src.docstore removes it). Needs no
+            # lock: the docstore is written under a private name and renamed into place
+            n = migrate_dir(path, keep_pickle=True)
+            if n:
+                log.info("converted %s to %s (%d documents)", os.path.join(path, PICKLE_FILE), DOCSTORE_FILE, n)
+        try:
+            part = _read_index(os.path.join(path, "index.faiss"), mmap)
+            ids = docstore.attach(os.path.join(path, DOCSTORE_FILE))
+        except (RuntimeError, sqlite3.Error) as e:
+            if not os.path.exists(os.path.join(path, "index.faiss")):
+                raise FileNotFoundError(path) from e
+            raise
+        start = 0 if index is None else index.ntotal
+        if index is None and mmap and len(segments) > 1:
+            # merging would copy the mapped codes onto the heap; search the segments as
+            # shards instead (successive ids, so positions line up with the docstore)
+            index = faiss.IndexShards(part.d, False, True)
+            index.add_shard(part)
+        elif index is None:
+            index = part
+        else:
+            _merge_index(index, part)
+        index_to_docstore_id.update((start + i, doc_id) for i, doc_id in enumerate(ids))
+    return FAISS(embedding_function=embedding_model, index=index, docstore=docstore,
+                 index_to_docstore_id=index_to_docstore_id)
+
+def load_faiss(embedding_model, persist_directory="faiss_db", mmap=False):
+    """
+    Load FAISS vectorstore (all segments, merged into one in-memory index) if it exists.
+
+    mmap=True opens the segments read-only and memory-mapped, so processes that
+    load the same store share its pages through the OS page cache. Segment
+    files are never modified in place, only replaced, which keeps the mappings
+    valid until the store object is dropped.
+    """
+    for attempt in range(3):
+        manifest = read_manifest(persist_directory)
+        if manifest is None:
+            return None
+        try:
+            with span("store_load"):
+                store = _load_segments(embedding_model, persist_directory, manifest["segments"], mmap)
+        except FileNotFoundError:
+            # compaction swapped these segments out after we read the manifest
+            if attempt == 2:
+                raise
+            continue
+        store.index_meta = manifest["index_meta"]
+        store.manifest_version = manifest["version"]
+        store.mmap = mmap
+        tune_index(store.index)
+        return store
+
+# --- compaction -------------------------------------------------------------
+
+def plan_compaction(sizes) -> int:
+    """
+    Index of the first segment to merge with everything after it (size-tiered,
+    see COMPACT_RATIO); len(sizes) when no merge is due.
+    """
+    if len(sizes) < 2:
+        return len(sizes)
+    start, total = len(sizes) - 1, sizes[-1]
+    while start > 0 and sizes[start - 1] <= COMPACT_RATIO * total:
+        start -= 1
+        total += sizes[start]
+    return start if len(sizes) - start >= 2 else len(sizes)
+
+def _upgrade_due(index_meta, ntotal) -> bool:
+    # a store that started flat (too small to train) and has grown enough to train
+    target = index_meta.get("target_type")
+    return index_meta.get("index_type") == "flat" and target is not None and needs_training(target) \
+        and ntotal >= INDEX_TRAIN_SIZE
+
+def _retrain(store, index_type, embedding_model):
+    # the flat store's exact vectors and its documents, in a newly trained index
+    n = store.index.ntotal
+    docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(n)]
+    return new_faiss(docs, embedding_model, index_type, vectors=store.index.reconstruct_n(0, n))
+
+def compact(embedding_model, persist_directory) -> bool:
+    """
+    Merge the segments plan_compaction picks into one new segment. Appends may
+    run concurrently (they only add segments at the end). Returns whether anything changed.
+
+    A store that started flat because it was too small to train its index type
+    on (see new_faiss) is merged whole and rebuilt as that type once it holds
+    INDEX_TRAIN_SIZE vectors; segments appended meanwhile join it on later merges.
+    """
+    manifest = read_manifest(persist_directory)
+    if manifest is None:
+        return False
+    segments = manifest["segments"]
+    upgrade = _upgrade_due(manifest["index_meta"], sum(seg["ntotal"] for seg in segments))
+    start = 0 if upgrade else plan_compaction([seg["ntotal"] for seg in segments])
+    if start >= len(segments):
+        return False
+    victims = segments[start:]
+    with span("compact"):
+        merged = _load_segments(embedding_model, persist_directory, victims)
+        if upgrade:
+            merged = _retrain(merged, manifest["index_meta"]["target_type"], embedding_model)
+        seg = _write_segment(merged, persist_directory)
+    with _dir_lock(persist_directory):
+        current = read_manifest(persist_directory)
+        names = [s["name"] for s in current["segments"]]
+        if names[start:start + len(victims)] != [s["name"] for s in victims]:
+            # a full save_faiss replaced the store meanwhile
+            _remove_segments(persist_directory, [seg])
+            return False
+        current["segments"][start:start + len(victims)] = [seg]
+        current["version"] += 1
+        if upgrade:
+            current["index_meta"] = merged.index_meta
+            _write_template(persist_directory, merged.index)
+        _write_manifest(persist_directory, current)
+        _remove_orphans(persist_directory, current)
+    _remove_segments(persist_directory, victims)
+    return True
+
+_compactor = None
+_compacting = set()
+
+def schedule_compaction(embedding_model, persist_directory, on_done=None):
+    """Compact the store in a background thread (at most one pending run per store)."""
+    global _compactor
+    key = os.path.abspath(persist_directory)
+    with _dir_locks_guard:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+        if _compactor is None:
+            _compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compact")
+
+    def run():
+        changed = False
+        try:
+            while compact(embedding_model, key):
+                changed = True
+        finally:
+            with _dir_locks_guard:
+                _compacting.discard(key)
+        if changed and on_done is not None:
+            on_done(key)
+
+    return _compactor.submit(run)
+
+def new_faiss(chunks, embedding_model, index_type="flat", vectors=None):
+    """
+    Create an in-memory FAISS index (not persisted).
+
+    Non-flat index types are trained on these chunks' vectors; recall@10 against
+    exact search, for queries held out of the index (see measure_recall), is
+    kept in store.index_meta.
+    With fewer than INDEX_TRAIN_SIZE vectors a type that needs training builds a
+    flat index instead, with index_meta["target_type"] recording the type
+    compaction should move the store to (see compact). vectors, if given, are
+    the chunks' embeddings (computed earlier); otherwise embedding_model computes them.
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    if index_type == "flat" and vectors is None:
+        store = FAISS.from_documents(chunks, embedding_model)
+        store.index_meta = {"index_type": "flat", "spec": "Flat"}
+        return store
+    if index_type == "flat":
+        return new_faiss_from_vectors(chunks, vectors, embedding_model)
+
+    import faiss
+    texts = [c.page_content for c in chunks]
+    if vectors is None:
+        vectors = embedding_model.embed_documents(texts)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if needs_training(index_type) and len(vectors) < INDEX_TRAIN_SIZE:
+        store = new_faiss_from_vectors(chunks, vectors, embedding_model)
+        store.index_meta["target_type"] = index_type
+        return store
+    spec = index_spec(index_type, vectors.shape[1], len(vectors))
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        index.train(vectors)
+    tune_index(index)
+    recall = measure_recall(index, vectors)
+    store = FAISS(embedding_function=embedding_model, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+    ids = [c.id for c in chunks]
+    store.add_embeddings(zip(texts, vectors.tolist()), metadatas=[c.metadata for c in chunks], ids=ids if any(ids) else None)
+    store.index_meta = {
+        "index_type": index_type,
+        "spec": spec,
+        "trained_on": len(vectors),
+        "recall_at_10": round(recall, 4),
+    }
+    return store
+
+def new_segment(chunks, embedding_model, index_type="flat", template=None, vectors=None):
+    """
+    In-memory FAISS store for chunks, to be appended to an existing store.
+    With a template (see segment_template) the chunks go into a copy of that
+    trained index instead of training a new one on just these chunks.
+    vectors: the chunks' embeddings if already known (see new_faiss).
+    """
+    if template is None:
+        return new_faiss(chunks, embedding_model, index_type, vectors)
+    if vectors is not None:
+        store = new_faiss_from_vectors(chunks, vectors, embedding_model, template)
+        store.index_meta = {"index_type": index_type}
+        return store
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    index = tune_index(faiss.clone_index(template))
+    store = FAISS(embedding_function=embedding_model, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+    store.add_documents(chunks)
+    store.index_meta = {"index_type": index_type}
+    return store
+
+def new_faiss_from_vectors(chunks, vectors, embedding_model, template=None):
+    """
+    In-memory flat FAISS store for chunks whose vectors are already known (copied
+    from another index), or a copy of template (see segment_template) holding them.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = tune_index(faiss.clone_index(template)) if template is not None else faiss.IndexFlatL2(vectors.shape[1])
+    store = FAISS(embedding_function=embedding_model, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+    ids = [c.id for c in chunks]
+    store.add_embeddings(zip([c.page_content for c in chunks], vectors.tolist()),
+                         metadatas=[c.metadata for c in chunks], ids=ids if any(ids) else None)
+    store.index_meta = {"index_type": "flat", "spec": "Flat"} if template is None else {}
+    return store
+
+def search_params(index, selector):
+    """faiss SearchParameters restricting a search to selector, keeping the index's nprobe / efSearch."""
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def remove_documents(store, doc_ids) -> int:
+    """
+    Remove every vector whose doc id is in doc_ids from an in-memory store
+    (index, docstore and id map); later positions shift down. Raises
+    RuntimeError for index types that can't remove vectors (HNSW).
+    """
+    doc_ids = set(doc_ids)
+    gone = [pos for pos, doc_id in store.index_to_docstore_id.items() if doc_id in doc_ids]
+    if not gone:
+        return 0
+    store.index.remove_ids(np.asarray(gone, dtype=np.int64))
+    store.docstore.delete(list(doc_ids & set(store.index_to_docstore_id.values())))
+    keep = [doc_id for pos, doc_id in sorted(store.index_to_docstore_id.items()) if doc_id not in doc_ids]
+    store.index_to_docstore_id = dict(enumerate(keep))
+    return len(gone)
 
-def create_faiss(chunks, embedding_model, persist_directory="faiss_db"):
+def create_faiss(chunks, embedding_model, persist_directory="faiss_db", index_type="flat"):
     """Create and save FAISS index."""
-    store = FAISS.from_documents(chunks, embedding_model)
+    store = new_faiss(chunks, embedding_model, index_type)
     save_faiss(store, persist_directory)
-    return store
\ No newline at end of file
+    return store
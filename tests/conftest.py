@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# src.api.deps reads its configuration at import time: point it at a throwaway
+# data dir, the canned-answer LLM and the hash embedding before anything imports it
+_workdir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ.update({
+    "RAG_DATA_DIR": os.path.join(_workdir, "faiss_db"),
+    "RAG_UPLOADS_DIR": os.path.join(_workdir, "uploads"),
+    "LLM_PROVIDER": "fake",
+    "EMBEDDING_BACKEND": "hash",
+    "WARMUP": "0",
+})
+
+SAMPLE_PDF = os.path.join(ROOT, "data", "Medical_Words_Reference.pdf")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from src.api.app import app
+    with TestClient(app) as c:
+        yield c
+
+
+def wait_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        r = client.get(f"/jobs/{job_id}")
+        assert r.status_code == 200
+        job = r.json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def upload(client, session_id, path=SAMPLE_PDF):
+    """Upload one PDF into the session and wait for its ingest job."""
+    with open(path, "rb") as f:
+        r = client.post("/upload", data={"session_id": session_id},
+                        files=[("files", (os.path.basename(path), f, "application/pdf"))])
+    assert r.status_code == 200, r.text
+    return wait_job(client, r.json()["job_id"])
+
+
+def new_session(client):
+    return client.post("/sessions").json()["session_id"]
+
+
+def chat(client, query, session_id=None, **kw):
+    r = client.post("/chat", json={"query": query, "session_id": session_id, "use_global": False, **kw})
+    assert r.status_code == 200, r.text
+    return r.json()
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+
+from conftest import SAMPLE_PDF, chat, new_session, upload
+from src.api.answer_cache import AnswerCache
+
+SCOPE = (("/data/s1", 3), 4)
+
+
+def test_similar_query_in_same_scope_hits():
+    cache = AnswerCache(threshold=0.95)
+    cache.put(SCOPE, [1.0, 0.0, 0.0], "answer", [{"doc_name": "a.pdf"}], "session_rag")
+    hit = cache.lookup(SCOPE, [0.99, 0.05, 0.0])
+    assert hit is not None and hit.answer == "answer"
+    assert cache.lookup(SCOPE, [0.0, 1.0, 0.0]) is None
+    # another store version (or top_k) is another scope
+    assert cache.lookup((("/data/s1", 4), 4), [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = AnswerCache(ttl=0.05)
+    cache.put(SCOPE, [1.0, 0.0], "answer", [], "session_rag")
+    time.sleep(0.1)
+    assert cache.lookup(SCOPE, [1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    vectors = np.eye(3)
+    for i in range(3):
+        cache.put(SCOPE, vectors[i], f"answer {i}", [], "session_rag")
+    assert cache.lookup(SCOPE, vectors[0]) is None
+    assert cache.lookup(SCOPE, vectors[2]).answer == "answer 2"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_dir_and_session():
+    cache = AnswerCache()
+    cache.put(SCOPE, [1.0, 0.0], "session", [], "session_rag")
+    cache.put((("/data/global", 1), 4), [1.0, 0.0], "global", [], "global_rag")
+    shared = (("/data/shared", ("v1", "s2", 7)), 4)
+    cache.put(shared, [1.0, 0.0], "shared", [], "session_rag")
+    cache.invalidate_dir("/data/s1")
+    assert cache.lookup(SCOPE, [1.0, 0.0]) is None
+    assert cache.lookup((("/data/global", 1), 4), [1.0, 0.0]).answer == "global"
+    cache.invalidate_session("s2")
+    assert cache.lookup(shared, [1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_answer_cache_hit_and_invalidation_on_upload(client):
+    sid = new_session(client)
+    upload(client, sid)
+    first = chat(client, "what is a cached question?", sid)
+    again = chat(client, "what is a cached question?", sid)
+    assert first["mode"] == "session_rag"
+    assert again["mode"] == "session_rag_cached"
+    assert again["answer"] == first["answer"]
+    # another top_k is another scope
+    assert chat(client, "what is a cached question?", sid, top_k=2)["mode"] == "session_rag"
+
+    # new documents change the store version: the cached answer no longer applies
+    upload(client, sid, SAMPLE_PDF.replace("Medical_Words_Reference", "Softvenece Delta Software Solutions"))
+    assert chat(client, "what is a cached question?", sid)["mode"] == "session_rag"
@@ -0,0 +1,60 @@
+import json
+
+from conftest import chat, new_session, upload
+
+
+def test_upload_then_chat_answers_from_session(client):
+    from src.api.deps import FAKE_LLM_ANSWER
+    sid = new_session(client)
+    job = upload(client, sid)
+    assert job["status"] == "done", job["error"]
+    assert job["vectors_done"] > 0 and job["pages_done"] > 0
+
+    r = chat(client, "what does the reference define?", sid)
+    assert r["mode"] == "session_rag"
+    assert r["answer"] == FAKE_LLM_ANSWER
+    assert r["sources"] and {s["doc_name"] for s in r["sources"]} == {"Medical_Words_Reference.pdf"}
+    assert all(s["score"] is None or -1.0 <= s["score"] <= 1.0 for s in r["sources"])
+
+
+def test_chat_without_documents_is_llm_only(client):
+    assert chat(client, "hello there")["mode"] == "llm_only"
+    assert chat(client, "hello again", new_session(client))["mode"] == "llm_only"
+
+
+def test_chat_stream_sends_sources_tokens_then_done(client):
+    sid = new_session(client)
+    upload(client, sid)
+    with client.stream("POST", "/chat/stream", json={"query": "a streamed question", "session_id": sid,
+                                                      "use_global": False}) as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in r.read().decode().split("\n\n"):
+            if block.strip():
+                name, data = block.split("\n", 1)
+                events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    names = [name for name, _ in events]
+    assert names[0] == "sources" and names[-1] == "done"
+    assert "token" in names
+    assert events[0][1]["mode"] == "session_rag"
+    assert "ttft_ms" in events[-1][1]
+
+
+def test_answer_with_llm_blocks_for_sync_callers(client):
+    from langchain_core.documents import Document
+    from src.api import rag_service as rag
+    from src.api.deps import FAKE_LLM_ANSWER
+    usage = {}
+    docs = [Document(page_content="some context", metadata={"source": "a.pdf", "page": 0})]
+    assert rag.answer_with_llm(docs, "a sync question", usage) == FAKE_LLM_ANSWER
+    assert usage["chunks_out"] == 1
+
+
+def test_stats_and_metrics_do_not_load_the_embedding_model(client):
+    from src.api.deps import embeddings
+    embeddings.cache_clear()
+    assert client.get("/stats").status_code == 200
+    assert client.get("/metrics").status_code == 200
+    assert embeddings.cache_info().currsize == 0
+    embeddings()
+    assert "embedding_cache" in client.get("/stats").json()
@@ -0,0 +1,58 @@
+import json
+
+from conftest import chat, new_session, upload
+
+
+def batch(client, requests, **kw):
+    r = client.post("/chat/batch", json={"requests": requests, **kw})
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in r.text.splitlines()]
+
+
+def mode(response):
+    return response["mode"].removesuffix("_cached")
+
+
+def test_batch_answers_like_single_chats(client):
+    sid = new_session(client)
+    upload(client, sid)
+    queries = ["What is a symptom?", "Define diagnosis.", "What does chronic mean?"]
+    requests = [{"query": q, "session_id": sid, "use_global": False} for q in queries]
+    requests.append({"query": "hello there", "use_global": False})
+    lines = batch(client, requests, concurrency=2)
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+    assert all(line["error"] is None for line in lines)
+    for line, req in zip(lines, requests):
+        single = chat(client, req["query"], req.get("session_id"))
+        got = line["response"]
+        # either may be served from the answer cache (the batch fills it too)
+        assert mode(single) == mode(got)
+        assert (got["answer"], got["sources"]) == (single["answer"], single["sources"])
+    assert mode(lines[0]["response"]) == "session_rag" and mode(lines[3]["response"]) == "llm_only"
+
+
+def test_unordered_batch_returns_every_index_once(client):
+    lines = batch(client, [{"query": f"question {i}", "use_global": False} for i in range(6)], ordered=False)
+    assert sorted(line["index"] for line in lines) == list(range(6))
+
+
+def test_failed_item_does_not_fail_the_batch(client, monkeypatch):
+    from src.api import app as api
+    answer = api._answer
+
+    async def flaky(req, *prepared):
+        if req.query == "boom":
+            raise RuntimeError("provider down")
+        return await answer(req, *prepared)
+
+    monkeypatch.setattr(api, "_answer", flaky)
+    lines = batch(client, [{"query": "fine", "use_global": False}, {"query": "boom", "use_global": False}])
+    assert lines[0]["response"] and lines[0]["error"] is None
+    assert lines[1] == {"index": 1, "response": None, "error": "RuntimeError: provider down"}
+
+
+def test_oversized_batch_is_rejected(client):
+    from src.api.deps import CHAT_BATCH_MAX_SIZE
+    r = client.post("/chat/batch", json={"requests": [{"query": "q"}] * (CHAT_BATCH_MAX_SIZE + 1)})
+    assert r.status_code == 413
@@ -0,0 +1,41 @@
+from langchain_core.documents import Document
+
+from src.api.rag_service import count_tokens, pack_context
+
+WORDS = " ".join(f"word{i}" for i in range(400))
+
+
+def doc(text, score, page=0, source="a.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page, "score": score})
+
+
+def test_overlapping_chunks_of_a_page_are_stitched():
+    first, second = WORDS[:300], WORDS[250:600]  # the splitter's overlap: 50 characters
+    packed, stats = pack_context([doc(second, 0.8), doc(first, 0.9)], budget=0)
+    assert [d.page_content for d in packed] == [WORDS[:600]]
+    assert (stats["chunks_in"], stats["chunks_out"]) == (2, 1)
+
+
+def test_duplicates_are_dropped_and_other_pages_kept_apart():
+    text = WORDS[:200]
+    packed, _ = pack_context([doc(text, 0.9), doc(text, 0.5, source="b.pdf"), doc(text[20:120], 0.7),
+                              doc(WORDS[150:300], 0.6, page=1)], budget=0)
+    assert [(d.page_content, d.metadata["page"]) for d in packed] == [(text, 0), (WORDS[150:300], 1)]
+
+
+def test_budget_keeps_best_chunks_and_cuts_the_last_at_a_word():
+    chunks = [doc(WORDS[i * 500:(i + 1) * 500], score) for i, score in enumerate([0.2, 0.9, 0.5])]
+    for i, c in enumerate(chunks):
+        c.metadata["page"] = i
+    budget = count_tokens(chunks[1].page_content) + 60
+    packed, stats = pack_context(chunks, budget=budget)
+    assert [d.metadata["page"] for d in packed] == [1, 2]
+    assert packed[0].page_content == chunks[1].page_content
+    assert chunks[2].page_content.startswith(packed[1].page_content + " ")
+    assert stats["tokens_out"] <= budget and stats["truncated"]
+
+
+def test_too_little_room_drops_the_rest():
+    chunks = [doc(WORDS[:500], 0.9), doc(WORDS[500:1000], 0.5, page=1)]
+    packed, stats = pack_context(chunks, budget=count_tokens(WORDS[:500]) + 10)
+    assert [d.page_content for d in packed] == [WORDS[:500]] and stats["truncated"]
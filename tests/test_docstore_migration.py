@@ -0,0 +1,75 @@
+import os
+import threading
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from src.docstore import DOCSTORE_FILE, PICKLE_FILE, migrate_dir, migrate_tree
+from src.embed import HashEmbeddings
+from src.vectorstore import load_faiss, write_lock
+
+EMB = HashEmbeddings()
+DOCS = [Document(page_content=f"legacy chunk {i}", metadata={"source": "old.pdf", "page": i}) for i in range(20)]
+
+
+def legacy_store(path):
+    """A store as written before docs.sqlite: index.faiss + a pickled docstore."""
+    FAISS.from_documents(DOCS, EMB).save_local(str(path))
+    return str(path)
+
+
+def test_pickled_store_is_converted_on_load(tmp_path):
+    path = legacy_store(tmp_path / "store")
+    store = load_faiss(EMB, path)
+    assert os.path.exists(os.path.join(path, DOCSTORE_FILE))
+    assert os.path.exists(os.path.join(path, PICKLE_FILE))  # kept, unread from now on
+    assert store.similarity_search("legacy chunk 7", k=1)[0].page_content == "legacy chunk 7"
+    assert store.docstore.keyword_search("legacy", 3, 60)  # converted stores get the BM25 index too
+
+
+def test_conversion_does_not_wait_for_an_ingest(tmp_path):
+    path = legacy_store(tmp_path / "store")
+    holding, release = threading.Event(), threading.Event()
+
+    def ingest():
+        with write_lock(path):
+            holding.set()
+            release.wait(10)
+
+    writer = threading.Thread(target=ingest)
+    writer.start()
+    holding.wait(5)
+    loaded = []
+    reader = threading.Thread(target=lambda: loaded.append(load_faiss(EMB, path)))
+    reader.start()
+    reader.join(5)
+    try:
+        assert loaded and loaded[0].index.ntotal == len(DOCS)
+    finally:
+        release.set()
+        writer.join(5)
+
+
+def test_concurrent_conversions_publish_one_complete_docstore(tmp_path):
+    path = legacy_store(tmp_path / "store")
+    stores = []
+    threads = [threading.Thread(target=lambda: stores.append(load_faiss(EMB, path))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(stores) == 4
+    for store in stores:
+        assert sorted(store.docstore.search(i).page_content for i in store.index_to_docstore_id.values()) \
+            == sorted(d.page_content for d in DOCS)
+    assert not [f for f in os.listdir(path) if f.endswith(".tmp")]
+
+
+def test_migrate_tree_removes_the_pickles(tmp_path):
+    legacy_store(tmp_path / "a")
+    legacy_store(tmp_path / "b" / "nested")
+    done = migrate_tree(str(tmp_path))
+    assert sorted(done.values()) == [len(DOCS), len(DOCS)]
+    assert not os.path.exists(tmp_path / "a" / PICKLE_FILE)
+    assert migrate_dir(str(tmp_path / "a")) == 0  # nothing left to convert
+    assert load_faiss(EMB, str(tmp_path / "b" / "nested")).index.ntotal == len(DOCS)
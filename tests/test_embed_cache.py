@@ -0,0 +1,52 @@
+from src.embed import CachedEmbeddings, HashEmbeddings
+
+
+class Counting(HashEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.encoded = []
+
+    def embed_documents(self, texts):
+        self.encoded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_each_text_is_encoded_once(tmp_path):
+    model = Counting()
+    cache = CachedEmbeddings(model, str(tmp_path / "emb.sqlite"), "hash")
+    first = cache.embed_documents(["a", "b", "a"])
+    assert first == model.embed_documents(["a", "b", "a"])
+    model.encoded.clear()
+    assert cache.embed_documents(["b", "c"]) == [first[1], HashEmbeddings().embed_documents(["c"])[0]]
+    assert model.encoded == ["c"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_cache_persists_per_namespace(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    CachedEmbeddings(Counting(), path, "hash").embed_documents(["a"])
+    model = Counting()
+    CachedEmbeddings(model, path, "hash").embed_documents(["a"])
+    assert model.encoded == []
+    CachedEmbeddings(model, path, "other-model").embed_documents(["a"])
+    assert model.encoded == ["a"]
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path):
+    model = Counting()
+    cache = CachedEmbeddings(model, str(tmp_path / "emb.sqlite"), "hash", max_entries=2)
+    cache.embed_documents(["a"])
+    cache.embed_documents(["b"])
+    cache.embed_documents(["a"])  # a is now the most recently used
+    cache.embed_documents(["c"])
+    assert cache.stats() == {**cache.stats(), "entries": 2, "evictions": 1}
+    model.encoded.clear()
+    cache.embed_documents(["a", "c", "b"])
+    assert model.encoded == ["b"]
+
+
+def test_queries_bypass_the_cache(tmp_path):
+    model = Counting()
+    cache = CachedEmbeddings(model, str(tmp_path / "emb.sqlite"), "hash")
+    assert cache.embed_query("q") == model.embed_query("q")
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,86 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from conftest import chat, new_session, upload
+from src.api.file_index import FileIndex
+
+
+def chunks(n, page=0):
+    docs = [Document(page_content=f"chunk {i}", metadata={"page": page + i // 2}) for i in range(n)]
+    return docs, np.arange(n * 4, dtype=np.float32).reshape(n, 4)
+
+
+def record_file(index, file_hash, n=4, name="a.pdf"):
+    docs, vectors = chunks(n)
+    index.record(file_hash, 0, docs[:2], vectors[:2])
+    index.record(file_hash, 2, docs[2:], vectors[2:])
+    index.complete(file_hash, name, pages=(n + 1) // 2, chunks=n)
+    return docs, vectors
+
+
+def rows(index, file_hash):
+    return index._conn.execute("SELECT COUNT(*) FROM chunks WHERE file_hash = ?", (file_hash,)).fetchone()[0]
+
+
+def test_recorded_file_replays_page_by_page(tmp_path):
+    index = FileIndex(str(tmp_path / "files.sqlite"), "ns")
+    docs, vectors = chunks(4)
+    index.record("h1", 0, docs, vectors)
+    assert index.lookup("h1") is None  # not visible before complete()
+    index.complete("h1", "a.pdf", pages=2, chunks=4)
+    assert index.lookup("h1") == (2, 4)
+    pages = list(index.iter_pages("h1"))
+    assert [page for page, _, _ in pages] == [0, 1]
+    assert [d.page_content for _, part, _ in pages for d in part] == [d.page_content for d in docs]
+    assert np.array_equal(np.vstack([v for _, _, v in pages]), vectors)
+    # another namespace (embedding backend / chunking) does not see it
+    assert FileIndex(str(tmp_path / "files.sqlite"), "other").lookup("h1") is None
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    index = FileIndex(str(tmp_path / "files.sqlite"), "ns", max_files=2)
+    record_file(index, "h1")
+    record_file(index, "h2")
+    index.lookup("h1")
+    record_file(index, "h3")
+    assert index.lookup("h2") is None and rows(index, "h2") == 0
+    assert index.lookup("h1") and index.lookup("h3")
+    assert index.stats()["evictions"] == 1
+
+
+def test_rerecording_drops_rows_of_an_unfinished_ingest(tmp_path):
+    index = FileIndex(str(tmp_path / "files.sqlite"), "ns")
+    docs, vectors = chunks(6)
+    index.record("h1", 0, docs, vectors)  # crashed before complete()
+    record_file(index, "h1", n=4)
+    assert rows(index, "h1") == 4 and index.lookup("h1") == (2, 4)
+
+
+def test_stale_recordings_are_swept(tmp_path):
+    path = str(tmp_path / "files.sqlite")
+    index = FileIndex(path, "ns", stale_after=0)
+    docs, vectors = chunks(2)
+    index.record("gone", 0, docs, vectors)
+    record_file(index, "h1")
+    assert rows(index, "gone") == 0 and rows(index, "h1") == 4
+    assert index.stats()["swept"] == 1
+
+    # rows without a recording entry (written before it was tracked) are swept too
+    index.record("old", 0, docs, vectors)
+    with index._conn:
+        index._conn.execute("DELETE FROM recording")
+    index = FileIndex(path, "ns", stale_after=0)
+    record_file(index, "h2")
+    assert rows(index, "old") == 0 and rows(index, "h1") == 4
+
+
+def test_repeat_upload_replays_the_recorded_file(client):
+    from src.api.deps import file_index
+    first = upload(client, new_session(client))
+    hits = file_index().stats()["hits"]
+    sid = new_session(client)
+    again = upload(client, sid)
+    assert again["status"] == "done"
+    assert file_index().stats()["hits"] == hits + 1
+    assert (again["pages_done"], again["vectors_done"]) == (first["pages_done"], first["vectors_done"])
+    assert chat(client, "what is in the replayed file?", sid)["mode"] == "session_rag"
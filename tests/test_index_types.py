@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from src import vectorstore
+from src.embed import HashEmbeddings
+from src.vectorstore import compact, load_faiss, measure_recall, new_faiss, read_manifest, save_faiss
+
+EMB = HashEmbeddings()
+
+
+def docs(n, prefix="chunk"):
+    return [Document(page_content=f"{prefix} {i}", metadata={"source": "a.pdf", "page": i}) for i in range(n)]
+
+
+def vectors_of(chunks):
+    return np.asarray(EMB.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "fp16"])
+def test_every_index_type_finds_a_stored_chunk(tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(vectorstore, "INDEX_TRAIN_SIZE", 400)
+    chunks = docs(600)
+    store = new_faiss(chunks, EMB, index_type, vectors=vectors_of(chunks))
+    assert store.index_meta["index_type"] == index_type
+    save_faiss(store, str(tmp_path))
+    loaded = load_faiss(EMB, str(tmp_path))
+    assert loaded.index.ntotal == 600
+    assert loaded.index_meta["index_type"] == index_type
+    # approximate types may not rank the exact vector first
+    assert "chunk 17" in [d.page_content for d in loaded.similarity_search("chunk 17", k=5)]
+
+
+def test_recall_is_measured_on_held_out_queries():
+    import faiss
+    vectors = np.random.default_rng(1).standard_normal((2000, 64)).astype(np.float32)
+    assert measure_recall(faiss.IndexFlatL2(64), vectors) == 1.0
+    pq = faiss.index_factory(64, "PQ8x4")
+    pq.train(vectors)
+    # a query that was in the index would always find itself; held out, coarse PQ misses neighbours
+    assert 0.0 < measure_recall(pq, vectors) < 0.9
+    assert pq.ntotal == 0  # measured on a copy
+
+
+def test_small_store_starts_flat_and_compaction_trains_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "INDEX_TRAIN_SIZE", 400)
+    first = docs(100)
+    store = new_faiss(first, EMB, "ivf_flat", vectors=vectors_of(first))
+    assert store.index_meta == {**store.index_meta, "index_type": "flat", "target_type": "ivf_flat"}
+    save_faiss(store, str(tmp_path))
+    assert not compact(EMB, str(tmp_path))  # too small to train yet
+
+    for part in range(3):
+        more = docs(150, prefix=f"part{part}")
+        vectorstore.append_faiss(new_faiss(more, EMB, "flat", vectors=vectors_of(more)), str(tmp_path))
+    assert compact(EMB, str(tmp_path))
+    manifest = read_manifest(str(tmp_path))
+    assert manifest["index_meta"]["index_type"] == "ivf_flat"
+    assert len(manifest["segments"]) == 1 and manifest["segments"][0]["ntotal"] == 550
+    loaded = load_faiss(EMB, str(tmp_path))
+    assert loaded.similarity_search("part2 7", k=1)[0].page_content == "part2 7"
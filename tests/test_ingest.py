@@ -0,0 +1,38 @@
+import os
+
+from conftest import ROOT, SAMPLE_PDF
+from src import ingest
+from src.ingest import iter_pdf_chunks, load_pdf
+from src.splitter import split_documents
+
+OTHER_PDF = os.path.join(ROOT, "data", "Softvenece Delta Software Solutions.pdf")
+
+
+def flatten(parts):
+    return [(c.page_content, c.metadata) for _, _, chunks in parts for c in chunks]
+
+
+def test_parallel_parse_matches_serial_loader():
+    paths = [SAMPLE_PDF, OTHER_PDF]
+    expected = [(c.page_content, c.metadata) for p in paths for c in split_documents(load_pdf(p))]
+    parts = list(iter_pdf_chunks(paths, workers=2, pages_per_task=3))
+    assert flatten(parts) == expected
+    assert flatten(iter_pdf_chunks(paths)) == expected
+    # every page is accounted for exactly once, file by file
+    pages = {}
+    for path, n, _ in parts:
+        pages[path] = pages.get(path, 0) + n
+    assert pages == {p: len(load_pdf(p)) for p in paths}
+
+
+def test_start_pages_resume_mid_file():
+    full = flatten(iter_pdf_chunks([SAMPLE_PDF], workers=2, pages_per_task=2))
+    resumed = flatten(iter_pdf_chunks([SAMPLE_PDF], workers=2, pages_per_task=2, start_pages={SAMPLE_PDF: 4}))
+    assert resumed == [c for c in full if c[1]["page"] >= 4]
+
+
+def test_pool_is_reused_until_worker_count_changes():
+    pool = ingest._get_pool(2)
+    assert ingest._get_pool(2) is pool
+    other = ingest._get_pool(3)
+    assert other is not pool and ingest._get_pool(3) is other
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from conftest import SAMPLE_PDF, new_session, wait_job
+from src.api.jobs import JobManager, QueueFull
+
+
+def wait(manager, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def test_jobs_of_one_session_run_in_order(tmp_path):
+    manager = JobManager(max_workers=4, path=str(tmp_path / "jobs.sqlite"))
+    ran = []
+
+    def work(i):
+        def fn(job):
+            time.sleep(0.02 * (3 - i))  # later jobs are quicker: order comes from the queue
+            ran.append(i)
+        return fn
+
+    jobs = [manager.submit("s1", [f"{i}.pdf"], work(i)) for i in range(3)]
+    for job in jobs:
+        assert wait(manager, job.job_id).status == "done"
+    assert ran == [0, 1, 2]
+    deadline = time.monotonic() + 5
+    while manager.busy("s1") and time.monotonic() < deadline:
+        time.sleep(0.01)  # the drainer lets go of the session right after the last job
+    assert not manager.busy("s1")
+    manager.shutdown()
+
+
+def test_failed_job_records_error(tmp_path):
+    manager = JobManager(path=str(tmp_path / "jobs.sqlite"))
+    job = wait(manager, manager.submit("s1", ["a.pdf"], lambda job: 1 / 0).job_id)
+    assert job.status == "failed"
+    assert job.error.startswith("ZeroDivisionError")
+    assert job.finished_at >= job.started_at
+    manager.shutdown()
+
+
+def test_queue_full(tmp_path):
+    release = threading.Event()
+    manager = JobManager(max_workers=1, max_pending=2)
+    manager.submit("s1", [], lambda job: release.wait())
+    manager.submit("s2", [], lambda job: release.wait())
+    with pytest.raises(QueueFull):
+        manager.submit("s3", [], lambda job: None)
+    release.set()
+    manager.shutdown()
+
+
+def test_other_process_reads_job_state(tmp_path):
+    # two managers on one jobs.sqlite stand in for two API worker processes
+    path = str(tmp_path / "jobs.sqlite")
+    runner, reader = JobManager(path=path, progress_interval=0), JobManager(path=path)
+    started, release = threading.Event(), threading.Event()
+
+    def fn(job):
+        job.progress(pages=2, chunks=5, vectors=5)
+        started.set()
+        release.wait()
+
+    job = runner.submit("s1", ["a.pdf"], fn)
+    assert started.wait(5)
+    seen = reader.get(job.job_id)
+    assert (seen.status, seen.pages_done, seen.chunks_done, seen.files) == ("running", 2, 5, ["a.pdf"])
+    release.set()
+    assert wait(reader, job.job_id).status == "done"
+    assert reader.get("unknown") is None
+    runner.shutdown()
+    reader.shutdown()
+
+
+def test_finished_jobs_are_trimmed(tmp_path):
+    manager = JobManager(keep_finished=2, path=str(tmp_path / "jobs.sqlite"))
+    ids = []
+    for i in range(4):
+        ids.append(manager.submit("s1", [], lambda job: None).job_id)
+        wait(manager, ids[-1])
+    manager.submit("s1", [], lambda job: None)  # trimming happens on submit
+    assert manager.get(ids[0]) is None
+    assert manager.get(ids[-1]) is not None
+    manager.shutdown()
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/nope").status_code == 404
+
+
+def test_upload_returns_before_ingest_and_job_reports_chunks(client):
+    with open(SAMPLE_PDF, "rb") as f:
+        r = client.post("/upload", data={"session_id": new_session(client)},
+                        files=[("files", ("a.pdf", f, "application/pdf"))])
+    body = r.json()
+    assert r.status_code == 200 and body["files_ingested"] == ["a.pdf"]
+    # still part of the response, but the count is only known once the job ran
+    assert body["chunks_added"] is None and body["job_id"]
+    job = wait_job(client, body["job_id"])
+    assert job["status"] == "done" and job["chunks_done"] > 0
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from src.api.llm_gateway import LLMGateway
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class FakeModel:
+    """Answers "echo: <prompt>" after delay; raises the queued errors first."""
+
+    def __init__(self, delay=0.05, errors=()):
+        self.delay = delay
+        self.errors = list(errors)
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return SimpleNamespace(content=f"echo: {prompt}")
+        finally:
+            self.active -= 1
+
+    async def astream(self, prompt):
+        if self.errors:
+            raise self.errors.pop(0)
+        for word in f"echo: {prompt}".split(" "):
+            yield SimpleNamespace(content=word)
+
+
+@pytest.fixture
+def gateway():
+    gateways = []
+
+    def make(model, **kw):
+        gateways.append(LLMGateway(model, base_delay=0.01, max_delay=0.05, **kw))
+        return gateways[-1]
+
+    yield make
+    for g in gateways:
+        g.close()
+
+
+def test_identical_prompts_in_flight_share_one_call(gateway):
+    model = FakeModel(delay=0.2)
+    g = gateway(model)
+    with ThreadPoolExecutor(8) as pool:
+        answers = list(pool.map(g.invoke, ["same"] * 6 + ["other"] * 2))
+    assert answers == ["echo: same"] * 6 + ["echo: other"] * 2
+    assert sorted(model.prompts) == ["other", "same"]
+    assert g.stats()["coalesced"] == 6
+
+
+def test_concurrency_is_capped(gateway):
+    model = FakeModel(delay=0.05)
+    g = gateway(model, max_concurrency=3)
+    with ThreadPoolExecutor(12) as pool:
+        list(pool.map(g.invoke, [f"prompt {i}" for i in range(12)]))
+    assert model.peak == 3 and len(model.prompts) == 12
+
+
+def test_retryable_errors_are_retried(gateway):
+    model = FakeModel(delay=0, errors=[ProviderError(429), ProviderError(503)])
+    g = gateway(model)
+    assert g.invoke("hi") == "echo: hi"
+    assert g.stats() == {**g.stats(), "calls": 3, "retries": 2, "failures": 0}
+
+
+def test_retry_after_is_honoured(gateway):
+    model = FakeModel(delay=0, errors=[ProviderError(429, retry_after="0.3")])
+    g = gateway(model)
+    start = time.perf_counter()
+    g.invoke("hi")
+    assert time.perf_counter() - start >= 0.3
+
+
+def test_other_errors_and_exhausted_retries_fail(gateway):
+    g = gateway(FakeModel(delay=0, errors=[ProviderError(400)]))
+    with pytest.raises(ProviderError):
+        g.invoke("bad request")
+    assert g.stats()["calls"] == 1 and g.stats()["failures"] == 1
+    g = gateway(FakeModel(delay=0, errors=[ProviderError(500)] * 3), max_retries=2)
+    with pytest.raises(ProviderError):
+        g.invoke("down")
+    assert g.stats()["calls"] == 3
+
+
+def test_stream_retries_only_before_the_first_token(gateway):
+    async def collect(g, prompt):
+        return [token async for token in g.astream(prompt)]
+
+    g = gateway(FakeModel(errors=[ProviderError(503)]))
+    assert asyncio.run(collect(g, "hi")) == ["echo:", "hi"]
+    assert g.stats()["retries"] == 1
+
+    class BreaksMidStream(FakeModel):
+        async def astream(self, prompt):
+            yield SimpleNamespace(content="echo:")
+            raise ProviderError(503)
+
+    # tokens already went out: a retry would repeat them
+    g = gateway(BreaksMidStream())
+    with pytest.raises(ProviderError):
+        asyncio.run(collect(g, "hi"))
+    assert g.stats()["retries"] == 0
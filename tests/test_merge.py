@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+
+from src.api import rag_service as rag
+from src.embed import HashEmbeddings
+from src.vectorstore import new_faiss, save_faiss
+
+EMB = HashEmbeddings()
+
+
+def doc(text, page=0, source="a.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_merge_orders_by_score_across_stores_and_cuts_to_k():
+    session = [(doc("s1"), 0.9), (doc("s2"), 0.5)]
+    global_ = [(doc("g1", source="g.pdf"), 0.7), (doc("g2", source="g.pdf"), 0.1)]
+    merged = rag.merge_results([session, global_], k=3)
+    assert [d.page_content for d in merged] == ["s1", "g1", "s2"]
+    assert [d.metadata["score"] for d in merged] == [0.9, 0.7, 0.5]
+    assert "score" not in session[0][0].metadata  # copies: the stores' documents are untouched
+
+
+def test_merge_drops_duplicates_and_overlapping_neighbours():
+    text = "The heart pumps blood through the body. " * 3
+    hits = [
+        (doc(text), 0.9),
+        (doc(text, source="other.pdf"), 0.8),                     # same text from another store
+        (doc(text[40:] + "Veins return it.", page=0), 0.7),       # next chunk of the same page, mostly overlap
+        (doc(text[40:] + "Veins return it.", page=1), 0.6),       # same overlap, different page: kept
+        (doc("Arteries carry it away."), 0.5),
+    ]
+    merged = rag.merge_results([hits[:2], hits[2:]], k=4)
+    assert [(d.metadata["page"], d.metadata["score"]) for d in merged] == [(0, 0.9), (1, 0.6), (0, 0.5)]
+
+
+def test_session_and_global_stores_are_searched_together(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag, "HYBRID_SEARCH", False)
+    session_dir, global_dir = str(tmp_path / "session"), str(tmp_path / "global")
+    save_faiss(new_faiss([doc(f"session chunk {i}") for i in range(5)], EMB), session_dir)
+    save_faiss(new_faiss([doc(f"global chunk {i}", source="g.pdf") for i in range(5)], EMB), global_dir)
+    for query in ("session chunk 3", "global chunk 3"):
+        found = rag.retrieve(query, [session_dir, global_dir], k=4)
+        assert found[0].page_content == query and len(found) == 4
+        assert [d.metadata["score"] for d in found] == sorted((d.metadata["score"] for d in found), reverse=True)
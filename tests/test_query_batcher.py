@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from src.api.query_batcher import QueryBatcher
+from src.embed import HashEmbeddings
+
+
+class PrefixedQueries(Embeddings):
+    """A model whose queries encode differently from its documents."""
+
+    def __init__(self):
+        self.hash = HashEmbeddings()
+
+    def embed_documents(self, texts):
+        return self.hash.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.hash.embed_query("query: " + text)
+
+
+def test_batched_queries_use_query_encoding():
+    model = PrefixedQueries()
+    batcher = QueryBatcher(model, window_ms=20)
+    try:
+        texts = [f"question {i}" for i in range(8)] * 2
+        with ThreadPoolExecutor(len(texts)) as pool:
+            vectors = list(pool.map(batcher.embed, texts))
+    finally:
+        batcher.close()
+    assert vectors == [model.embed_query(t) for t in texts]
+    assert vectors[0] != model.embed_documents(["question 0"])[0]
+
+
+def test_models_with_symmetric_encoding_batch_in_one_call():
+    calls = []
+
+    class Counting(HashEmbeddings):
+        def embed_documents(self, texts):
+            calls.append(len(texts))
+            return super().embed_documents(texts)
+
+    model = Counting()
+    batcher = QueryBatcher(model, window_ms=50, max_batch=4)
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            vectors = list(pool.map(batcher.embed, ["a", "b", "c", "d"]))
+    finally:
+        batcher.close()
+    assert vectors == [model.embed_query(t) for t in "abcd"]
+    assert sum(calls) == 4 and len(calls) < 4
@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import SAMPLE_PDF
+from src.api import rag_service as rag
+from src.api.deps import embeddings
+from src.vectorstore import load_faiss
+
+
+class Crash(Exception):
+    pass
+
+
+def contents(dir_path):
+    store = load_faiss(embeddings(), dir_path)
+    docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+    return sorted((d.metadata["page"], d.page_content) for d in docs)
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # a checkpoint after every few chunks; every page is parsed (no file index replay)
+    monkeypatch.setattr(rag, "INGEST_BATCH_SIZE", 4)
+    monkeypatch.setattr(rag, "INGEST_CHECKPOINT_BATCHES", 1)
+    monkeypatch.setattr(rag, "FILE_INDEX_MAX_FILES", 0)
+
+
+def test_crashed_ingest_resumes_from_its_last_checkpoint(tmp_path, small_batches):
+    expected_dir = str(tmp_path / "clean")
+    rag.ingest_into_store(expected_dir, [SAMPLE_PDF])
+
+    dir_path = str(tmp_path / "crashed")
+    done = {"pages": 0, "vectors": 0}
+
+    def crash_midway(pages=0, chunks=0, vectors=0):
+        done["pages"] += pages
+        done["vectors"] += vectors
+        if done["vectors"] >= 6:
+            raise Crash()
+
+    with pytest.raises(Crash):
+        rag.ingest_into_store(dir_path, [SAMPLE_PDF], progress=crash_midway)
+    committed = rag._load_ingest_state(dir_path)[rag.file_sha256(SAMPLE_PDF)]
+    assert 0 < committed["pages"] < 11 and not committed.get("done")
+
+    resumed = {"pages": []}
+    rag.ingest_into_store(dir_path, [SAMPLE_PDF], progress=lambda pages=0, **kw: resumed["pages"].append(pages))
+    assert resumed["pages"][0] == committed["pages"]  # pages committed before the crash are not parsed again
+    assert sum(resumed["pages"]) == 11
+    assert contents(dir_path) == contents(expected_dir)
+
+
+def test_finished_file_is_not_ingested_again(tmp_path, small_batches):
+    dir_path = str(tmp_path / "store")
+    added = rag.ingest_into_store(dir_path, [SAMPLE_PDF])
+    assert added > 0
+    assert rag.ingest_into_store(dir_path, [SAMPLE_PDF]) == 0
+    assert len(contents(dir_path)) == added
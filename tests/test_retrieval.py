@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from src.api import rag_service as rag
+from src.embed import HashEmbeddings
+from src.vectorstore import append_faiss, load_faiss, new_faiss, save_faiss
+
+EMB = HashEmbeddings()
+
+
+def doc(text, page=0, source="a.pdf", doc_id=None):
+    return Document(id=doc_id, page_content=text, metadata={"source": source, "page": page})
+
+
+def make_store(path, *segments):
+    """A store at path with one segment per list of texts."""
+    for i, texts in enumerate(segments):
+        chunks = [doc(t, page=j, doc_id=f"{i}-{j}") for j, t in enumerate(texts)]
+        vectors = np.asarray(EMB.embed_documents(texts), dtype=np.float32)
+        (save_faiss if i == 0 else append_faiss)(new_faiss(chunks, EMB, "flat", vectors=vectors), str(path))
+    return str(path)
+
+
+FILLER = [f"filler text number {i} about nothing in particular" for i in range(30)]
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return make_store(
+        tmp_path / "store",
+        FILLER[:15] + ["the zebra crossed the road"],
+        FILLER[15:] + ["a zebra and another zebra at the zoo"],
+    )
+
+
+def test_keyword_search_fuses_segments_by_rank(store_dir):
+    store = load_faiss(EMB, store_dir)
+    hits = store.docstore.keyword_search("zebra", 4, rrf_k=10)
+    # each segment's best hit is rank 1 there: BM25 scores of different segments are never compared
+    assert sorted(d.page_content for d, _ in hits) == ["a zebra and another zebra at the zoo",
+                                                       "the zebra crossed the road"]
+    assert [score for _, score in hits] == [1 / 11, 1 / 11]
+    only = store.docstore.keyword_search("zebra", 4, rrf_k=10, allowed=["0-15"])
+    assert [d.id for d, _ in only] == ["0-15"]
+
+
+def test_fuse_rrf_sums_reciprocal_ranks():
+    a, b, c = doc("a", doc_id="a"), doc("b", doc_id="b"), doc("c", doc_id="c")
+    fused = dict((d.id, s) for d, s in rag.fuse_rrf([[a, b], [b, c]], k=10))
+    assert fused == pytest.approx({"a": 1 / 11, "b": 1 / 12 + 1 / 11, "c": 1 / 12})
+
+
+def test_hybrid_retrieval_finds_keyword_only_hits(store_dir, monkeypatch):
+    monkeypatch.setattr(rag, "HYBRID_SEARCH", True)
+    # hash embeddings carry no meaning: only BM25 can find the zebra chunks
+    found = rag.retrieve_by_vector(EMB.embed_query("zebra"), [store_dir], k=4, query="zebra")
+    texts = [d.page_content for d in found]
+    assert "the zebra crossed the road" in texts and "a zebra and another zebra at the zoo" in texts
+    for d in found:
+        assert d.metadata["fused_score"] > 0
+        assert d.metadata["score"] is None or -1.0 <= d.metadata["score"] <= 1.0
+    assert [d.metadata["fused_score"] for d in found] == sorted((d.metadata["fused_score"] for d in found),
+                                                               reverse=True)
+
+
+def test_rrf_k_setting_reaches_the_keyword_side(store_dir, monkeypatch):
+    monkeypatch.setattr(rag, "RRF_K", 5)
+    hits = rag.keyword_search_store(store_dir, "zebra", 4)
+    assert [score for _, score in hits] == [1 / 6, 1 / 6]
@@ -0,0 +1,73 @@
+import os
+
+from langchain_core.documents import Document
+
+from src.embed import HashEmbeddings
+from src.vectorstore import (
+    append_faiss, compact, load_faiss, new_faiss, plan_compaction, read_manifest, save_faiss,
+)
+
+EMB = HashEmbeddings()
+
+
+def chunks(prefix, n):
+    return [Document(page_content=f"{prefix} {i}", metadata={"source": "a.pdf", "page": i}) for i in range(n)]
+
+
+def segment_dirs(path):
+    return sorted(d for d in os.listdir(path) if d.startswith("seg-"))
+
+
+def test_plan_compaction_merges_similar_sized_tail():
+    assert plan_compaction([]) == 0
+    assert plan_compaction([100]) == 1
+    assert plan_compaction([1000, 10]) == 2          # a small append alone is not worth a merge
+    assert plan_compaction([1000, 10, 10]) == 1      # ...but two of them are
+    assert plan_compaction([100, 100]) == 0
+    assert plan_compaction([1000, 300, 10, 10]) == 2  # bigger segments wait until the tail catches up
+
+
+def test_appends_add_segments_and_publish_a_new_version(tmp_path):
+    path = str(tmp_path)
+    save_faiss(new_faiss(chunks("base", 10), EMB), path)
+    before = load_faiss(EMB, path)
+    append_faiss(new_faiss(chunks("more", 5), EMB), path)
+    append_faiss(new_faiss(chunks("last", 5), EMB), path)
+
+    manifest = read_manifest(path)
+    assert manifest["version"] == 3
+    assert [s["ntotal"] for s in manifest["segments"]] == [10, 5, 5]
+    assert segment_dirs(path) == sorted(s["name"] for s in manifest["segments"])
+    after = load_faiss(EMB, path)
+    assert after.index.ntotal == 20 and after.manifest_version == 3
+    assert after.similarity_search("last 3", k=1)[0].page_content == "last 3"
+    # a store loaded earlier keeps serving the version it was loaded at
+    assert before.index.ntotal == 10 and before.manifest_version == 1
+
+
+def test_compaction_merges_segments_and_removes_the_old_ones(tmp_path):
+    path = str(tmp_path)
+    save_faiss(new_faiss(chunks("base", 10), EMB), path)
+    for part in range(3):
+        append_faiss(new_faiss(chunks(f"part{part}", 4), EMB), path)
+    old = segment_dirs(path)
+    assert compact(EMB, path)
+    manifest = read_manifest(path)
+    assert manifest["version"] == 5
+    assert [s["ntotal"] for s in manifest["segments"]] == [22]
+    assert segment_dirs(path) == [manifest["segments"][0]["name"]] and not set(old) & set(segment_dirs(path))
+    assert not compact(EMB, path)  # nothing left to merge
+    store = load_faiss(EMB, path)
+    texts = sorted(store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values())
+    assert texts == sorted(c.page_content for c in chunks("base", 10) + [c for p in range(3) for c in chunks(f"part{p}", 4)])
+
+
+def test_save_replaces_every_segment(tmp_path):
+    path = str(tmp_path)
+    save_faiss(new_faiss(chunks("old", 10), EMB), path)
+    append_faiss(new_faiss(chunks("old more", 3), EMB), path)
+    save_faiss(new_faiss(chunks("new", 4), EMB), path)
+    manifest = read_manifest(path)
+    assert manifest["version"] == 3 and [s["ntotal"] for s in manifest["segments"]] == [4]
+    assert len(segment_dirs(path)) == 1
+    assert load_faiss(EMB, path).index.ntotal == 4
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from conftest import SAMPLE_PDF
+from src.api.sessions import SessionManager
+
+
+def manager(tmp_path, usage=None, busy=(), **kw):
+    evicted = []
+    sm = SessionManager(
+        str(tmp_path / "sessions.sqlite"), evict=evicted.append,
+        usage=usage or (lambda sid: (0, 0, True)), busy=lambda sid: sid in busy,
+        reserved=("global", "shared"), touch_interval=0, **kw,
+    )
+    return sm, evicted
+
+
+def test_sweep_evicts_idle_sessions_only_with_ttl(tmp_path):
+    sm, evicted = manager(tmp_path)
+    sm.register("old", last_access=time.time() - 3600)
+    assert sm.sweep() == {"ttl": 0, "quota": 0, "memory": 0}  # ttl 0: expiry is opt-in
+    sm, evicted = manager(tmp_path, ttl=60)
+    sm.register("new")
+    assert sm.sweep() == {"ttl": 1, "quota": 0, "memory": 0}
+    assert evicted == ["old"]
+    assert sm.sweep() == {"ttl": 0, "quota": 0, "memory": 0}  # forgotten once evicted
+
+
+def test_touch_keeps_session_alive(tmp_path):
+    sm, evicted = manager(tmp_path, ttl=60)
+    sm.register("s1", last_access=time.time() - 3600)
+    sm.touch("s1")
+    sm.sweep()
+    assert evicted == []
+
+
+def test_busy_sessions_are_never_evicted(tmp_path):
+    sm, evicted = manager(tmp_path, busy={"s1"}, ttl=60)
+    sm.register("s1", last_access=time.time() - 3600)
+    sm.sweep()
+    assert evicted == []
+    assert sm.stats()["states"]["indexing"]["sessions"] == 1
+
+
+def test_quota_evicts_least_recently_used(tmp_path):
+    now = time.time()
+    sm, evicted = manager(tmp_path, usage=lambda sid: (400, 100, True), disk_quota=1200)
+    for i, sid in enumerate(["a", "b", "c"]):
+        sm.register(sid, last_access=now - 100 + i)
+    assert sm.sweep() == {"ttl": 0, "quota": 1, "memory": 0}
+    assert evicted == ["a"]
+    assert sm.stats()["total_bytes"] == 1000
+
+
+def test_upload_starting_mid_sweep_keeps_its_session(tmp_path):
+    uploads = ["s1"]
+
+    def usage(sid):
+        # an upload pins the session after the sweep has sized it
+        if sid in uploads:
+            uploads.remove(sid)
+            sm.pin(sid)
+        return 0, 0, True
+
+    sm, evicted = manager(tmp_path, usage=usage, ttl=60)
+    sm.register("s1", last_access=time.time() - 3600)
+    assert sm.sweep()["ttl"] == 0 and evicted == []
+    sm.unpin("s1")
+    sm.sweep()
+    assert evicted == ["s1"]
+
+
+def test_pin_waits_for_an_eviction_under_way(tmp_path):
+    started, release, order = threading.Event(), threading.Event(), []
+
+    def evict(sid):
+        started.set()
+        release.wait(5)
+        order.append("evicted")
+
+    sm = SessionManager(str(tmp_path / "sessions.sqlite"), evict=evict, usage=lambda sid: (0, 0, True),
+                        busy=lambda sid: False, ttl=60)
+    sm.register("s1", last_access=time.time() - 3600)
+    sweep = threading.Thread(target=sm.sweep)
+    sweep.start()
+    started.wait(5)
+    upload = threading.Thread(target=lambda: (sm.pin("s1"), order.append("pinned")))
+    upload.start()
+    time.sleep(0.1)
+    assert order == []
+    release.set()
+    sweep.join(5)
+    upload.join(5)
+    assert order == ["evicted", "pinned"]
+
+
+def test_memory_quota_unloads_least_recently_used(tmp_path):
+    now = time.time()
+    loaded = {"a": 300, "b": 300, "c": 300}
+    sm, evicted = manager(tmp_path, memory=lambda sid: loaded.get(sid, 0), unload=lambda sid: loaded.pop(sid),
+                          memory_quota=700)
+    for i, sid in enumerate(["a", "b", "c"]):
+        sm.register(sid, last_access=now - 100 + i)
+    assert sm.sweep() == {"ttl": 0, "quota": 0, "memory": 1}
+    assert sorted(loaded) == ["b", "c"] and evicted == []  # unloaded, not deleted
+    stats = sm.stats()
+    assert stats["memory_bytes"] == 600 and stats["states"]["ready"]["memory_bytes"] == 600
+    assert stats["memory_quota_bytes"] == 700
+
+
+def test_reserved_ids_are_never_tracked(tmp_path):
+    sm, evicted = manager(tmp_path, ttl=60)
+    with pytest.raises(ValueError):
+        sm.register("global")
+    sm.discover([("shared", time.time() - 3600), ("s1", time.time() - 3600)])
+    sm.sweep()
+    assert evicted == ["s1"]
+
+
+def test_reserved_session_ids_are_rejected(client):
+    with open(SAMPLE_PDF, "rb") as f:
+        r = client.post("/upload", data={"session_id": "global"},
+                        files=[("files", ("a.pdf", f, "application/pdf"))])
+    assert r.status_code == 400
+    assert client.delete("/sessions/shared").status_code == 400
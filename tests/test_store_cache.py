@@ -0,0 +1,92 @@
+import os
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+
+from src.api.store_cache import StoreCache, estimate_bytes
+from src.vectorstore import MANIFEST_FILE
+
+
+def commit(dir_path, version):
+    """Publish a new manifest the way a writer does (new file renamed into place)."""
+    os.makedirs(dir_path, exist_ok=True)
+    tmp = os.path.join(dir_path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(f'{{"version": {version}}}')
+    os.replace(tmp, os.path.join(dir_path, MANIFEST_FILE))
+    return str(dir_path)
+
+
+def fake_store(n):
+    index = faiss.IndexFlatL2(8)
+    index.add(np.zeros((n, 8), dtype=np.float32))
+    return SimpleNamespace(index=index, index_to_docstore_id={i: str(i) for i in range(n)})
+
+
+class Loader:
+    def __init__(self, n=10):
+        self.n = n
+        self.loads = []
+
+    def __call__(self, dir_path):
+        self.loads.append(os.path.basename(dir_path))
+        return fake_store(self.n)
+
+
+def test_hit_until_the_store_changes(tmp_path):
+    loader = Loader()
+    cache = StoreCache(loader)
+    a = commit(tmp_path / "a", 1)
+    first = cache.get(a)
+    assert cache.get(a) is first and loader.loads == ["a"]
+    commit(a, 2)
+    assert cache.get(a) is not first and loader.loads == ["a", "a"]
+    assert cache.stats() == {**cache.stats(), "hits": 1, "misses": 2, "invalidations": 1}
+
+
+def test_missing_store_is_none_and_dropped(tmp_path):
+    cache = StoreCache(Loader())
+    a = commit(tmp_path / "a", 1)
+    cache.get(a)
+    os.remove(os.path.join(a, MANIFEST_FILE))
+    assert cache.get(a) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_store_is_evicted(tmp_path):
+    loader = Loader()
+    cache = StoreCache(loader, max_entries=2)
+    a, b, c = (commit(tmp_path / name, 1) for name in "abc")
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(c)
+    assert cache.stats()["evictions"] == 1
+    cache.get(a)
+    cache.get(b)  # b was evicted: loaded again
+    assert loader.loads == ["a", "b", "c", "b"]
+
+
+def test_byte_bound_keeps_the_newest_store(tmp_path):
+    size = estimate_bytes(fake_store(100))
+    cache = StoreCache(Loader(100), max_entries=8, max_bytes=size * 2)
+    dirs = [commit(tmp_path / name, 1) for name in "abc"]
+    for d in dirs:
+        cache.get(d)
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] == size * 2
+    assert cache.bytes_of(dirs[0]) == 0 and cache.bytes_of(dirs[2]) == size
+    # a store bigger than the bound on its own still stays loaded
+    cache = StoreCache(Loader(100), max_bytes=size // 2)
+    cache.get(dirs[0])
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidate_drops_the_entry(tmp_path):
+    loader = Loader()
+    cache = StoreCache(loader)
+    a = commit(tmp_path / "a", 1)
+    cache.get(a)
+    cache.invalidate(a)
+    cache.get(a)
+    assert loader.loads == ["a", "a"]
@@ -0,0 +1,55 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stress_store import check_store, reference_counts
+from conftest import ROOT, chat, new_session, upload
+from src import vectorstore
+from src.api import rag_service as rag
+from src.vectorstore import load_faiss, plan_compaction, read_manifest
+
+FILES = sorted(os.path.join(ROOT, "data", f) for f in os.listdir(os.path.join(ROOT, "data"))
+               if f.lower().endswith(".pdf"))
+
+
+def test_concurrent_uploads_and_chats_leave_a_consistent_store(client, monkeypatch):
+    commits = {"append": 0, "compact": 0}
+    lock = threading.Lock()
+
+    def counted(fn, key):
+        def wrapper(*args, **kwargs):
+            changed = fn(*args, **kwargs)
+            if changed is not False:
+                with lock:
+                    commits[key] += 1
+            return changed
+        return wrapper
+
+    # every append and every merge publishes one manifest version
+    monkeypatch.setattr(rag, "append_faiss", counted(rag.append_faiss, "append"))
+    monkeypatch.setattr(vectorstore, "compact", counted(vectorstore.compact, "compact"))
+
+    sid = new_session(client)
+    plan = FILES * 2  # each file twice: the repeat must not be indexed again
+    with ThreadPoolExecutor(len(plan)) as uploads, ThreadPoolExecutor(4) as chats:
+        jobs = [uploads.submit(upload, client, sid, p) for p in plan]
+        answers = [chats.submit(chat, client, f"question {i} about the documents", sid) for i in range(16)]
+        assert [j.result()["status"] for j in jobs] == ["done"] * len(plan)
+        assert all(a.result()["answer"] for a in answers)
+    if vectorstore._compactor is not None:
+        vectorstore._compactor.submit(lambda: None).result()  # let scheduled merges finish
+
+    from src.api.deps import embeddings, session_dir
+    store_dir = session_dir(sid)
+    problems, summary = check_store(store_dir, [os.path.basename(p) for p in FILES])
+    assert problems == []
+    assert summary["chunks_per_file"] == reference_counts(FILES, distinct=False)
+
+    manifest = read_manifest(store_dir)
+    assert summary["version"] == manifest["version"] == commits["append"] + commits["compact"]
+    sizes = [seg["ntotal"] for seg in manifest["segments"]]
+    assert summary["segments"] == len(sizes) == len([d for d in os.listdir(store_dir) if d.startswith("seg-")])
+    assert plan_compaction(sizes) == len(sizes)  # nothing left to merge
+    assert summary["vectors"] == sum(sizes) == sum(summary["chunks_per_file"].values())
+    store = load_faiss(embeddings(), store_dir)
+    assert store.index.ntotal == summary["vectors"] and store.manifest_version == manifest["version"]
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from conftest import ROOT, SAMPLE_PDF
+from src.api import rag_service as rag
+from src.api.tenancy import TenantIndex
+
+OTHER_PDF = os.path.join(ROOT, "data", "Softvenece Delta Software Solutions.pdf")
+
+
+def test_membership_is_per_session_and_tombstoned_on_delete(tmp_path):
+    index = TenantIndex(str(tmp_path / "tenants.sqlite"))
+    index.create("a")
+    index.create("b")
+    index.commit_chunks("a", {"file1": ["c1", "c2"]})
+    index.commit_chunks("b", {"file1": ["c1", "c2"], "file2": ["c3"]})
+    assert sorted(index.member_ids("a")) == ["c1", "c2"]
+    assert index.committed(["c1", "c3", "c9"]) == {"c1", "c3"}
+    assert sorted(index.file_chunks("file1")) == ["c1", "c2"]
+    version = index.version("a")
+    index.add_members("a", ["c3"])
+    assert index.version("a") > version  # cached session filters are rebuilt
+    assert index.delete("b") and index.version("b") is None and not index.has_members("b")
+    # c1-c3 are still a's; nothing is garbage yet
+    assert index.purge() == set()
+    assert index.delete("a")
+    assert index.purge() == {"c1", "c2", "c3"}
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    monkeypatch.setattr(rag, "TENANCY_MODE", "shared")
+    return rag.SHARED_DIR
+
+
+def sources(docs):
+    return {os.path.basename(d.metadata["source"]) for d in docs}
+
+
+def test_sessions_only_see_their_own_files_in_the_shared_store(shared):
+    from src.api.deps import tenants
+    a, b = rag.new_session_id(), rag.new_session_id()
+    for sid in (a, b):
+        tenants().create(sid)
+    rag.ingest_pdfs([SAMPLE_PDF], a)
+    rag.ingest_pdfs([SAMPLE_PDF, OTHER_PDF], b)
+    # the file both sessions uploaded is stored once
+    store = rag.load_faiss(rag.embeddings(), shared)
+    assert store.index.ntotal == len(set(tenants().member_ids(b)))
+    assert set(tenants().member_ids(a)) < set(tenants().member_ids(b))
+
+    query = "software solutions company services"
+    assert sources(rag.retrieve(query, [shared], k=8, scopes={shared: a})) == {os.path.basename(SAMPLE_PDF)}
+    assert os.path.basename(OTHER_PDF) in sources(rag.retrieve(query, [shared], k=8, scopes={shared: b}))
+
+    rag.delete_session(b)
+    assert rag.retrieve(query, [shared], k=8, scopes={shared: b}) == []
+    assert sources(rag.retrieve(query, [shared], k=8, scopes={shared: a})) == {os.path.basename(SAMPLE_PDF)}